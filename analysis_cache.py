@@ -0,0 +1,188 @@
+# Persistent cache of engine answers, keyed by position and search settings.
+# Backed by SQLite in WAL mode so several processes can share one file; the
+# least recently used entries are evicted once the cache passes its size cap.
+# Usage:
+#   python analysis_cache.py analysis_cache.sqlite3           print statistics
+#   python analysis_cache.py analysis_cache.sqlite3 --clear
+
+import argparse
+import json
+import sqlite3
+import sys
+import threading
+import time
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS analysis (
+    position TEXT NOT NULL,
+    params TEXT NOT NULL,
+    move TEXT,
+    score TEXT,
+    size INTEGER NOT NULL,
+    last_used REAL NOT NULL,
+    PRIMARY KEY (position, params)
+);
+CREATE INDEX IF NOT EXISTS analysis_last_used ON analysis (last_used);
+CREATE TABLE IF NOT EXISTS meta (
+    name TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO meta VALUES ('bytes', 0);
+"""
+
+# Rough per-row cost of the table and index b-trees on top of the text itself
+ROW_OVERHEAD = 64
+EVICT_BATCH = 64
+
+
+def position_key(fen, history=()):
+    """Key text for a position: the FEN without its fullmove number, then the
+    moves since the last capture or pawn move.
+
+    history is the game that led to fen in UCI form, when the engine was
+    given it. Only the last halfmove-clock moves can set up a repetition, so
+    earlier ones are left out and games that reach the position after
+    different captures or pawn moves still share an entry.
+    """
+    fields = fen.split()
+    key = " ".join(fields[:5])
+    halfmove = int(fields[4]) if len(fields) > 4 else 0
+    if history and halfmove:
+        key += " moves " + " ".join(history[-halfmove:])
+    return key
+
+
+def params_key(params):
+    """Canonical text for a dict of search settings such as depth or movetime."""
+    return json.dumps(params, sort_keys=True, separators=(",", ":"))
+
+
+class AnalysisCache:
+    """SQLite-backed LRU map from (position, search settings) to (best move, score)."""
+
+    def __init__(self, path, max_bytes=64 * 1024 * 1024, timeout=30.0):
+        self.path = path
+        self.max_bytes = max_bytes
+        # One connection shared by the GUI and AI worker threads
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, timeout=timeout, isolation_level=None, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        with self.lock:
+            self.db.execute("BEGIN IMMEDIATE")
+            try:
+                for statement in SCHEMA.split(";"):
+                    if statement.strip():
+                        self.db.execute(statement)
+                self.db.execute("COMMIT")
+            except Exception:
+                self.db.execute("ROLLBACK")
+                raise
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def close(self):
+        self.db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def get(self, fen, params, history=()):
+        """Return (move, score) or None. score is UCI text such as 'cp 31' or 'mate -2'.
+
+        history is the game that led to fen, as in position_key.
+        """
+        key = (position_key(fen, history), params_key(params))
+        with self.lock:
+            row = self.db.execute("SELECT move, score FROM analysis WHERE position = ? AND params = ?",
+                                  key).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.db.execute("UPDATE analysis SET last_used = ? WHERE position = ? AND params = ?",
+                            (time.time(),) + key)
+        return row
+
+    def put(self, fen, params, move, score=None, history=()):
+        position, params = position_key(fen, history), params_key(params)
+        size = ROW_OVERHEAD + len(position) + len(params) + len(move or "") + len(score or "")
+        with self.lock:
+            self.db.execute("BEGIN IMMEDIATE")
+            try:
+                row = self.db.execute("SELECT size FROM analysis WHERE position = ? AND params = ?",
+                                      (position, params)).fetchone()
+                delta = size - (row[0] if row else 0)
+                self.db.execute("INSERT OR REPLACE INTO analysis VALUES (?, ?, ?, ?, ?, ?)",
+                                (position, params, move, score, size, time.time()))
+                self.db.execute("UPDATE meta SET value = value + ? WHERE name = 'bytes'", (delta,))
+                self._evict((position, params))
+                self.db.execute("COMMIT")
+            except Exception:
+                self.db.execute("ROLLBACK")
+                raise
+
+    def _evict(self, keep):
+        """Delete least recently used rows, never keep, until the cache fits; call inside a transaction."""
+        used = self._bytes()
+        while used > self.max_bytes:
+            rows = self.db.execute("SELECT rowid, size FROM analysis WHERE NOT (position = ? AND params = ?) "
+                                   "ORDER BY last_used LIMIT ?", keep + (EVICT_BATCH,)).fetchall()
+            if not rows:
+                break
+            victims = []
+            for rowid, size in rows:
+                if used <= self.max_bytes:
+                    break
+                victims.append((rowid,))
+                used -= size
+            self.db.executemany("DELETE FROM analysis WHERE rowid = ?", victims)
+            self.db.execute("UPDATE meta SET value = ? WHERE name = 'bytes'", (used,))
+            self.evictions += len(victims)
+
+    def _bytes(self):
+        return self.db.execute("SELECT value FROM meta WHERE name = 'bytes'").fetchone()[0]
+
+    def clear(self):
+        with self.lock:
+            self.db.execute("BEGIN IMMEDIATE")
+            self.db.execute("DELETE FROM analysis")
+            self.db.execute("UPDATE meta SET value = 0 WHERE name = 'bytes'")
+            self.db.execute("COMMIT")
+
+    def stats(self):
+        with self.lock:
+            entries = self.db.execute("SELECT COUNT(*) FROM analysis").fetchone()[0]
+            used = self._bytes()
+        lookups = self.hits + self.misses
+        return {
+            "entries": entries,
+            "bytes": used,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Inspect or clear an engine analysis cache")
+    parser.add_argument("path", help="SQLite cache file")
+    parser.add_argument("--clear", action="store_true", help="delete every cached entry")
+    args = parser.parse_args(argv)
+
+    with AnalysisCache(args.path) as cache:
+        if args.clear:
+            cache.clear()
+        stats = cache.stats()
+    print(f"entries {stats['entries']}  bytes {stats['bytes']:,}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,169 @@
+# Batch analysis: stream positions from a FEN/EPD file or stdin through a pool
+# of Stockfish processes and write one JSON line per position as it finishes.
+# Only a few positions per worker are in flight at once, so memory stays flat
+# however long the input is.
+# Usage:
+#   python analyze.py positions.epd --workers 8 --movetime 200 -o results.jsonl
+#   python analyze.py positions.epd --movetime 200 -o results.jsonl --resume
+#   cat positions.fen | python analyze.py - --depth 18 > results.jsonl
+
+import argparse
+import json
+import os
+import re
+import shutil
+import sys
+from collections import namedtuple
+
+from engine import DEFAULT_PATH, StockfishAI, parse_score
+from rules import fen_to_board
+from workers import Reporter, run_pool
+
+# index is the line number in the input, which is what --resume keys on
+Position = namedtuple("Position", ["index", "fen", "id"])
+
+EPD_ID = re.compile(r'\bid\s+"([^"]*)"')
+
+
+def read_positions(lines):
+    """Yield a Position for every FEN or EPD line, skipping blanks and # comments."""
+    for index, line in enumerate(lines):
+        fields = line.split()
+        if not fields or fields[0].startswith("#"):
+            continue
+        fen = " ".join(fields[:4])
+        rest = fields[4:]
+        if len(rest) >= 2 and rest[0].isdigit() and rest[1].isdigit():
+            fen += f" {rest[0]} {rest[1]}"
+            rest = rest[2:]
+        else:
+            fen += " 0 1"
+        match = EPD_ID.search(" ".join(rest))
+        yield Position(index, fen, match.group(1) if match else None)
+
+
+def load_done(path):
+    """Return the input indexes already in a results file, dropping a torn last line."""
+    done = set()
+    if not os.path.exists(path):
+        return done
+    good = 0
+    with open(path, "rb+") as f:
+        for line in f:
+            try:
+                done.add(json.loads(line)["index"])
+            except (ValueError, KeyError):
+                break
+            good += len(line)
+        # Whatever follows the last complete record was cut off mid-write
+        f.truncate(good)
+    return done
+
+
+_engine = None
+
+
+def _init_worker(path):
+    global _engine
+    # Full strength; the level's time limits are replaced by the CLI's
+    _engine = StockfishAI(path, level="hard")
+
+
+def _analyse(position, limits):
+    """Run in a worker process: analyse one position and return its JSON record."""
+    record = {"index": position.index, "fen": position.fen}
+    if position.id is not None:
+        record["id"] = position.id
+    try:
+        board = fen_to_board(position.fen)[0]
+    except (ValueError, IndexError, KeyError):
+        record["error"] = "invalid FEN"
+        return record
+    if sum(row.count("w_king") for row in board) != 1 or sum(row.count("b_king") for row in board) != 1:
+        # Stockfish crashes on positions without exactly one king per side
+        record["error"] = "invalid position"
+        return record
+    result = _engine.analyse(position.fen, limits)
+    if result is None:
+        record["error"] = "engine failed"
+        return record
+    record.update(bestmove=result.move, score=parse_score(result.score), depth=result.depth,
+                  nodes=result.nodes, time=round(result.elapsed, 3))
+    return record
+
+
+class Progress(Reporter):
+    """Throughput counters for a batch run."""
+
+    def __init__(self, workers, out=sys.stderr):
+        super().__init__(out)
+        self.workers = workers
+        self.count = 0
+        self.errors = 0
+        self.search_time = 0.0
+
+    def update(self, record):
+        self.count += 1
+        if "error" in record:
+            self.errors += 1
+        self.search_time += record.get("time", 0.0)
+
+    def describe(self):
+        elapsed = self.elapsed()
+        rate = self.count / elapsed if elapsed > 0 else 0
+        average = self.search_time / self.count if self.count else 0
+        # Share of worker time spent searching; near 100% means the pool scales
+        busy = self.search_time / (elapsed * self.workers) if elapsed > 0 else 0
+        return (f"analysed {self.count} positions in {elapsed:.1f}s  {rate:.1f} pos/s  "
+                f"avg search {average:.3f}s  workers {self.workers} busy {busy:.0%}  errors {self.errors}")
+
+
+def run(positions, out, limits, workers, path=DEFAULT_PATH, done=frozenset(), progress=None):
+    """Analyse positions on a pool of engines, writing JSON lines to out as they finish."""
+    progress = progress or Progress(workers)
+
+    def write(record):
+        out.write(json.dumps(record) + "\n")
+        out.flush()
+
+    tasks = ((position, limits) for position in positions if position.index not in done)
+    return run_pool(_analyse, tasks, workers, write, progress, _init_worker, (path,))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Analyse FEN/EPD positions with a pool of Stockfish processes")
+    parser.add_argument("input", help="FEN or EPD file, one position per line, or - for stdin")
+    parser.add_argument("-o", "--output", help="JSONL results file (default: stdout)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="engine processes (default: cores)")
+    parser.add_argument("--depth", type=int, help="search depth per position")
+    parser.add_argument("--movetime", type=int, help="search time per position in milliseconds")
+    parser.add_argument("--nodes", type=int, help="node budget per position")
+    parser.add_argument("--engine", default=DEFAULT_PATH, help="path to the Stockfish binary")
+    parser.add_argument("--resume", action="store_true", help="skip positions already in --output and append")
+    args = parser.parse_args(argv)
+
+    if not (os.path.exists(args.engine) or shutil.which(args.engine)):
+        parser.error(f"Stockfish binary not found: {args.engine}")
+    if args.resume and not args.output:
+        parser.error("--resume needs --output")
+    limits = {"depth": args.depth, "movetime": args.movetime, "nodes": args.nodes}
+    if not any(limits.values()):
+        limits["movetime"] = 1000
+
+    done = load_done(args.output) if args.resume else frozenset()
+    source = sys.stdin if args.input == "-" else open(args.input)
+    out = open(args.output, "a" if args.resume else "w") if args.output else sys.stdout
+    try:
+        progress = run(read_positions(source), out, limits, args.workers, args.engine, done)
+    except KeyboardInterrupt:
+        return 130
+    finally:
+        if source is not sys.stdin:
+            source.close()
+        if out is not sys.stdout:
+            out.close()
+    return 1 if progress.errors else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,244 @@
+# Bitboard move generator, used as a faster backend for rules.generate_legal_moves.
+# Squares are numbered row * 8 + col to match the (row, col) tuples used by
+# rules.py, so square 0 is a8 and square 63 is h1.
+
+PIECE_KINDS = ("pawn", "knight", "bishop", "rook", "queen", "king")
+PAWN, KNIGHT, BISHOP, ROOK, QUEEN, KING = range(6)
+KIND_INDEX = {kind: i for i, kind in enumerate(PIECE_KINDS)}
+
+# Ray directions as (row step, col step)
+NORTH, SOUTH, EAST, WEST = (-1, 0), (1, 0), (0, 1), (0, -1)
+NORTH_EAST, NORTH_WEST, SOUTH_EAST, SOUTH_WEST = (-1, 1), (-1, -1), (1, 1), (1, -1)
+
+# The flag says whether squares along the ray have increasing indexes, which
+# decides whether the nearest blocker is the lowest or the highest set bit.
+ROOK_DIRECTIONS = ((NORTH, False), (SOUTH, True), (EAST, True), (WEST, False))
+BISHOP_DIRECTIONS = ((NORTH_EAST, False), (NORTH_WEST, False), (SOUTH_EAST, True), (SOUTH_WEST, True))
+
+
+def _offset_table(offsets):
+    table = []
+    for sq in range(64):
+        r, c = divmod(sq, 8)
+        bb = 0
+        for dr, dc in offsets:
+            if 0 <= r + dr < 8 and 0 <= c + dc < 8:
+                bb |= 1 << ((r + dr) * 8 + c + dc)
+        table.append(bb)
+    return table
+
+
+def _ray_table(direction):
+    dr, dc = direction
+    table = []
+    for sq in range(64):
+        r, c = divmod(sq, 8)
+        bb = 0
+        r, c = r + dr, c + dc
+        while 0 <= r < 8 and 0 <= c < 8:
+            bb |= 1 << (r * 8 + c)
+            r, c = r + dr, c + dc
+        table.append(bb)
+    return table
+
+
+KNIGHT_ATTACKS = _offset_table([(2, 1), (1, 2), (-1, 2), (-2, 1), (-2, -1), (-1, -2), (1, -2), (2, -1)])
+KING_ATTACKS = _offset_table([(1, 0), (1, 1), (0, 1), (-1, 1), (-1, 0), (-1, -1), (0, -1), (1, -1)])
+# Squares a pawn of the given colour attacks from each square
+PAWN_ATTACKS = {
+    'w': _offset_table([(-1, -1), (-1, 1)]),
+    'b': _offset_table([(1, -1), (1, 1)]),
+}
+RAYS = {
+    direction: _ray_table(direction)
+    for direction, _ in ROOK_DIRECTIONS + BISHOP_DIRECTIONS
+}
+
+
+def _sliding_attacks(sq, occupied, directions):
+    attacks = 0
+    for direction, increasing in directions:
+        ray = RAYS[direction][sq]
+        blockers = ray & occupied
+        if blockers:
+            if increasing:
+                blocker = (blockers & -blockers).bit_length() - 1
+            else:
+                blocker = blockers.bit_length() - 1
+            ray ^= RAYS[direction][blocker]
+        attacks |= ray
+    return attacks
+
+
+def rook_attacks(sq, occupied):
+    return _sliding_attacks(sq, occupied, ROOK_DIRECTIONS)
+
+
+def bishop_attacks(sq, occupied):
+    return _sliding_attacks(sq, occupied, BISHOP_DIRECTIONS)
+
+
+def iter_squares(bb):
+    """Yield the index of every set bit, lowest first."""
+    while bb:
+        low = bb & -bb
+        yield low.bit_length() - 1
+        bb ^= low
+
+
+def board_to_bitboards(board):
+    """Return {'w': [6 bitboards], 'b': [6 bitboards]} indexed by PIECE_KINDS."""
+    bbs = {'w': [0] * 6, 'b': [0] * 6}
+    sq = 0
+    for row in board:
+        for cell in row:
+            if cell:
+                bbs[cell[0]][KIND_INDEX[cell[2:]]] |= 1 << sq
+            sq += 1
+    return bbs
+
+
+def is_square_attacked(sq, color, them, occupied):
+    """Return True if the pieces in `them` attack sq; color is the defending side."""
+    if KNIGHT_ATTACKS[sq] & them[KNIGHT]:
+        return True
+    if KING_ATTACKS[sq] & them[KING]:
+        return True
+    if PAWN_ATTACKS[color][sq] & them[PAWN]:
+        return True
+    diagonal = them[BISHOP] | them[QUEEN]
+    if diagonal and bishop_attacks(sq, occupied) & diagonal:
+        return True
+    straight = them[ROOK] | them[QUEEN]
+    if straight and rook_attacks(sq, occupied) & straight:
+        return True
+    return False
+
+
+def _pseudo_targets(kind, sq, color, own, occupied, enemy, ep_bit=0):
+    """Destination bitboard for a piece ignoring checks and castling."""
+    if kind == PAWN:
+        if color == 'w':
+            step, start_row = -8, 6
+        else:
+            step, start_row = 8, 1
+        targets = PAWN_ATTACKS[color][sq] & (enemy | ep_bit)
+        one = sq + step
+        if 0 <= one < 64 and not occupied >> one & 1:
+            targets |= 1 << one
+            two = one + step
+            if sq // 8 == start_row and not occupied >> two & 1:
+                targets |= 1 << two
+        return targets
+    if kind == KNIGHT:
+        return KNIGHT_ATTACKS[sq] & ~own
+    if kind == BISHOP:
+        return bishop_attacks(sq, occupied) & ~own
+    if kind == ROOK:
+        return rook_attacks(sq, occupied) & ~own
+    if kind == QUEEN:
+        return (bishop_attacks(sq, occupied) | rook_attacks(sq, occupied)) & ~own
+    return KING_ATTACKS[sq] & ~own
+
+
+def _castle_targets(sq, color, us, them, occupied, rights):
+    """Castling destinations for a king on sq, using the same checks as rules.is_valid_move."""
+    home = 60 if color == 'w' else 4
+    if sq != home or not rights:
+        return 0
+    if is_square_attacked(sq, color, them, occupied):
+        return 0
+    targets = 0
+    without_king = occupied & ~(1 << sq)
+    if rights[color + '_kingside']:
+        path = (home + 1, home + 2)
+        if not any(occupied >> s & 1 for s in path) and not any(
+            is_square_attacked(s, color, them, without_king | 1 << s) for s in path
+        ):
+            targets |= 1 << (home + 2)
+    if rights[color + '_queenside']:
+        path = (home - 1, home - 2)
+        if not any(occupied >> s & 1 for s in (home - 1, home - 2, home - 3)) and not any(
+            is_square_attacked(s, color, them, without_king | 1 << s) for s in path
+        ):
+            targets |= 1 << (home - 2)
+    return targets
+
+
+def _union(bbs):
+    total = 0
+    for bb in bbs:
+        total |= bb
+    return total
+
+
+def _legal_targets(kind, sq, color, us, them, own, enemy, rights, ep_bit=0):
+    occupied = own | enemy
+    king = us[KING]
+    if not king:
+        return []
+    king_sq = king.bit_length() - 1
+
+    targets = _pseudo_targets(kind, sq, color, own, occupied, enemy, ep_bit)
+    if kind == KING:
+        targets |= _castle_targets(sq, color, us, them, occupied, rights)
+
+    moves = []
+    from_bit = 1 << sq
+    for to in iter_squares(targets):
+        to_bit = 1 << to
+        after = (occupied & ~from_bit) | to_bit
+        if enemy & to_bit:
+            remaining = [bb & ~to_bit for bb in them]
+        elif kind == PAWN and to_bit == ep_bit:
+            # The pawn taken en passant sits beside the moving pawn
+            victim_bit = 1 << (to + 8 if color == 'w' else to - 8)
+            after &= ~victim_bit
+            remaining = [bb & ~victim_bit for bb in them]
+        else:
+            remaining = them
+        target_king = king_sq
+        if kind == KING:
+            target_king = to
+            if abs(to - sq) == 2:
+                # Relocate the castling rook before testing the final position
+                corner, rook_to = (sq + 3, sq + 1) if to > sq else (sq - 4, sq - 1)
+                if us[ROOK] >> corner & 1:
+                    after = (after & ~(1 << corner)) | 1 << rook_to
+        if not is_square_attacked(target_king, color, remaining, after):
+            moves.append(divmod(to, 8))
+    return moves
+
+
+def _ep_bit(ep_square):
+    return 1 << (ep_square[0] * 8 + ep_square[1]) if ep_square else 0
+
+
+def generate_legal_moves(board, piece, start_pos, rights, ep_square=None):
+    """Bitboard version of rules.generate_legal_moves; returns the same (row, col) list."""
+    color = piece[0]
+    opponent = 'b' if color == 'w' else 'w'
+    bbs = board_to_bitboards(board)
+    us, them = bbs[color], bbs[opponent]
+    sr, sc = start_pos
+    return _legal_targets(KIND_INDEX[piece[2:]], sr * 8 + sc, color, us, them, _union(us), _union(them),
+                          rights, _ep_bit(ep_square))
+
+
+def generate_all_legal_moves(board, color, rights, ep_square=None):
+    """Return [(start_pos, end_pos), ...] for every legal move of color."""
+    opponent = 'b' if color == 'w' else 'w'
+    bbs = board_to_bitboards(board)
+    us, them = bbs[color], bbs[opponent]
+    own, enemy = _union(us), _union(them)
+    ep_bit = _ep_bit(ep_square)
+    moves = []
+    for sq in range(64):
+        r, c = divmod(sq, 8)
+        piece = board[r][c]
+        if piece and piece[0] == color:
+            start = (r, c)
+            for end in _legal_targets(KIND_INDEX[piece[2:]], sq, color, us, them, own, enemy, rights, ep_bit):
+                moves.append((start, end))
+    return moves
+
@@ -0,0 +1,259 @@
+# Stockfish wrapper shared by the GUI and the command-line tools. One
+# StockfishAI owns one long-lived engine process and restarts it if it dies.
+
+import threading
+import time
+from collections import namedtuple
+
+from stockfish import Stockfish
+
+from rules import START_FEN
+
+DEFAULT_PATH = "stockfish/stockfish-windows-x86-64-avx2.exe"
+
+# score is UCI text such as "cp 31" or "mate -2"; elapsed is in seconds;
+# ponder is the reply Stockfish expects to move, or None
+Analysis = namedtuple("Analysis", ["move", "score", "depth", "nodes", "elapsed", "ponder"])
+
+
+def go_command(limits, ponder=False):
+    """UCI go command for a dict that may hold depth, nodes and movetime."""
+    command = "go ponder" if ponder else "go"
+    for limit in ("depth", "nodes", "movetime"):
+        if limits.get(limit):
+            command += f" {limit} {limits[limit]}"
+    return command
+
+
+def position_command(fen, moves=None, start_fen=None):
+    """UCI position command for fen, or for the game moves played from start_fen.
+
+    With moves, fen is not sent; start_fen defaults to the standard start
+    position, which is sent as startpos.
+    """
+    if moves is None:
+        return f"position fen {fen}"
+    base = "position startpos" if start_fen in (None, START_FEN) else f"position fen {start_fen}"
+    return f"{base} moves {' '.join(moves)}" if moves else base
+
+
+def parse_score(score):
+    """Turn UCI score text into {"cp": n} or {"mate": n}; None stays None."""
+    if not score:
+        return None
+    kind, value = score.split()
+    return {kind: int(value)}
+
+
+class StockfishAI:
+    """Long-lived Stockfish process shared by every game, with difficulty presets."""
+
+    # movetime is the budget per move in milliseconds; nodes and depth are
+    # optional extra limits. The engine stops at whichever limit comes first.
+    LEVELS = {
+        "easy": {"movetime": 100, "depth": 4, "skill": 5},
+        "medium": {"movetime": 300, "depth": 8, "skill": 10},
+        "hard": {"movetime": 1000, "skill": 20},
+    }
+
+    def __init__(self, path=DEFAULT_PATH, level="easy", cache=None, ponder=False):
+        self.path = path
+        self.level = level
+        self.cache = cache
+        self.ponder_enabled = ponder
+        self.engine = None
+        self.stopped = False
+        # Position command of the running ponder search, and the (move, reply)
+        # pair from the last search, which is what the next ponder guesses
+        self.pondering = None
+        self.expected = None
+        # Serialises engine I/O between the AI worker thread and the main loop
+        self.lock = threading.Lock()
+        self.available = self._start()
+
+    def _start(self):
+        """Spawn the engine and apply the current level; return True on success."""
+        self.pondering = None
+        try:
+            self.engine = Stockfish(path=self.path)
+            if self.ponder_enabled:
+                self.engine.update_engine_parameters({"Ponder": True})
+            self._configure()
+        except Exception:
+            # No Stockfish binary here; analyse and best_move return None
+            self.engine = None
+        return self.engine is not None
+
+    def _configure(self):
+        params = self.LEVELS.get(self.level, self.LEVELS["easy"])
+        self.engine.set_skill_level(params["skill"])
+
+    def _search(self, limits):
+        """Run one search on the current position and return an Analysis."""
+        # python-stockfish cannot combine limits in one go command, so talk UCI directly
+        started = time.perf_counter()
+        self.engine._put(go_command(limits))
+        return self._result(started)
+
+    def _result(self, started):
+        """Read search output up to bestmove and return an Analysis."""
+        score = None
+        depth = nodes = 0
+        while True:
+            line = self._read()
+            fields = line.split()
+            if fields[0] == "info" and fields[1:2] == ["depth"]:
+                depth = int(fields[2])
+                if "score" in fields:
+                    i = fields.index("score")
+                    score = " ".join(fields[i + 1:i + 3])
+                if "nodes" in fields:
+                    nodes = int(fields[fields.index("nodes") + 1])
+            elif fields[0] == "bestmove":
+                move = None if fields[1] == "(none)" else fields[1]
+                ponder = fields[3] if fields[2:3] == ["ponder"] else None
+                return Analysis(move, score, depth, nodes, time.perf_counter() - started, ponder)
+
+    def _read(self):
+        line = self.engine._read_line()
+        if not line:
+            # Stockfish prints no blank lines while searching, so the pipe has closed
+            raise BrokenPipeError("Stockfish closed its output")
+        return line
+
+    def _restart(self):
+        """Replace a crashed engine process."""
+        self.close()
+        print("stockfish: engine stopped responding, restarting")
+        return self._start()
+
+    def new_game(self, level):
+        """Reset the engine between games, reconfiguring it if the level changed."""
+        if not self.available:
+            return
+        with self.lock:
+            try:
+                if self.engine is None:
+                    self._start()
+                self._end_ponder()
+                if level != self.level:
+                    self.level = level
+                    self._configure()
+                self.engine.send_ucinewgame_command()
+            except Exception:
+                self.level = level
+                self._restart()
+
+    def analyse(self, fen, limits=None, moves=None, start_fen=None):
+        """Search fen with limits (default: the level's) and return an Analysis, or None.
+
+        When moves (UCI, from start_fen) are given the engine is sent the game
+        instead of fen, so it can see repetitions and the fifty-move count.
+        """
+        if not self.available:
+            return None
+        if limits is None:
+            limits = self.LEVELS.get(self.level, self.LEVELS["easy"])
+        command = position_command(fen, moves, start_fen)
+        with self.lock:
+            self.stopped = False
+            self.expected = None
+            # One retry on a fresh process if the engine has died
+            for _ in range(2):
+                if self.engine is None and not self._start():
+                    return None
+                try:
+                    result = self._end_ponder(command)
+                    if result is None:
+                        # Setting the position keeps the hash table; only ucinewgame clears it
+                        self.engine._put(command)
+                        result = self._search(limits)
+                    self.expected = (result.move, result.ponder)
+                    return result
+                except Exception:
+                    self._restart()
+        return None
+
+    def ponder(self, moves, start_fen=None):
+        """Think on the opponent's time about the reply expected to our last move.
+
+        moves is the game so far, ending with the move best_move just
+        returned. Any earlier ponder search is stopped first. Returns True if
+        a ponder search was started; the next analyse or best_move on the
+        guessed position picks it up with ponderhit.
+        """
+        if not self.available:
+            return False
+        with self.lock:
+            if self.engine is None:
+                return False
+            try:
+                self._end_ponder()
+                if not (self.ponder_enabled and moves and self.expected and self.expected[1]):
+                    return False
+                if moves[-1] != self.expected[0]:
+                    return False
+                self.pondering = position_command(None, list(moves) + [self.expected[1]], start_fen)
+                self.engine._put(self.pondering)
+                self.engine._put(go_command(self.LEVELS.get(self.level, self.LEVELS["easy"]), ponder=True))
+            except Exception:
+                self._restart()
+                return False
+        return True
+
+    def _end_ponder(self, command=None):
+        """Finish any ponder search; return its Analysis if command is the position it guessed.
+
+        On a hit the engine gets ponderhit and finishes the search it already
+        started, with its time limit counted from the original go. Otherwise
+        the search is stopped and its result dropped.
+        """
+        if self.pondering is None:
+            return None
+        hit = command == self.pondering
+        self.pondering = None
+        started = time.perf_counter()
+        self.engine._put("ponderhit" if hit else "stop")
+        result = self._result(started)
+        return result if hit else None
+
+    def best_move(self, fen, moves=None, start_fen=None):
+        """Best move in UCI form for fen, the current position, or None; see analyse."""
+        if not self.available:
+            return None
+        params = self.LEVELS.get(self.level, self.LEVELS["easy"])
+        if self.cache:
+            cached = self.cache.get(fen, params, moves or ())
+            if cached:
+                # No reply to guess, so the next ponder call only stops any running one
+                self.expected = None
+                return cached[0]
+        result = self.analyse(fen, params, moves, start_fen)
+        if result is None:
+            return None
+        # A search cut short by stop() is not worth remembering
+        if self.cache and result.move and not self.stopped:
+            self.cache.put(fen, params, result.move, result.score, moves or ())
+        return result.move
+
+    def stop(self):
+        """Ask a search running on another thread to return early."""
+        self.stopped = True
+        engine = self.engine
+        if engine is None:
+            return
+        try:
+            # python-stockfish has no public stop, so send the UCI command directly
+            engine._put("stop")
+        except Exception:
+            pass
+
+    def close(self):
+        """Quit the engine process."""
+        engine, self.engine = self.engine, None
+        if engine is None:
+            return
+        try:
+            engine.send_quit_command()
+        except Exception:
+            pass
@@ -0,0 +1,291 @@
+# Batch featurization for dataset work. Many boards or FENs are packed into
+# one (N, 64) int8 array of piece codes, and material, piece-square scores,
+# attacked squares and mobility are computed with NumPy over the whole batch
+# at once, using one 64-bit bitboard per piece type and position.
+# Needs NumPy; nothing else in the project imports this module.
+# Usage:
+#   python features.py positions.epd -o features.npz
+#   python features.py positions.epd -o features.npz --planes
+
+import argparse
+import sys
+import time
+from collections import namedtuple
+
+import numpy as np
+
+from bitboard import BISHOP_DIRECTIONS, PIECE_KINDS, ROOK_DIRECTIONS
+from position import PIECE_CODES, Position
+from rules import FEN_PIECES
+from search import PIECE_SQUARE_SCORES, PIECE_VALUES
+
+# Square codes are position.PIECE_CODES: 0 empty, 1-6 White pawn..king, 7-12
+# Black pawn..king. Plane i of planes() holds code i + 1.
+WHITE, BLACK = 0, 1
+
+# Positions handled per pass, so temporary arrays stay small
+CHUNK_SIZE = 65536
+
+# FEN placement bytes: the square code each one stands for and how many
+# squares it covers. Digits are runs of empty squares, '.' is one empty square
+# (used for boards) and '/' covers none.
+LETTERS = {"": ".", **FEN_PIECES}
+BYTE_CODES = np.full(256, -1, dtype=np.int8)
+BYTE_WIDTHS = np.zeros(256, dtype=np.int64)
+for _byte, _width in [(".", 1), ("/", 0)] + [(str(n), n) for n in range(1, 9)]:
+    BYTE_CODES[ord(_byte)] = 0
+    BYTE_WIDTHS[ord(_byte)] = _width
+for _piece, _letter in FEN_PIECES.items():
+    BYTE_CODES[ord(_letter)] = PIECE_CODES[_piece]
+    BYTE_WIDTHS[ord(_letter)] = 1
+
+# Indexed by square code; White positive
+MATERIAL = np.array([0] + [PIECE_VALUES[kind] for kind in PIECE_KINDS]
+                    + [-PIECE_VALUES[kind] for kind in PIECE_KINDS], dtype=np.int32)
+# Indexed by [code, square]; the same placement bonuses search.evaluate uses
+PLACEMENT = np.zeros((13, 64), dtype=np.int32)
+for _piece, _code in PIECE_CODES.items():
+    if _piece:
+        PLACEMENT[_code] = np.array(PIECE_SQUARE_SCORES[_piece]) - MATERIAL[_code]
+SQUARES = np.arange(64)
+
+# Shifts are done on bitboards with bit row * 8 + col; these masks clear the
+# columns a shift of dc columns would wrap onto
+COLUMN_MASKS = {}
+for _dc in range(-2, 3):
+    _mask = 0
+    for _sq in range(64):
+        if 0 <= _sq % 8 - _dc < 8:
+            _mask |= 1 << _sq
+    COLUMN_MASKS[_dc] = np.uint64(_mask)
+# Pawns that have not moved, and the rank a double push passes through
+PAWN_FORWARD = {WHITE: -1, BLACK: 1}
+PAWN_SKIP_RANK = {WHITE: np.uint64(0xFF << 40), BLACK: np.uint64(0xFF << 16)}
+
+KNIGHT_STEPS = ((2, 1), (1, 2), (-1, 2), (-2, 1), (-2, -1), (-1, -2), (1, -2), (2, -1))
+KING_STEPS = ((1, 0), (1, 1), (0, 1), (-1, 1), (-1, 0), (-1, -1), (0, -1), (1, -1))
+ROOK_STEPS = tuple(direction for direction, _ in ROOK_DIRECTIONS)
+BISHOP_STEPS = tuple(direction for direction, _ in BISHOP_DIRECTIONS)
+
+Features = namedtuple("Features", ["squares", "material", "placement", "attacks", "mobility"])
+
+
+def _placement(position):
+    """FEN piece placement for a FEN, or eight ranks of '.' and piece letters for a board."""
+    if isinstance(position, str):
+        return position.split(" ", 1)[0]
+    return "/".join("".join(map(LETTERS.__getitem__, row)) for row in position)
+
+
+def encode(positions):
+    """(N, 64) int8 square codes for a sequence of FENs, boards or Positions."""
+    if positions and all(isinstance(position, Position) for position in positions):
+        # Position squares already hold these codes
+        data = b"".join([position.squares for position in positions])
+        return np.frombuffer(data, dtype=np.int8).reshape(len(positions), 64).copy()
+    placements = [_placement(position) for position in positions]
+    if not placements:
+        return np.zeros((0, 64), dtype=np.int8)
+    lengths = np.array([len(placement) for placement in placements])
+    if not lengths.all():
+        raise ValueError(f"position {int(np.argmin(lengths))} is empty")
+    ends = np.cumsum(lengths)
+    starts = ends - lengths
+    data = np.frombuffer("".join(placements).encode("ascii", "replace"), dtype=np.uint8)
+    codes, widths = BYTE_CODES[data], BYTE_WIDTHS[data]
+    if (codes < 0).any():
+        bad = int(np.searchsorted(ends, np.argmax(codes < 0), "right"))
+        raise ValueError(f"position {bad} has an unknown piece")
+    # Check every rank rather than the total, so a short rank in one position
+    # cannot be made up by a long one elsewhere
+    separators = data == ord("/")
+    bad = np.flatnonzero((np.add.reduceat(separators, starts) != 7) | separators[starts])
+    if bad.size:
+        raise ValueError(f"position {bad[0]} does not have 8 ranks")
+    # Each placement now splits into exactly 8 ranks: one from its start and
+    # one after each '/'
+    rank_starts = separators.copy()
+    rank_starts[starts] = True
+    rank_widths = np.bincount(np.cumsum(rank_starts) - 1, weights=widths)
+    bad = np.flatnonzero(rank_widths != 8)
+    if bad.size:
+        raise ValueError(f"position {bad[0] // 8} has a rank without 8 squares")
+    # Every run of empty squares becomes that many zeros
+    return np.repeat(codes, widths).reshape(len(placements), 64)
+
+
+def planes(squares):
+    """(N, 12, 8, 8) int8 one-hot planes, White pawn..king then Black."""
+    squares = np.asarray(squares)
+    codes = np.arange(1, 13, dtype=np.int8)
+    return (squares[:, None, :] == codes[None, :, None]).view(np.int8).reshape(len(squares), 12, 8, 8)
+
+
+def bitboards(squares):
+    """(N, 13) uint64 bitboards, one per square code; column 0 holds empty squares."""
+    squares = np.asarray(squares)
+    onehot = squares[:, None, :] == np.arange(13, dtype=np.int8)[None, :, None]
+    return np.packbits(onehot, axis=2, bitorder="little").view("<u8")[:, :, 0].astype(np.uint64)
+
+
+def material(squares):
+    """Material balance in centipawns, White minus Black."""
+    return MATERIAL[np.asarray(squares)].sum(axis=1, dtype=np.int32)
+
+
+def placement(squares):
+    """Piece-square-table bonus in centipawns, White minus Black.
+
+    material() + placement() equals search.evaluate for every board.
+    """
+    return PLACEMENT[np.asarray(squares), SQUARES].sum(axis=1, dtype=np.int32)
+
+
+if hasattr(np, "bitwise_count"):
+    popcount = np.bitwise_count
+else:
+    # NumPy before 2.0 has no bitwise_count; add up the bits of each byte
+    BYTE_BITS = np.array([bin(byte).count("1") for byte in range(256)], dtype=np.uint8)
+
+    def popcount(bb):
+        bb = np.ascontiguousarray(bb, dtype=np.uint64)
+        return BYTE_BITS[bb.view(np.uint8)].reshape(bb.shape + (8,)).sum(axis=-1, dtype=np.uint8)
+
+
+def _shift(bb, dr, dc):
+    """Move every bit dr rows and dc columns, dropping bits that leave the board."""
+    delta = dr * 8 + dc
+    moved = bb << np.uint64(delta) if delta > 0 else bb >> np.uint64(-delta)
+    return moved & COLUMN_MASKS[dc]
+
+
+def _side(boards, color):
+    """Attacked squares and pseudo-legal move count for one colour."""
+    base = 1 + 6 * color
+    pawns, knights, bishops, rooks, queens, king = (boards[:, base + i] for i in range(6))
+    own = np.bitwise_or.reduce(boards[:, base:base + 6], axis=1)
+    empty = boards[:, 0]
+    enemy = ~(own | empty)
+    attacks = np.zeros(len(boards), dtype=np.uint64)
+    mobility = np.zeros(len(boards), dtype=np.int32)
+
+    def count(targets):
+        mobility[:] += popcount(targets)
+
+    forward = PAWN_FORWARD[color]
+    for dc in (-1, 1):
+        hits = _shift(pawns, forward, dc)
+        attacks |= hits
+        count(hits & enemy)
+    pushes = _shift(pawns, forward, 0) & empty
+    count(pushes)
+    count(_shift(pushes & PAWN_SKIP_RANK[color], forward, 0) & empty)
+
+    for pieces, steps in ((knights, KNIGHT_STEPS), (king, KING_STEPS)):
+        for dr, dc in steps:
+            hits = _shift(pieces, dr, dc)
+            attacks |= hits
+            count(hits & ~own)
+
+    for pieces, steps in ((bishops | queens, BISHOP_STEPS), (rooks | queens, ROOK_STEPS)):
+        for dr, dc in steps:
+            # Each step moves every ray one square further; rays stop after
+            # the first occupied square
+            ray = pieces
+            for _ in range(7):
+                ray = _shift(ray, dr, dc)
+                if not ray.any():
+                    break
+                attacks |= ray
+                count(ray & ~own)
+                ray &= empty
+    return attacks, mobility
+
+
+def unpack(bb):
+    """(..., 64) bool squares for an array of uint64 bitboards."""
+    bb = np.asarray(bb, dtype="<u8")
+    data = np.ascontiguousarray(bb).reshape(-1).view(np.uint8).reshape(-1, 8)
+    return np.unpackbits(data, axis=1, bitorder="little").astype(bool).reshape(bb.shape + (64,))
+
+
+def attacks_and_mobility(squares):
+    """(N, 2) uint64 attacked-square bitboards and (N, 2) int32 move counts.
+
+    Column 0 is White, column 1 Black. Mobility counts pseudo-legal moves:
+    pins and checks are ignored, promotions count once and castling and en
+    passant are left out.
+    """
+    boards = bitboards(squares)
+    white, black = _side(boards, WHITE), _side(boards, BLACK)
+    return np.stack([white[0], black[0]], axis=1), np.stack([white[1], black[1]], axis=1)
+
+
+def attack_maps(squares):
+    """(N, 2, 8, 8) int8 maps of the squares each side attacks."""
+    attacks, _ = attacks_and_mobility(squares)
+    return unpack(attacks).view(np.int8).reshape(len(attacks), 2, 8, 8)
+
+
+def featurize(positions, chunk_size=CHUNK_SIZE):
+    """Features for a sequence of FENs, boards or Positions, computed chunk by chunk.
+
+    attacks is (N, 2) uint64 bitboards; unpack() turns it into squares.
+    """
+    parts = []
+    for start in range(0, len(positions), chunk_size):
+        squares = encode(positions[start:start + chunk_size])
+        attacks, mobility = attacks_and_mobility(squares)
+        parts.append(Features(squares, material(squares), placement(squares), attacks, mobility))
+    if not parts:
+        return Features(np.zeros((0, 64), np.int8), np.zeros(0, np.int32), np.zeros(0, np.int32),
+                        np.zeros((0, 2), np.uint64), np.zeros((0, 2), np.int32))
+    return Features(*(np.concatenate(column) for column in zip(*parts)))
+
+
+def read_fens(lines):
+    """Lines of a FEN or EPD file, skipping blanks and # comments."""
+    fens = []
+    for line in lines:
+        line = line.strip()
+        if line and not line.startswith("#"):
+            fens.append(line)
+    return fens
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Featurize FEN/EPD positions into NumPy arrays")
+    parser.add_argument("input", help="FEN or EPD file, one position per line, or - for stdin")
+    parser.add_argument("-o", "--output", help="write the arrays to this .npz file")
+    parser.add_argument("--planes", action="store_true", help="also store (N, 12, 8, 8) piece planes")
+    args = parser.parse_args(argv)
+
+    source = sys.stdin if args.input == "-" else open(args.input)
+    try:
+        fens = read_fens(source)
+    finally:
+        if source is not sys.stdin:
+            source.close()
+
+    started = time.perf_counter()
+    try:
+        features = featurize(fens)
+    except ValueError as e:
+        parser.error(str(e))
+    elapsed = time.perf_counter() - started
+    rate = len(fens) / elapsed if elapsed > 0 else 0
+    print(f"{len(fens)} positions in {elapsed:.2f}s  {rate:,.0f} positions/s", file=sys.stderr)
+
+    if args.output:
+        arrays = features._asdict()
+        if args.planes:
+            arrays["planes"] = planes(features.squares)
+        np.savez(args.output, **arrays)
+    else:
+        for name, values in zip(Features._fields, features):
+            print(f"{name:<10}{str(values.shape):<14}{values.dtype}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,275 @@
+# Compact binary game records. Each move is 16 bits (from square, to square
+# and promotion piece) and each game carries a short header with the result,
+# the starting FEN and who played. Files are append-only; readers memory-map
+# them and decode games lazily, and an offset index gives random access.
+# Usage:
+#   python gamefile.py games.bin                         summary of a game file
+#   python gamefile.py games.bin --game 42               moves of one game
+#   python gamefile.py games.bin --import games.jsonl    append selfplay.py output
+
+import argparse
+import json
+import mmap
+import os
+import struct
+import sys
+import time
+import zlib
+from array import array
+from collections import namedtuple
+
+from rules import START_FEN, to_uci_move
+
+MAGIC = b"CHGAMES1"
+
+# Record: u32 length of the rest, u8 result, then three u8-length-prefixed
+# strings (start FEN, white, black) and the moves as little-endian u16
+RECORD_SIZE = struct.Struct("<I")
+RESULTS = ("*", "1-0", "0-1", "1/2-1/2")
+RESULT_CODES = {result: code for code, result in enumerate(RESULTS)}
+
+# Move bits: from square (6), to square (6), promotion (3); squares are
+# row * 8 + col with row 0 the 8th rank, as everywhere else in the project
+PROMOTION_CODES = {"n": 1, "b": 2, "r": 3, "q": 4}
+PROMOTION_PIECES = {code: letter for letter, code in PROMOTION_CODES.items()}
+
+# Index sidecar: u64 bytes of the game file covered, u64 CRC-32 of those
+# bytes, then u64 record offsets
+INDEX_SUFFIX = ".idx"
+
+Game = namedtuple("Game", ["result", "fen", "white", "black", "moves"])
+
+
+def _decode_table():
+    table = [None] * (5 << 12)
+    for code in range(len(table)):
+        start, end, promotion = code & 63, code >> 6 & 63, code >> 12
+        table[code] = to_uci_move(divmod(start, 8), divmod(end, 8), PROMOTION_PIECES.get(promotion))
+    return table
+
+
+# Every possible code converted once, so encoding and decoding a game is one
+# lookup per move
+UCI_MOVES = _decode_table()
+MOVE_CODES = {move: code for code, move in enumerate(UCI_MOVES)}
+
+
+def encode_move(move):
+    """16-bit code for a UCI move such as 'e2e4' or 'e7e8q'."""
+    return MOVE_CODES[move]
+
+
+def decode_move(code):
+    return UCI_MOVES[code]
+
+
+def game_from_record(record):
+    """Game for one selfplay.py JSON record."""
+    return Game(record["result"], record.get("fen") or START_FEN, record.get("white") or "",
+                record.get("black") or "", record["moves"])
+
+
+def _pack_text(text):
+    data = text.encode()
+    if len(data) > 255:
+        raise ValueError(f"header field longer than 255 bytes: {text[:40]}...")
+    return bytes((len(data),)) + data
+
+
+def encode_game(game):
+    """Bytes for one record, including its length prefix."""
+    # An empty FEN stands for the standard starting position
+    fen = "" if game.fen in (None, START_FEN) else game.fen
+    moves = array("H", map(MOVE_CODES.__getitem__, game.moves))
+    if sys.byteorder == "big":
+        moves.byteswap()
+    body = (bytes((RESULT_CODES[game.result],)) + _pack_text(fen) + _pack_text(game.white or "")
+            + _pack_text(game.black or "") + moves.tobytes())
+    return RECORD_SIZE.pack(len(body)) + body
+
+
+def decode_game(data, offset=0):
+    """Decode the record starting at offset in a bytes-like object."""
+    size, = RECORD_SIZE.unpack_from(data, offset)
+    pos = offset + RECORD_SIZE.size
+    end = pos + size
+    result = RESULTS[data[pos]]
+    pos += 1
+    fields = []
+    for _ in range(3):
+        length = data[pos]
+        fields.append(bytes(data[pos + 1:pos + 1 + length]).decode())
+        pos += 1 + length
+    codes = array("H", data[pos:end])
+    if sys.byteorder == "big":
+        codes.byteswap()
+    fen, white, black = fields
+    return Game(result, fen or START_FEN, white, black, [UCI_MOVES[code] for code in codes])
+
+
+def _scan(data, offset, limit):
+    """Yield the offset of every complete record from offset up to limit."""
+    while offset + RECORD_SIZE.size <= limit:
+        size, = RECORD_SIZE.unpack_from(data, offset)
+        if offset + RECORD_SIZE.size + size > limit:
+            # Torn record from an interrupted write
+            break
+        yield offset
+        offset += RECORD_SIZE.size + size
+
+
+class GameWriter:
+    """Appends games to a file, creating it if needed."""
+
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, "ab+")
+        self.file.seek(0)
+        magic = self.file.read(len(MAGIC))
+        if not magic:
+            self.file.write(MAGIC)
+        elif magic != MAGIC:
+            self.file.close()
+            raise ValueError(f"{path} is not a game file")
+        else:
+            self._drop_torn_record()
+        self.file.seek(0, os.SEEK_END)
+        self.count = 0
+
+    def _drop_torn_record(self):
+        """Cut off a record left half-written by a crash, so new games stay readable."""
+        size = os.fstat(self.file.fileno()).st_size
+        with mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            end = len(MAGIC)
+            for offset in _scan(data, len(MAGIC), size):
+                end = offset + RECORD_SIZE.size + RECORD_SIZE.unpack_from(data, offset)[0]
+        if end < size:
+            self.file.truncate(end)
+
+    def write(self, game):
+        """Append a Game and return the offset of its record."""
+        offset = self.file.tell()
+        self.file.write(encode_game(game))
+        self.count += 1
+        return offset
+
+    def flush(self):
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class GameReader:
+    """Memory-mapped game file. Iterate to stream games, or index like a list."""
+
+    def __init__(self, path, use_index=True):
+        self.path = path
+        self.use_index = use_index
+        self.file = open(path, "rb")
+        self.size = os.fstat(self.file.fileno()).st_size
+        # mmap cannot map an empty file
+        self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ) if self.size else b""
+        if self.data[:len(MAGIC)] != MAGIC:
+            self.close()
+            raise ValueError(f"{path} is not a game file")
+        self._offsets = None
+
+    def close(self):
+        if isinstance(self.data, mmap.mmap):
+            self.data.close()
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __iter__(self):
+        for offset in _scan(self.data, len(MAGIC), self.size):
+            yield decode_game(self.data, offset)
+
+    @property
+    def offsets(self):
+        """Record offsets, loaded from the .idx sidecar and extended past its end."""
+        if self._offsets is None:
+            self._offsets = self._load_index()
+        return self._offsets
+
+    def _crc(self, start, end, crc=0):
+        """CRC-32 of bytes start:end of the file, continuing from crc."""
+        with memoryview(self.data) as view, view[start:end] as part:
+            return zlib.crc32(part, crc)
+
+    def _load_index(self):
+        offsets = array("Q")
+        covered = len(MAGIC)
+        crc = self._crc(0, covered)
+        index_path = self.path + INDEX_SUFFIX
+        if self.use_index and os.path.exists(index_path):
+            with open(index_path, "rb") as f:
+                stored = array("Q", f.read())
+            # Stale if the file was recreated or truncated since, or if the
+            # index belongs to another file: then it is rebuilt from scratch
+            if len(stored) >= 2 and stored[0] <= self.size and stored[1] == self._crc(0, stored[0]):
+                covered, crc = stored[:2]
+                offsets = stored[2:]
+        start = len(offsets)
+        offsets.extend(_scan(self.data, covered, self.size))
+        if self.use_index and len(offsets) > start:
+            last = offsets[-1]
+            end = last + RECORD_SIZE.size + RECORD_SIZE.unpack_from(self.data, last)[0]
+            try:
+                with open(index_path, "wb") as f:
+                    f.write(array("Q", [end, self._crc(covered, end, crc)]).tobytes() + offsets.tobytes())
+            except OSError:
+                pass
+        return offsets
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def __getitem__(self, index):
+        return decode_game(self.data, self.offsets[index])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Inspect or fill a binary game file")
+    parser.add_argument("path", help="game file")
+    parser.add_argument("--game", type=int, help="print the moves of one game")
+    parser.add_argument("--import", dest="source", help="append games from a selfplay.py JSONL file")
+    args = parser.parse_args(argv)
+
+    if args.source:
+        with open(args.source) as f, GameWriter(args.path) as writer:
+            for line in f:
+                writer.write(game_from_record(json.loads(line)))
+        print(f"imported {writer.count} games")
+
+    with GameReader(args.path) as reader:
+        if args.game is not None:
+            game = reader[args.game]
+            print(f"{game.white} vs {game.black}  {game.result}  {game.fen}")
+            print(" ".join(game.moves))
+            return 0
+        started = time.perf_counter()
+        games = plies = 0
+        for game in reader:
+            games += 1
+            plies += len(game.moves)
+        elapsed = time.perf_counter() - started
+    rate = games / elapsed if elapsed > 0 else 0
+    print(f"{games} games  {plies} plies  {reader.size:,} bytes  "
+          f"{reader.size / games if games else 0:.1f} bytes/game  read {elapsed:.2f}s  {rate:,.0f} games/s")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
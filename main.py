@@ -2,9 +2,32 @@
 # June, 13, 2025 
 # Please read the README.md
 
+import logging
+import os
+import threading
+import time
+from collections import deque
+
 import pygame
-import random
-from stockfish import Stockfish
+
+from rules import (
+    initial_board,
+    castle_rights,
+    game_state,
+    new_castle_rights,
+    new_game_state,
+    attack_map,
+    board_to_fen,
+    parse_uci_move,
+    make_move,
+    undo_to_uci,
+)
+from zobrist import compute_hash, hash_after_move, lookup_position
+from book import OpeningBook
+from analysis_cache import AnalysisCache
+from engine import StockfishAI
+from profiler import percentile, profiler
+import search
 
 # Initialize Pygame
 pygame.init()
@@ -14,40 +37,67 @@ width, height = 600, 600
 screen = pygame.display.set_mode((width, height))
 pygame.display.set_caption("Chess Game")
 
+# Frame rate cap and the event used to deliver AI moves from the worker thread
+FPS = 60
+# How long an idle game loop sleeps waiting for input, in milliseconds
+IDLE_WAIT_MS = 100
+# How long a piece takes to slide to its new square, in milliseconds
+ANIMATION_MS = 240
+AI_MOVE_EVENT = pygame.USEREVENT + 1
+
+# Optional Polyglot opening book and how many plies into the game it is used
+BOOK_PATH = "books/book.bin"
+BOOK_MAX_PLY = 20
+
+# Engine answers are remembered across games and sessions in this file
+ANALYSIS_CACHE_PATH = "analysis_cache.sqlite3"
+# Let Stockfish think about its expected reply during the player's turn
+PONDER = True
+
+# F3 (or CHESS_PROFILE=1 at startup) turns on profiling and its overlay; while
+# it is on the numbers are also written to PROFILE_PATH every few seconds
+PROFILE_PATH = "profile.json"
+PROFILE_DUMP_SECONDS = 5.0
+HUD_REFRESH_MS = 500
+
+# Recent AI response times in seconds for each difficulty level
+LATENCY_HISTORY = 200
+move_latencies = {}
+
+# AI timings, search reports and failures; CHESS_DEBUG=1 prints them
+log = logging.getLogger("chess")
+
 # Define colors
 light_square = (240, 217, 181)
 dark_square = (181, 136, 99)
 popup_bg = (255, 255, 255)
 
+# Translucent fills drawn over squares
+HIGHLIGHTS = {
+    "last_move": (255, 255, 0, 80),
+    "selected": (255, 255, 0, 120),
+    "legal": (255, 255, 255, 100),
+    "check": (255, 0, 0, 100),
+}
+
 # Load images
 pieces = {
-    "b_pawn": pygame.image.load("assets/b_pawn.png"),
-    "b_rook": pygame.image.load("assets/b_rook.png"),
-    "b_knight": pygame.image.load("assets/b_knight.png"),
-    "b_bishop": pygame.image.load("assets/b_bishop.png"),
-    "b_queen": pygame.image.load("assets/b_queen.png"),
-    "b_king": pygame.image.load("assets/b_king.png"),
-    "w_pawn": pygame.image.load("assets/w_pawn.png"),
-    "w_rook": pygame.image.load("assets/w_rook.png"),
-    "w_knight": pygame.image.load("assets/w_knight.png"),
-    "w_bishop": pygame.image.load("assets/w_bishop.png"),
-    "w_queen": pygame.image.load("assets/w_queen.png"),
-    "w_king": pygame.image.load("assets/w_king.png"),
+    "b_pawn": pygame.image.load("assets/b_pawn.png").convert_alpha(),
+    "b_rook": pygame.image.load("assets/b_rook.png").convert_alpha(),
+    "b_knight": pygame.image.load("assets/b_knight.png").convert_alpha(),
+    "b_bishop": pygame.image.load("assets/b_bishop.png").convert_alpha(),
+    "b_queen": pygame.image.load("assets/b_queen.png").convert_alpha(),
+    "b_king": pygame.image.load("assets/b_king.png").convert_alpha(),
+    "w_pawn": pygame.image.load("assets/w_pawn.png").convert_alpha(),
+    "w_rook": pygame.image.load("assets/w_rook.png").convert_alpha(),
+    "w_knight": pygame.image.load("assets/w_knight.png").convert_alpha(),
+    "w_bishop": pygame.image.load("assets/w_bishop.png").convert_alpha(),
+    "w_queen": pygame.image.load("assets/w_queen.png").convert_alpha(),
+    "w_king": pygame.image.load("assets/w_king.png").convert_alpha(),
 }
 
-# Initialize board template
-initial_board = [
-    ["b_rook", "b_knight", "b_bishop", "b_queen", "b_king", "b_bishop", "b_knight", "b_rook"],
-    ["b_pawn", "b_pawn", "b_pawn", "b_pawn", "b_pawn", "b_pawn", "b_pawn", "b_pawn"],
-    ["", "", "", "", "", "", "", ""],
-    ["", "", "", "", "", "", "", ""],
-    ["", "", "", "", "", "", "", ""],
-    ["", "", "", "", "", "", "", ""],
-    ["w_pawn", "w_pawn", "w_pawn", "w_pawn", "w_pawn", "w_pawn", "w_pawn", "w_pawn"],
-    ["w_rook", "w_knight", "w_bishop", "w_queen", "w_king", "w_bishop", "w_knight", "w_rook"]
-]
-
 starting_board = [row[:] for row in initial_board]
+position_hash = compute_hash(starting_board, 'w', castle_rights)
 
 selected_piece = None
 selected_pos = None
@@ -56,7 +106,77 @@ turn = 'w'
 legal_moves = []
 game_over = False
 last_move = None
+# Undo records for every move played this game, oldest first
+move_stack = []
+# The same moves as UCI text, sent to Stockfish as "position startpos moves ..."
+move_history = []
+# Pieces currently sliding to their new squares
+animations = []
 font = pygame.font.Font(None, 48)
+title_font = pygame.font.Font(None, 72)
+hud_font = pygame.font.Font(None, 22)
+
+
+class SpriteCache:
+    """Pre-scaled piece sprites, translucent overlays and rendered text.
+
+    Everything is kept in display format and rebuilt only when the square
+    size changes, so drawing a frame is just blits.
+    """
+
+    MAX_TEXT_ENTRIES = 256
+
+    def __init__(self):
+        self.square_size = None
+        self.background = None
+        self.pieces = {}
+        self.overlays = {}
+        self.labels = {}
+
+    def resize(self, square_size):
+        """Rebuild the board background and piece sprites if the square size has changed."""
+        if square_size == self.square_size:
+            return
+        self.square_size = square_size
+        size = (square_size, square_size)
+        self.background = pygame.Surface((square_size * 8, square_size * 8)).convert()
+        for row in range(8):
+            for col in range(8):
+                color = light_square if (row + col) % 2 == 0 else dark_square
+                self.background.fill(color, pygame.Rect(col * square_size, row * square_size, square_size, square_size))
+        self.pieces = {name: pygame.transform.smoothscale(image, size).convert_alpha()
+                       for name, image in pieces.items()}
+        self.overlays.clear()
+
+    def piece(self, name):
+        return self.pieces[name]
+
+    def overlay(self, rgba, size=None):
+        """A surface of the given size filled with a translucent colour (default: one square)."""
+        if size is None:
+            size = (self.square_size, self.square_size)
+        key = (rgba, size)
+        surface = self.overlays.get(key)
+        if surface is None:
+            surface = pygame.Surface(size, pygame.SRCALPHA).convert_alpha()
+            surface.fill(rgba)
+            self.overlays[key] = surface
+        return surface
+
+    def text(self, text, text_font=None, color=(255, 255, 255)):
+        text_font = text_font or font
+        key = (text_font, text, color)
+        label = self.labels.get(key)
+        if label is None:
+            if len(self.labels) >= self.MAX_TEXT_ENTRIES:
+                self.labels.clear()
+            label = text_font.render(text, True, color).convert_alpha()
+            self.labels[key] = label
+        return label
+
+
+sprites = SpriteCache()
+sprites.resize(width // 8)
 
 
 class Button:
@@ -69,390 +189,359 @@ class Button:
     def draw(self, surface):
         pygame.draw.rect(surface, (70, 70, 70), self.rect, border_radius=8)
         pygame.draw.rect(surface, (255, 255, 255), self.rect, 2, border_radius=8)
-        label = font.render(self.text, True, (255, 255, 255))
+        label = sprites.text(self.text)
         surface.blit(label, label.get_rect(center=self.rect.center))
 
     def is_clicked(self, pos):
         return self.rect.collidepoint(pos)
 
 
-class StockfishAI:
-    """Wrap Stockfish engine with difficulty presets."""
+class AIWorker:
+    """Choose AI moves on a background thread and post them as AI_MOVE_EVENT."""
+
+    def __init__(self, engine, level, book=None):
+        self.engine = engine
+        self.level = level
+        self.book = book
+        # Stop probing the book for the rest of the game after the first miss
+        self.in_book = book is not None
+        self.thread = None
+        self.request_id = 0
+        self.pending = False
+        self.started = 0
+
+    @property
+    def busy(self):
+        return self.thread is not None and self.thread.is_alive()
+
+    def request(self, board, color, rights, state, moves):
+        """Start searching a copy of the position; moves are the game so far in UCI form."""
+        self.request_id += 1
+        self.pending = True
+        self.started = pygame.time.get_ticks()
+        args = (self.request_id, [row[:] for row in board], color, dict(rights), dict(state), list(moves))
+        self.thread = threading.Thread(target=self._run, args=args, daemon=True)
+        self.thread.start()
+
+    def _run(self, request_id, board, color, rights, state, moves):
+        started = time.perf_counter()
+        uci = move = None
+        try:
+            move = self._book_move(board, color, rights, state)
+            if move is None:
+                uci = self.engine.best_move(board_to_fen(board, color, rights, state), moves) if self.engine else None
+                if uci:
+                    move = parse_uci_move(uci)
+                elif request_id == self.request_id:
+                    move = ai_search_move(board, color, rights, state, self.level)
+        except Exception as e:
+            # A failing book, engine or shared cache must not leave the game
+            # waiting for an answer that never comes
+            log.warning("AI move failed: %r", e)
+            uci = None
+            move = self._fallback_move(request_id, board, color, rights, state)
+        finally:
+            if request_id == self.request_id:
+                record_latency(self.level, time.perf_counter() - started)
+            pygame.event.post(pygame.event.Event(AI_MOVE_EVENT, request_id=request_id, move=move))
+        if uci and request_id == self.request_id:
+            # Keep Stockfish searching the likely reply while the player thinks
+            self.engine.ponder(moves + [uci])
+
+    def _fallback_move(self, request_id, board, color, rights, state):
+        """The built-in search's move after the book or engine failed, or None."""
+        if request_id != self.request_id:
+            return None
+        try:
+            return ai_search_move(board, color, rights, state, self.level)
+        except Exception as e:
+            log.warning("AI search failed: %r", e)
+            return None
 
-    LEVELS = {
-        "easy": {"depth": 4, "skill": 5},
-        "medium": {"depth": 8, "skill": 10},
-        "hard": {"depth": 15, "skill": 20},
-    }
+    def _book_move(self, board, color, rights, state):
+        if not self.in_book:
+            return None
+        move = self.book.choose(board, color, rights, state)
+        self.in_book = move is not None
+        return move
+
+    def accept(self, event):
+        """Return True if event answers the current request."""
+        if self.pending and event.request_id == self.request_id:
+            self.pending = False
+            return True
+        return False
 
-    def __init__(self, path="stockfish/stockfish-windows-x86-64-avx2.exe", level="easy"):
-        params = self.LEVELS.get(level, self.LEVELS["easy"])
-        self.engine = Stockfish(path=path, depth=params["depth"], parameters={"Skill Level": params["skill"]})
+    def cancel(self):
+        """Drop the current request and stop any search in progress."""
+        if not self.pending:
+            return
+        self.request_id += 1
+        self.pending = False
+        if self.engine:
+            self.engine.stop()
+        search.default_searcher.stop()
 
-    def best_move(self, fen):
-        try:
-            self.engine.set_fen_position(fen)
-            return self.engine.get_best_move()
-        except Exception:
-            return None
 
-# Castling state flags
-castle_rights = {
-    'w_kingside': True,
-    'w_queenside': True,
-    'b_kingside': True,
-    'b_queenside': True,
-}
+def record_latency(level, seconds):
+    """Log how long the AI took to answer and the running p95 for its level."""
+    history = move_latencies.setdefault(level, deque(maxlen=LATENCY_HISTORY))
+    history.append(seconds)
+    log.debug("ai: %s move %.3fs  p95 %.3fs over %d moves", level, seconds, percentile(history, 0.95), len(history))
 
-def is_path_clear(board, squares):
-    """Return True if all squares are empty."""
-    for r, c in squares:
-        if board[r][c] != "":
-            return False
-    return True
 
+class Popup:
+    """Modal dialog drawn over the board; the game loop routes input to it."""
 
-def is_castle_path_safe(board, color, squares):
-    """Check that the king does not pass through check when castling."""
-    king_pos = find_king(board, color)
-    if not king_pos:
-        return False
-    kr, kc = king_pos
-    for r, c in squares:
-        backup = board[r][c]
-        board[kr][kc] = ""
-        board[r][c] = f"{color}_king"
-        safe = not is_king_in_check(board, color)
-        board[r][c] = backup
-        board[kr][kc] = f"{color}_king"
-        if not safe:
-            return False
-    return True
-
-
-def is_valid_move(board, piece, start_pos, end_pos, check_castle=True):
-    sr, sc = start_pos
-    er, ec = end_pos
-    dr, dc = er - sr, ec - sc
-
-    if sr == er and sc == ec:
-        return False
+    def draw(self, surface):
+        """Draw the dialog onto surface; the base dialog draws nothing."""
+
+    def handle(self, event):
+        """Return the dialog's result once it has been answered, otherwise None."""
+        return None
 
-    target = board[er][ec]
-    if target and target[0] == piece[0]:
-        return False
 
-    kind = piece[2:]
+class PromotionPopup(Popup):
+    """Ask which piece a pawn moving from start to end promotes to."""
 
-    if kind == "pawn":
-        direction = -1 if piece.startswith("w") else 1
-        start_row = 6 if piece.startswith("w") else 1
+    OPTIONS = ["queen", "rook", "bishop", "knight"]
 
-        if sc == ec:
-            if dr == direction and board[er][ec] == "":
+    def __init__(self, color, start, end):
+        self.color = color
+        self.start = start
+        self.end = end
+        square_size = width // 8
+        popup_width = len(self.OPTIONS) * (square_size + 20) + 20
+        popup_height = square_size + 40
+        self.rect = pygame.Rect((width - popup_width) // 2, (height - popup_height) // 2, popup_width, popup_height)
+        self.buttons = [
+            (pygame.Rect(self.rect.x + 20 + i * (square_size + 20), self.rect.y + 20, square_size, square_size), name)
+            for i, name in enumerate(self.OPTIONS)
+        ]
+
+    def draw(self, surface):
+        pygame.draw.rect(surface, popup_bg, self.rect, border_radius=10)
+        pygame.draw.rect(surface, (0, 0, 0), self.rect, 2, border_radius=10)
+        for rect, name in self.buttons:
+            pygame.draw.rect(surface, (220, 220, 220), rect)
+            surface.blit(sprites.piece(self.color + "_" + name), rect.topleft)
+
+    def handle(self, event):
+        if event.type == pygame.MOUSEBUTTONDOWN:
+            for rect, name in self.buttons:
+                if rect.collidepoint(event.pos):
+                    return name
+        return None
+
+
+class ConfirmExitPopup(Popup):
+    """Ask if the user wants to quit to the home screen."""
+
+    def __init__(self):
+        self.yes_btn = Button((width // 2 - 110, height // 2 + 20, 100, 40), "Yes")
+        self.no_btn = Button((width // 2 + 10, height // 2 + 20, 100, 40), "No")
+
+    def draw(self, surface):
+        surface.blit(sprites.overlay((0, 0, 0, 180), (width, height)), (0, 0))
+        msg = sprites.text("Return to home?")
+        surface.blit(msg, msg.get_rect(center=(width // 2, height // 2 - 20)))
+        self.yes_btn.draw(surface)
+        self.no_btn.draw(surface)
+
+    def handle(self, event):
+        if event.type == pygame.MOUSEBUTTONDOWN:
+            if self.yes_btn.is_clicked(event.pos):
                 return True
-            if sr == start_row and dr == 2 * direction and board[sr + direction][sc] == "" and board[er][ec] == "":
+            if self.no_btn.is_clicked(event.pos):
+                return False
+        if event.type == pygame.KEYDOWN:
+            if event.key in (pygame.K_y, pygame.K_RETURN):
                 return True
-        elif abs(sc - ec) == 1 and dr == direction and board[er][ec] != "":
-            return True
-
-    elif kind == "rook":
-        if sr == er or sc == ec:
-            if sr == er:
-                step = 1 if ec > sc else -1
-                for c in range(sc + step, ec, step):
-                    if board[sr][c] != "":
-                        return False
-            else:
-                step = 1 if er > sr else -1
-                for r in range(sr + step, er, step):
-                    if board[r][sc] != "":
-                        return False
-            return True
+            if event.key in (pygame.K_n, pygame.K_ESCAPE):
+                return False
+        return None
 
-    elif kind == "knight":
-        return (abs(dr), abs(dc)) in [(2, 1), (1, 2)]
 
-    elif kind == "bishop":
-        if abs(dr) == abs(dc):
-            r_step = 1 if dr > 0 else -1
-            c_step = 1 if dc > 0 else -1
-            for i in range(1, abs(dr)):
-                if board[sr + i * r_step][sc + i * c_step] != "":
-                    return False
-            return True
+class WinPopup(Popup):
+    """Announce the winner until any key or click."""
 
-    elif kind == "queen":
-        return (
-            is_valid_move(board, piece[0] + "_rook", start_pos, end_pos, check_castle)
-            or is_valid_move(board, piece[0] + "_bishop", start_pos, end_pos, check_castle)
-        )
+    def __init__(self, winner):
+        self.winner = winner
 
-    elif kind == "king":
-        if max(abs(dr), abs(dc)) == 1:
+    def draw(self, surface):
+        surface.blit(sprites.overlay((0, 0, 0, 180), (width, height)), (0, 0))
+        text = sprites.text(f"{self.winner} wins!", title_font)
+        info = sprites.text("Click anywhere to return home")
+        surface.blit(text, text.get_rect(center=(width // 2, height // 2 - 20)))
+        surface.blit(info, info.get_rect(center=(width // 2, height // 2 + 40)))
+
+    def handle(self, event):
+        if event.type in (pygame.KEYDOWN, pygame.MOUSEBUTTONDOWN):
             return True
-        # Castling logic
-        color = piece[0]
-        if check_castle and not is_king_in_check(board, color):
-            if color == 'w' and sr == 7 and sc == 4 and er == 7:
-                # White castling
-                if ec == 6 and castle_rights['w_kingside']:
-                    path = [(7,5), (7,6)]
-                    return is_path_clear(board, path) and is_castle_path_safe(board, color, path)
-                if ec == 2 and castle_rights['w_queenside']:
-                    path = [(7,3), (7,2)]
-                    return is_path_clear(board, [(7,1), (7,2), (7,3)]) and is_castle_path_safe(board, color, path)
-            elif color == 'b' and sr == 0 and sc == 4 and er == 0:
-                # Black castling
-                if ec == 6 and castle_rights['b_kingside']:
-                    path = [(0,5), (0,6)]
-                    return is_path_clear(board, path) and is_castle_path_safe(board, color, path)
-                if ec == 2 and castle_rights['b_queenside']:
-                    path = [(0,3), (0,2)]
-                    return is_path_clear(board, [(0,1), (0,2), (0,3)]) and is_castle_path_safe(board, color, path)
-
-    return False
-
-def is_king_in_check(board, color):
-    king_pos = None
-    for row in range(8):
-        for col in range(8):
-            if board[row][col] == color + "_king":
-                king_pos = (row, col)
-    if not king_pos:
-        return True
+        return None
 
-    opponent_color = 'b' if color == 'w' else 'w'
-    for row in range(8):
-        for col in range(8):
-            piece = board[row][col]
-            if piece and piece[0] == opponent_color:
-                if is_valid_move(board, piece, (row, col), king_pos, False):
-                    return True
-    return False
-
-def find_king(board, color):
-    for r in range(8):
-        for c in range(8):
-            if board[r][c] == f"{color}_king":
-                return (r, c)
+
+def promotion_popup(start, end):
+    """Return a PromotionPopup if moving start to end promotes a pawn, else None."""
+    piece = starting_board[start[0]][start[1]]
+    if piece.endswith("pawn") and end[0] in (0, 7):
+        return PromotionPopup(piece[0], start, end)
     return None
 
 
-def board_to_fen(board, turn, rights):
-    mapping = {
-        "w_pawn": "P",
-        "w_rook": "R",
-        "w_knight": "N",
-        "w_bishop": "B",
-        "w_queen": "Q",
-        "w_king": "K",
-        "b_pawn": "p",
-        "b_rook": "r",
-        "b_knight": "n",
-        "b_bishop": "b",
-        "b_queen": "q",
-        "b_king": "k",
-    }
-    rows = []
-    for row in board:
-        empty = 0
-        fen_row = ""
-        for cell in row:
-            if cell == "":
-                empty += 1
-            else:
-                if empty:
-                    fen_row += str(empty)
-                    empty = 0
-                fen_row += mapping[cell]
-        if empty:
-            fen_row += str(empty)
-        rows.append(fen_row)
-    fen = "/".join(rows)
-    fen += f" {'w' if turn == 'w' else 'b'} "
-    castle = ""
-    if rights['w_kingside']:
-        castle += "K"
-    if rights['w_queenside']:
-        castle += "Q"
-    if rights['b_kingside']:
-        castle += "k"
-    if rights['b_queenside']:
-        castle += "q"
-    if castle == "":
-        castle = "-"
-    fen += castle + " - 0 1"
-    return fen
-
-
-def parse_uci_move(move):
-    sr = 8 - int(move[1])
-    sc = ord(move[0]) - 97
-    er = 8 - int(move[3])
-    ec = ord(move[2]) - 97
-    promotion = move[4] if len(move) == 5 else None
-    return (sr, sc), (er, ec), promotion
-
-def generate_legal_moves(board, piece, start_pos):
-    moves = []
-    sr, sc = start_pos
-    for r in range(8):
-        for c in range(8):
-            if is_valid_move(board, piece, start_pos, (r, c)):
-                backup = board[r][c]
-                board[r][c] = piece
-                board[sr][sc] = ""
-                rook_move = None
-                if piece.endswith("king") and abs(c - sc) == 2:
-                    row = 7 if piece.startswith('w') else 0
-                    if c == 6:
-                        rook_move = ((row, 7), (row, 5))
-                    elif c == 2:
-                        rook_move = ((row, 0), (row, 3))
-                    if rook_move:
-                        r_start, r_end = rook_move
-                        board[r_end[0]][r_end[1]] = board[r_start[0]][r_start[1]]
-                        board[r_start[0]][r_start[1]] = ""
-                if not is_king_in_check(board, piece[0]):
-                    moves.append((r, c))
-                board[sr][sc] = piece
-                board[r][c] = backup
-                if rook_move:
-                    board[rook_move[0][0]][rook_move[0][1]] = board[rook_move[1][0]][rook_move[1][1]]
-                    board[rook_move[1][0]][rook_move[1][1]] = ""
-    return moves
-
-def is_checkmate(board, color):
-    if not is_king_in_check(board, color):
-        return False
-    for r in range(8):
-        for c in range(8):
-            piece = board[r][c]
-            if piece and piece[0] == color:
-                if generate_legal_moves(board, piece, (r, c)):
-                    return False
-    return True
-
-def promote_pawn(piece):
-    color = piece[0]
-    selecting = True
-    options = ["queen", "rook", "bishop", "knight"]
-    buttons = []
-    square_size = width // 8
-
-    draw_board(screen)
-    popup_width = len(options) * (square_size + 20) + 20
-    popup_height = square_size + 40
-    popup_rect = pygame.Rect((width - popup_width) // 2, (height - popup_height) // 2, popup_width, popup_height)
-    pygame.draw.rect(screen, popup_bg, popup_rect, border_radius=10)
-    pygame.draw.rect(screen, (0, 0, 0), popup_rect, 2, border_radius=10)
-
-    for i, name in enumerate(options):
-        rect = pygame.Rect(popup_rect.x + 20 + i * (square_size + 20), popup_rect.y + 20, square_size, square_size)
-        img = pygame.transform.smoothscale(pieces[color + "_" + name], (square_size, square_size))
-        pygame.draw.rect(screen, (220, 220, 220), rect)
-        screen.blit(img, rect.topleft)
-        buttons.append((rect, color + "_" + name))
+class Animation:
+    """A piece sliding between two squares, positioned by elapsed time."""
 
-    pygame.display.flip()
+    def __init__(self, piece, start, end, covers=None, duration=ANIMATION_MS):
+        self.piece = piece
+        self.start = start
+        self.end = end
+        # Squares that keep showing their old contents until the piece arrives
+        self.covers = covers if covers is not None else {end: ""}
+        self.duration = duration
+        self.started = pygame.time.get_ticks()
 
-    while selecting:
-        for event in pygame.event.get():
-            if event.type == pygame.QUIT:
-                pygame.quit()
-                exit()
-            elif event.type == pygame.MOUSEBUTTONDOWN:
-                mx, my = pygame.mouse.get_pos()
-                for rect, result in buttons:
-                    if rect.collidepoint(mx, my):
-                        selecting = False
-                        return result
-    return color + "_queen"
+    def done(self, now):
+        return now - self.started >= self.duration
 
-def draw_board(surface, board=None):
+    def position(self, now, square_size):
+        """Top-left pixel of the sprite at time now."""
+        t = min(1.0, (now - self.started) / self.duration)
+        (sr, sc), (er, ec) = self.start, self.end
+        return (round((sc + (ec - sc) * t) * square_size), round((sr + (er - sr) * t) * square_size))
+
+
+def square_states(board=None):
+    """Return what each square shows, row by row, as (piece, highlights, in_check)."""
     if board is None:
         board = starting_board
-    square_size = width // 8
+    checked = set()
+    for color in ('w', 'b'):
+        kp, checkers, _ = attack_map(starting_board, color, position_hash, game_state)
+        if kp and checkers:
+            checked.add(kp)
+    covered = {}
+    if board is starting_board:
+        for animation in animations:
+            covered.update(animation.covers)
+    states = []
     for row in range(8):
         for col in range(8):
-            color = light_square if (row + col) % 2 == 0 else dark_square
-            rect = pygame.Rect(col * square_size, row * square_size, square_size, square_size)
-            pygame.draw.rect(surface, color, rect)
-
-            if last_move and ((row, col) == last_move[0] or (row, col) == last_move[1]):
-                overlay = pygame.Surface((square_size, square_size), pygame.SRCALPHA)
-                overlay.fill((255, 255, 0, 80))
-                surface.blit(overlay, rect.topleft)
-
-            if selected_piece and selected_pos == (row, col):
-                overlay = pygame.Surface((square_size, square_size), pygame.SRCALPHA)
-                overlay.fill((255, 255, 0, 120))
-                surface.blit(overlay, rect.topleft)
-
-            if (row, col) in legal_moves:
-                overlay = pygame.Surface((square_size, square_size), pygame.SRCALPHA)
-                overlay.fill((255, 255, 255, 100))
-                surface.blit(overlay, rect.topleft)
-
-
+            pos = (row, col)
+            highlights = ()
+            if last_move and (pos == last_move[0] or pos == last_move[1]):
+                highlights += ("last_move",)
+            if selected_piece and selected_pos == pos:
+                highlights += ("selected",)
+            if pos in legal_moves:
+                highlights += ("legal",)
             piece = board[row][col]
-            if piece and (not dragging or (row, col) != selected_pos or board is not starting_board):
-                image = pygame.transform.smoothscale(pieces[piece], (square_size, square_size))
-                surface.blit(image, (col * square_size, row * square_size))
+            if dragging and pos == selected_pos and board is starting_board:
+                # The dragged piece is drawn under the mouse instead
+                piece = ""
+            if pos in covered:
+                piece = covered[pos]
+            states.append((piece, highlights, pos in checked))
+    return states
+
+
+def draw_square(surface, row, col, state):
+    square_size = sprites.square_size
+    x, y = col * square_size, row * square_size
+    piece, highlights, in_check = state
+    surface.blit(sprites.background, (x, y), pygame.Rect(x, y, square_size, square_size))
+    for name in highlights:
+        surface.blit(sprites.overlay(HIGHLIGHTS[name]), (x, y))
+    if piece:
+        surface.blit(sprites.piece(piece), (x, y))
+    if in_check:
+        surface.blit(sprites.overlay(HIGHLIGHTS["check"]), (x, y))
 
-    # Highlight kings in check
-    for color in ('w', 'b'):
-        if is_king_in_check(starting_board, color):
-            kp = find_king(starting_board, color)
-            if kp:
-                rect = pygame.Rect(kp[1] * square_size, kp[0] * square_size, square_size, square_size)
-                overlay = pygame.Surface((square_size, square_size), pygame.SRCALPHA)
-                overlay.fill((255, 0, 0, 100))
-                surface.blit(overlay, rect.topleft)
-
-def update_castle_rights(piece, start_pos):
-    """Update castle rights when a king or rook moves."""
-    global castle_rights
-    sr, sc = start_pos
-    if piece == 'w_king':
-        castle_rights['w_kingside'] = False
-        castle_rights['w_queenside'] = False
-    elif piece == 'b_king':
-        castle_rights['b_kingside'] = False
-        castle_rights['b_queenside'] = False
-    elif piece == 'w_rook':
-        if sr == 7 and sc == 0:
-            castle_rights['w_queenside'] = False
-        elif sr == 7 and sc == 7:
-            castle_rights['w_kingside'] = False
-    elif piece == 'b_rook':
-        if sr == 0 and sc == 0:
-            castle_rights['b_queenside'] = False
-        elif sr == 0 and sc == 7:
-            castle_rights['b_kingside'] = False
-
-def animate_move(piece, start_pos, end_pos):
-    """Animate a piece moving from start_pos to end_pos."""
-    sr, sc = start_pos
-    er, ec = end_pos
-    square_size = width // 8
-    steps = 8
-    temp_board = [row[:] for row in starting_board]
-    temp_board[sr][sc] = ""
-    for i in range(1, steps + 1):
-        draw_board(screen, temp_board)
-        x = (sc + (ec - sc) * i / steps) * square_size
-        y = (sr + (er - sr) * i / steps) * square_size
-        img = pygame.transform.smoothscale(pieces[piece], (square_size, square_size))
-        screen.blit(img, (x, y))
-        pygame.display.flip()
-        pygame.time.delay(30)
+
+def draw_board(surface, board=None):
+    sprites.resize(width // 8)
+    surface.blit(sprites.background, (0, 0))
+    for i, state in enumerate(square_states(board)):
+        if any(state):
+            draw_square(surface, i // 8, i % 8, state)
+
+
+class BoardView:
+    """Redraws only the squares and floating sprites that changed since the last frame."""
+
+    def __init__(self):
+        self.states = None
+        self.floating = []
+
+    def invalidate(self):
+        """Redraw everything on the next frame, e.g. after a popup covered the board."""
+        self.states = None
+
+    def _squares_under(self, rect):
+        square_size = sprites.square_size
+        squares = set()
+        for row in range(max(0, rect.top // square_size), min(8, (rect.bottom - 1) // square_size + 1)):
+            for col in range(max(0, rect.left // square_size), min(8, (rect.right - 1) // square_size + 1)):
+                squares.add(row * 8 + col)
+        return squares
+
+    def render(self, surface, floating=()):
+        """Draw what changed plus floating (image, pos) sprites; return the updated rects."""
+        sprites.resize(width // 8)
+        square_size = sprites.square_size
+        states = square_states()
+        floating = list(floating)
+        if self.states is None:
+            dirty = set(range(64))
+        else:
+            dirty = {i for i in range(64) if states[i] != self.states[i]}
+            if floating != self.floating:
+                for image, pos in self.floating + floating:
+                    dirty |= self._squares_under(image.get_rect(topleft=pos))
+        # A floating sprite is redrawn whole, so every square under it must be too
+        covers = [self._squares_under(image.get_rect(topleft=pos)) for image, pos in floating]
+        grown = True
+        while grown:
+            grown = False
+            for squares in covers:
+                if dirty & squares and not squares <= dirty:
+                    dirty |= squares
+                    grown = True
+        for i in dirty:
+            draw_square(surface, i // 8, i % 8, states[i])
+        if dirty:
+            for image, pos in floating:
+                surface.blit(image, pos)
+        self.states = states
+        self.floating = floating
+        rects = [pygame.Rect(i % 8 * square_size, i // 8 * square_size, square_size, square_size) for i in sorted(dirty)]
+        if rects:
+            pygame.display.update(rects)
+        return rects
+
+
+board_view = BoardView()
+
+profiler.add(BoardView, "render", "render")
+profiler.add(StockfishAI, "analyse", "stockfish")
+profiler.add(search.Searcher, "search", "search")
+
+
+def animate_move(undo):
+    """Start sliding a played move's piece, and the rook when castling, to the new squares."""
+    covers = {undo.end: ""}
+    if undo.captured:
+        covers[undo.captured_pos] = undo.captured
+    animations.append(Animation(undo.piece, undo.start, undo.end, covers))
+    if undo.rook_move:
+        rook_start, rook_end = undo.rook_move
+        animations.append(Animation(undo.piece[0] + "_rook", rook_start, rook_end))
 
 
 def reset_game():
     """Reset all global game state."""
-    global starting_board, selected_piece, selected_pos, dragging, turn, legal_moves, game_over, last_move, castle_rights
+    global starting_board, selected_piece, selected_pos, dragging, turn, legal_moves, game_over, last_move, position_hash
+    global move_stack, move_history
     starting_board = [row[:] for row in initial_board]
     selected_piece = None
     selected_pos = None
@@ -461,25 +550,25 @@ def reset_game():
     legal_moves = []
     game_over = False
     last_move = None
-    castle_rights = {
-        'w_kingside': True,
-        'w_queenside': True,
-        'b_kingside': True,
-        'b_queenside': True,
-    }
+    # castle_rights is shared with the rules module, so reset it in place
+    castle_rights.update(new_castle_rights())
+    game_state.update(new_game_state())
+    position_hash = compute_hash(starting_board, turn, castle_rights)
+    move_stack = []
+    move_history = []
+    animations.clear()
 
 
 def draw_button(rect, text):
     """Deprecated helper for drawing buttons."""
     pygame.draw.rect(screen, (70, 70, 70), rect, border_radius=8)
     pygame.draw.rect(screen, (255, 255, 255), rect, 2, border_radius=8)
-    label = font.render(text, True, (255, 255, 255))
+    label = sprites.text(text)
     screen.blit(label, label.get_rect(center=rect.center))
 
 
 def show_home_screen():
     """Display the home screen and return selected mode."""
-    title_font = pygame.font.Font(None, 72)
     buttons = [
         Button((width // 2 - 120, height // 2 - 100, 240, 50), "AI Easy"),
         Button((width // 2 - 120, height // 2 - 30, 240, 50), "AI Medium"),
@@ -487,17 +576,16 @@ def show_home_screen():
         Button((width // 2 - 120, height // 2 + 110, 240, 50), "Multiplayer"),
         Button((width // 2 - 120, height // 2 + 180, 240, 50), "Exit"),
     ]
+    draw_board(screen, initial_board)
+    screen.blit(sprites.overlay((0, 0, 0, 150), (width, height)), (0, 0))
+    title_surf = sprites.text("Chess", title_font)
+    screen.blit(title_surf, title_surf.get_rect(center=(width // 2, height // 4)))
+    for b in buttons:
+        b.draw(screen)
+    pygame.display.flip()
     while True:
-        draw_board(screen, initial_board)
-        overlay = pygame.Surface((width, height), pygame.SRCALPHA)
-        overlay.fill((0, 0, 0, 150))
-        screen.blit(overlay, (0, 0))
-        title_surf = title_font.render("Chess", True, (255, 255, 255))
-        screen.blit(title_surf, title_surf.get_rect(center=(width // 2, height // 4)))
-        for b in buttons:
-            b.draw(screen)
-        pygame.display.flip()
-        for event in pygame.event.get():
+        # The home screen is static, so block until there is input
+        for event in [pygame.event.wait()] + pygame.event.get():
             if event.type == pygame.QUIT:
                 pygame.quit()
                 exit()
@@ -518,192 +606,173 @@ def show_home_screen():
                             exit()
 
 
-def show_win_screen(winner):
-    board_img = screen.copy()
-    overlay = pygame.Surface((width, height), pygame.SRCALPHA)
-    overlay.fill((0, 0, 0, 180))
-    win_font = pygame.font.Font(None, 72)
-    text = win_font.render(f"{winner} wins!", True, (255, 255, 255))
-    info = font.render("Click anywhere to return home", True, (255, 255, 255))
-    board_img.blit(overlay, (0, 0))
-    board_img.blit(text, text.get_rect(center=(width // 2, height // 2 - 20)))
-    board_img.blit(info, info.get_rect(center=(width // 2, height // 2 + 40)))
-    screen.blit(board_img, (0, 0))
-    pygame.display.flip()
-    waiting = True
-    while waiting:
-        for event in pygame.event.get():
-            if event.type == pygame.QUIT:
-                pygame.quit()
-                exit()
-            if event.type in (pygame.KEYDOWN, pygame.MOUSEBUTTONDOWN):
-                waiting = False
-        pygame.time.delay(100)
-    reset_game()
+def current_position():
+    """Return (legal moves, status) for the side to move in the current game."""
+    return lookup_position(starting_board, turn, castle_rights, position_hash,
+                           ep_square=game_state['ep_square'])
 
 
-def confirm_exit():
-    """Display a popup asking if the user wants to quit to the home screen."""
-    overlay = pygame.Surface((width, height), pygame.SRCALPHA)
-    overlay.fill((0, 0, 0, 180))
-    yes_btn = Button((width // 2 - 110, height // 2 + 20, 100, 40), "Yes")
-    no_btn = Button((width // 2 + 10, height // 2 + 20, 100, 40), "No")
-    draw_board(screen)
-    screen.blit(overlay, (0, 0))
-    msg = font.render("Return to home?", True, (255, 255, 255))
-    screen.blit(msg, msg.get_rect(center=(width // 2, height // 2 - 20)))
-    yes_btn.draw(screen)
-    no_btn.draw(screen)
-    pygame.display.flip()
-    while True:
-        for event in pygame.event.get():
-            if event.type == pygame.QUIT:
-                pygame.quit()
-                exit()
-            if event.type == pygame.MOUSEBUTTONDOWN:
-                mx, my = pygame.mouse.get_pos()
-                if yes_btn.is_clicked((mx, my)):
-                    return True
-                if no_btn.is_clicked((mx, my)):
-                    return False
-            if event.type == pygame.KEYDOWN:
-                if event.key in (pygame.K_y, pygame.K_RETURN):
-                    return True
-                if event.key in (pygame.K_n, pygame.K_ESCAPE):
-                    return False
-        pygame.time.delay(100)
-
-
-def ai_make_move(color):
-    global turn, last_move
-    moves = []
-    for r in range(8):
-        for c in range(8):
-            piece = starting_board[r][c]
-            if piece and piece[0] == color:
-                for move in generate_legal_moves(starting_board, piece, (r, c)):
-                    moves.append(((r, c), move))
-    if not moves:
-        return
-    start, end = random.choice(moves)
-    piece = starting_board[start[0]][start[1]]
-    animate_move(piece, start, end)
-    backup_piece = starting_board[end[0]][end[1]]
-    starting_board[end[0]][end[1]] = piece
-    starting_board[start[0]][start[1]] = ""
-    if piece.endswith("king") and abs(end[1] - start[1]) == 2:
-        if end[1] == 6:
-            starting_board[end[0]][5] = starting_board[end[0]][7]
-            starting_board[end[0]][7] = ""
-        elif end[1] == 2:
-            starting_board[end[0]][3] = starting_board[end[0]][0]
-            starting_board[end[0]][0] = ""
-    if piece.endswith("pawn") and (end[0] == 0 or end[0] == 7):
-        starting_board[end[0]][end[1]] = promote_pawn(piece)
-    update_castle_rights(piece, start)
+def play_move(start, end, promotion=None):
+    """Play a legal move, start its animation and return the status for the side to move.
+
+    Promotions default to a queen; the GUI asks with PromotionPopup first.
+    """
+    global turn, last_move, position_hash
+    undo = make_move(starting_board, start, end, promotion)
+    animate_move(undo)
+    move_stack.append(undo)
+    move_history.append(undo_to_uci(undo))
+    position_hash = hash_after_move(position_hash, undo, castle_rights, game_state['ep_square'])
     last_move = (start, end)
     turn = 'b' if turn == 'w' else 'w'
-
-
-def game_loop(vs_ai=False, difficulty="easy"):
+    return current_position()[1]
+
+
+def ai_search_move(board, color, rights, state, level="easy"):
+    """Return (start, end, promotion) from the built-in search, or None."""
+    params = search.LEVELS.get(level, search.LEVELS["easy"])
+    result = search.search(board, color, rights, state,
+                           time_limit=params["time"], max_depth=params["depth"])
+    log.debug("%s", search.format_report(result))
+    return result.move
+
+
+def ai_make_move(color, level="easy"):
+    """Play a move for color with the built-in search."""
+    move = ai_search_move(starting_board, color, castle_rights, game_state, level)
+    if move is None:
+        return None
+    start, end, promotion = move
+    return play_move(start, end, promotion)
+
+
+def thinking_indicator(started):
+    """Floating sprites for an animated "thinking" label shown while the AI searches."""
+    dots = "." * ((pygame.time.get_ticks() - started) // 400 % 4)
+    label = sprites.text(f"AI thinking{dots}")
+    rect = label.get_rect(topleft=(10, 10))
+    # Size the backdrop for the longest label so it does not change every frame
+    backdrop = sprites.overlay((0, 0, 0, 150), (sprites.text("AI thinking...").get_width() + 20, rect.height + 10))
+    return [(backdrop, (rect.x - 10, rect.y - 5)), (label, rect.topleft)]
+
+
+def profile_hud(lines):
+    """Floating sprites for the profiling overlay in the bottom-left corner."""
+    if not lines:
+        return []
+    labels = [sprites.text(line, hud_font) for line in lines]
+    line_height = labels[0].get_height()
+    # Round the backdrop up so it is not resized, and re-cached, on every refresh
+    box_width = min(width, (max(label.get_width() for label in labels) + 20 + 49) // 50 * 50)
+    box_height = line_height * len(labels) + 10
+    top = height - box_height
+    items = [(sprites.overlay((0, 0, 0, 170), (box_width, box_height)), (0, top))]
+    items += [(label, (10, top + 5 + i * line_height)) for i, label in enumerate(labels)]
+    return items
+
+
+def game_loop(vs_ai=False, difficulty="easy", ai_engine=None, book=None):
     reset_game()
     ai_color = 'b' if vs_ai else None
-    ai_engine = StockfishAI(level=difficulty) if vs_ai else None
+    if ai_engine:
+        ai_engine.new_game(difficulty)
+    ai_worker = AIWorker(ai_engine, difficulty, book) if vs_ai else None
+    clock = pygame.time.Clock()
+    screen.fill((0, 0, 0))
+    pygame.display.flip()
+    board_view.invalidate()
+    dirty = True
+    popup = None
+    popup_drawn = False
+    # Set on checkmate; the win popup opens once the last animation ends
+    winner = None
+    hud_lines = []
+    hud_updated = 0
+    last_dump = time.perf_counter()
     running = True
-    global dragging, selected_piece, selected_pos, legal_moves, turn, game_over
+    global dragging, selected_piece, selected_pos, legal_moves, game_over
     while running:
-        screen.fill((0, 0, 0))
-        draw_board(screen)
+        ai_turn = vs_ai and turn == ai_color and not game_over and winner is None
+        # A popup pauses the game, so the AI waits until it is answered
+        if ai_turn and not popup and not ai_worker.pending and not ai_worker.busy:
+            ai_worker.request(starting_board, turn, castle_rights, game_state, move_history)
+
+        events = pygame.event.get()
+        if not events and not dirty:
+            # Nothing changed last frame, so sleep until there is input
+            event = pygame.event.wait(IDLE_WAIT_MS)
+            events = [event] if event.type != pygame.NOEVENT else []
+        # Frame time is the work done per loop, not the time spent idle
+        frame_started = time.perf_counter()
 
         square_size = width // 8
         mouse_x, mouse_y = pygame.mouse.get_pos()
         mouse_col = mouse_x // square_size
         mouse_row = mouse_y // square_size
 
-        if vs_ai and turn == ai_color and not game_over:
-            fen = board_to_fen(starting_board, turn, castle_rights)
-            move = ai_engine.best_move(fen)
-            if not move:
-                ai_make_move(ai_color)
-            else:
-                (s_pos, e_pos, promo) = parse_uci_move(move)
-                piece = starting_board[s_pos[0]][s_pos[1]]
-                animate_move(piece, s_pos, e_pos)
-                backup_piece = starting_board[e_pos[0]][e_pos[1]]
-                starting_board[e_pos[0]][e_pos[1]] = piece
-                starting_board[s_pos[0]][s_pos[1]] = ""
-                if promo:
-                    mapping = {'q': 'queen', 'r': 'rook', 'b': 'bishop', 'n': 'knight'}
-                    starting_board[e_pos[0]][e_pos[1]] = f"{piece[0]}_{mapping.get(promo, 'queen')}"
-                if piece.endswith("king") and abs(e_pos[1] - s_pos[1]) == 2:
-                    if e_pos[1] == 6:
-                        starting_board[e_pos[0]][5] = starting_board[e_pos[0]][7]
-                        starting_board[e_pos[0]][7] = ""
-                    elif e_pos[1] == 2:
-                        starting_board[e_pos[0]][3] = starting_board[e_pos[0]][0]
-                        starting_board[e_pos[0]][0] = ""
-                if piece.endswith("pawn") and (e_pos[0] == 0 or e_pos[0] == 7):
-                    starting_board[e_pos[0]][e_pos[1]] = promote_pawn(piece)
-                update_castle_rights(piece, s_pos)
-                last_move = (s_pos, e_pos)
-                turn = 'b' if turn == 'w' else 'w'
-            if is_checkmate(starting_board, turn):
-                winner = 'White' if ai_color == 'b' else 'Black'
-                show_win_screen(winner)
-                running = False
-            continue
-
-        for event in pygame.event.get():
+        for event in events:
             if event.type == pygame.QUIT:
+                if ai_worker:
+                    ai_worker.cancel()
                 running = False
 
-            elif event.type == pygame.KEYDOWN and event.key == pygame.K_e:
-                if confirm_exit():
+            elif event.type == AI_MOVE_EVENT:
+                # Checked before the popup, which would swallow the answer
+                # and leave the worker pending for good
+                if ai_worker and ai_worker.accept(event):
+                    if event.move is None:
+                        # No legal move and no engine answer, so stop asking
+                        game_over = True
+                    elif play_move(*event.move) == 'checkmate':
+                        winner = 'White' if turn == 'b' else 'Black'
+
+            elif popup:
+                result = popup.handle(event)
+                if result is None:
+                    continue
+                answered, popup = popup, None
+                board_view.invalidate()
+                if isinstance(answered, PromotionPopup):
+                    if play_move(answered.start, answered.end, result) == 'checkmate':
+                        winner = 'White' if turn == 'b' else 'Black'
+                elif isinstance(answered, ConfirmExitPopup):
+                    if result:
+                        reset_game()
+                        running = False
+                else:
                     reset_game()
                     running = False
 
+            elif event.type == pygame.KEYDOWN and event.key == pygame.K_F3:
+                if profiler.enabled:
+                    profiler.disable()
+                else:
+                    profiler.enable()
+                hud_updated = 0
+
+            elif event.type == pygame.KEYDOWN and event.key == pygame.K_e:
+                if ai_worker:
+                    ai_worker.cancel()
+                popup = ConfirmExitPopup()
+
+            elif (ai_turn or winner) and event.type in (pygame.MOUSEBUTTONDOWN, pygame.MOUSEBUTTONUP):
+                # Ignore the board while the AI is choosing its move or the game is over
+                continue
+
             elif event.type == pygame.MOUSEBUTTONDOWN:
                 if selected_piece:
-                    if selected_piece[0] == turn and is_valid_move(starting_board, selected_piece, selected_pos, (mouse_row, mouse_col)):
-                        old_row, old_col = selected_pos
-                        animate_move(selected_piece, selected_pos, (mouse_row, mouse_col))
-                        backup_piece = starting_board[mouse_row][mouse_col]
-                        starting_board[mouse_row][mouse_col] = selected_piece
-                        starting_board[old_row][old_col] = ""
-                        if selected_piece.endswith("king") and abs(mouse_col - old_col) == 2:
-                            if mouse_col == 6:
-                                starting_board[mouse_row][5] = starting_board[mouse_row][7]
-                                starting_board[mouse_row][7] = ""
-                            elif mouse_col == 2:
-                                starting_board[mouse_row][3] = starting_board[mouse_row][0]
-                                starting_board[mouse_row][0] = ""
-                        if selected_piece.endswith("pawn") and (mouse_row == 0 or mouse_row == 7):
-                            starting_board[mouse_row][mouse_col] = promote_pawn(selected_piece)
-                        if is_king_in_check(starting_board, turn):
-                            starting_board[old_row][old_col] = selected_piece
-                            starting_board[mouse_row][mouse_col] = backup_piece
-                            if selected_piece.endswith("king") and abs(mouse_col - old_col) == 2:
-                                if mouse_col == 6:
-                                    starting_board[mouse_row][7] = starting_board[mouse_row][5]
-                                    starting_board[mouse_row][5] = ""
-                                elif mouse_col == 2:
-                                    starting_board[mouse_row][0] = starting_board[mouse_row][3]
-                                    starting_board[mouse_row][3] = ""
-                        else:
-                            update_castle_rights(selected_piece, selected_pos)
-                            last_move = ((old_row, old_col), (mouse_row, mouse_col))
-                            turn = 'b' if turn == 'w' else 'w'
-                            if is_checkmate(starting_board, turn):
-                                winner = 'White' if turn == 'b' else 'Black'
-                                show_win_screen(winner)
-                                running = False
+                    if selected_piece[0] == turn and (mouse_row, mouse_col) in legal_moves:
+                        popup = promotion_popup(selected_pos, (mouse_row, mouse_col))
+                        if popup is None and play_move(selected_pos, (mouse_row, mouse_col)) == 'checkmate':
+                            winner = 'White' if turn == 'b' else 'Black'
                     selected_piece = None
                     selected_pos = None
                     legal_moves = []
                 elif starting_board[mouse_row][mouse_col] and starting_board[mouse_row][mouse_col][0] == turn:
                     selected_piece = starting_board[mouse_row][mouse_col]
                     selected_pos = (mouse_row, mouse_col)
-                    legal_moves = generate_legal_moves(starting_board, selected_piece, selected_pos)
+                    moves, _ = current_position()
+                    legal_moves = [end for start, end in moves if start == selected_pos]
 
 
             elif event.type == pygame.MOUSEMOTION:
@@ -713,61 +782,87 @@ def game_loop(vs_ai=False, difficulty="easy"):
             elif event.type == pygame.MOUSEBUTTONUP:
                 if dragging and selected_piece:
                     new_row, new_col = mouse_y // square_size, mouse_x // square_size
-                    if selected_piece[0] == turn and is_valid_move(starting_board, selected_piece, selected_pos, (new_row, new_col)):
-                        old_row, old_col = selected_pos
-                        animate_move(selected_piece, selected_pos, (new_row, new_col))
-                        backup_piece = starting_board[new_row][new_col]
-                        starting_board[new_row][new_col] = selected_piece
-                        starting_board[old_row][old_col] = ""
-                        if selected_piece.endswith("king") and abs(new_col - old_col) == 2:
-                            if new_col == 6:
-                                starting_board[new_row][5] = starting_board[new_row][7]
-                                starting_board[new_row][7] = ""
-                            elif new_col == 2:
-                                starting_board[new_row][3] = starting_board[new_row][0]
-                                starting_board[new_row][0] = ""
-                        if selected_piece.endswith("pawn") and (new_row == 0 or new_row == 7):
-                            starting_board[new_row][new_col] = promote_pawn(selected_piece)
-                        if is_king_in_check(starting_board, turn):
-                            starting_board[old_row][old_col] = selected_piece
-                            starting_board[new_row][new_col] = backup_piece
-                            if selected_piece.endswith("king") and abs(new_col - old_col) == 2:
-                                if new_col == 6:
-                                    starting_board[new_row][7] = starting_board[new_row][5]
-                                    starting_board[new_row][5] = ""
-                                elif new_col == 2:
-                                    starting_board[new_row][0] = starting_board[new_row][3]
-                                    starting_board[new_row][3] = ""
-                        else:
-                            update_castle_rights(selected_piece, selected_pos)
-                            last_move = ((old_row, old_col), (new_row, new_col))
-                            turn = 'b' if turn == 'w' else 'w'
-                            if is_checkmate(starting_board, turn):
-                                winner = 'White' if turn == 'b' else 'Black'
-                                show_win_screen(winner)
-                                running = False
+                    if selected_piece[0] == turn and (new_row, new_col) in legal_moves:
+                        popup = promotion_popup(selected_pos, (new_row, new_col))
+                        if popup is None and play_move(selected_pos, (new_row, new_col)) == 'checkmate':
+                            winner = 'White' if turn == 'b' else 'Black'
                     selected_piece = None
                     selected_pos = None
                     dragging = False
                     legal_moves = []
 
-        if dragging and selected_piece:
-            drag_image = pygame.transform.smoothscale(pieces[selected_piece], (square_size, square_size))
-            screen.blit(drag_image, (mouse_x - square_size // 2, mouse_y - square_size // 2))
+        if not running:
+            break
 
-        pygame.display.flip()
+        now = pygame.time.get_ticks()
+        animations[:] = [animation for animation in animations if not animation.done(now)]
+        if winner and not animations and not popup:
+            popup = WinPopup(winner)
+
+        if popup:
+            # The board is frozen behind a popup, so draw it once and then idle
+            if not popup_drawn:
+                draw_board(screen)
+                popup.draw(screen)
+                pygame.display.flip()
+                popup_drawn = True
+            dirty = False
+            continue
+        popup_drawn = False
+
+        floating = [(sprites.piece(animation.piece), animation.position(now, square_size))
+                    for animation in animations]
+        if dragging and selected_piece:
+            floating.append((sprites.piece(selected_piece), (mouse_x - square_size // 2, mouse_y - square_size // 2)))
+        if ai_worker and ai_worker.pending:
+            floating += thinking_indicator(ai_worker.started)
+        if profiler.enabled:
+            if not hud_updated or now - hud_updated >= HUD_REFRESH_MS:
+                hud_lines = profiler.summary_lines()
+                hud_updated = now
+            floating += profile_hud(hud_lines)
+        dirty = bool(board_view.render(screen, floating))
+        profiler.frame(time.perf_counter() - frame_started)
+        if profiler.enabled and time.perf_counter() - last_dump >= PROFILE_DUMP_SECONDS:
+            profiler.dump(PROFILE_PATH)
+            last_dump = time.perf_counter()
+        clock.tick(FPS)
+
+
+def load_opening_book(path=BOOK_PATH):
+    """Open the Polyglot book if one is installed, else return None."""
+    if not os.path.exists(path):
+        return None
+    return OpeningBook(path, max_ply=BOOK_MAX_PLY)
 
 
 def main():
-    while True:
-        mode = show_home_screen()
-        if mode in ('ai_easy', 'ai_medium', 'ai_hard'):
-            level = mode.split('_')[1]
-            game_loop(vs_ai=True, difficulty=level)
-        elif mode == 'multi':
-            game_loop(vs_ai=False)
-        else:
-            break
+    if os.environ.get("CHESS_DEBUG"):
+        logging.basicConfig(level=logging.DEBUG, format="%(message)s")
+    if os.environ.get("CHESS_PROFILE"):
+        profiler.enable()
+    # Start Stockfish once, up front, so choosing a difficulty does not wait for it
+    analysis_cache = AnalysisCache(ANALYSIS_CACHE_PATH)
+    ai_engine = StockfishAI(cache=analysis_cache, ponder=PONDER)
+    book = load_opening_book()
+    try:
+        while True:
+            mode = show_home_screen()
+            if mode in ('ai_easy', 'ai_medium', 'ai_hard'):
+                level = mode.split('_')[1]
+                game_loop(vs_ai=True, difficulty=level, ai_engine=ai_engine, book=book)
+            elif mode == 'multi':
+                game_loop(vs_ai=False)
+            else:
+                break
+    finally:
+        ai_engine.close()
+        if book:
+            book.close()
+        log.debug("analysis cache: %s", analysis_cache.stats())
+        analysis_cache.close()
+        if profiler.enabled:
+            profiler.dump(PROFILE_PATH)
     pygame.quit()
 
 
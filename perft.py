@@ -0,0 +1,167 @@
+# Perft: count leaf nodes of the legal move tree to check and time move generation.
+# Usage:
+#   python perft.py                          run the reference suite
+#   python perft.py --fen "<fen>" --depth 3  count one position
+#   python perft.py --position kiwipete --depth 2 --divide
+
+import argparse
+import sys
+import time
+
+import rules
+from rules import (
+    PROMOTION_LETTERS,
+    START_FEN,
+    fen_to_board,
+    generate_all_legal_moves,
+    make_move,
+    new_game_state,
+    to_uci_move,
+    unmake_move,
+)
+
+# Reference positions with published node counts per depth (depth 1 first).
+# suite_depth keeps the default suite run to a few seconds in pure Python.
+REFERENCE_POSITIONS = {
+    "start": {
+        "fen": START_FEN,
+        "nodes": [20, 400, 8902, 197281, 4865609],
+        "suite_depth": 4,
+    },
+    "kiwipete": {
+        "fen": "r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1",
+        "nodes": [48, 2039, 97862, 4085603],
+        "suite_depth": 3,
+    },
+    "endgame": {
+        "fen": "8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1",
+        "nodes": [14, 191, 2812, 43238, 674624],
+        "suite_depth": 4,
+    },
+    "promotions": {
+        "fen": "r3k2r/Pppp1ppp/1b3nbN/nP6/BBP1P3/q4N2/Pp1P2PP/R2Q1RK1 w kq - 0 1",
+        "nodes": [6, 264, 9467, 422333],
+        "suite_depth": 3,
+    },
+    "talkchess": {
+        "fen": "rnbq1k1r/pp1Pbppp/2p5/8/2B5/8/PPP1NnPP/RNBQK2R w KQ - 1 8",
+        "nodes": [44, 1486, 62379, 2103487],
+        "suite_depth": 3,
+    },
+    "steven": {
+        "fen": "r4rk1/1pp1qppp/p1np1n2/2b1p1B1/2B1P1b1/P1NP1N2/1PP1QPPP/R4RK1 w - - 0 10",
+        "nodes": [46, 2079, 89890, 3894594],
+        "suite_depth": 3,
+    },
+}
+
+PROMOTION_PIECES = ("queen", "rook", "bishop", "knight")
+
+
+def expand_promotions(board, start, end):
+    """Return the promotion choices for a move, or (None,) for a normal move."""
+    piece = board[start[0]][start[1]]
+    if piece.endswith("pawn") and end[0] in (0, 7):
+        return PROMOTION_PIECES
+    return (None,)
+
+
+def perft(board, turn, rights, state, depth):
+    """Count leaf nodes depth plies below the position."""
+    moves = generate_all_legal_moves(board, turn, rights, state['ep_square'])
+    if depth == 1:
+        return sum(len(expand_promotions(board, start, end)) for start, end in moves)
+    opponent = 'b' if turn == 'w' else 'w'
+    nodes = 0
+    for start, end in moves:
+        for promotion in expand_promotions(board, start, end):
+            undo = make_move(board, start, end, promotion, rights, state)
+            nodes += perft(board, opponent, rights, state, depth - 1)
+            unmake_move(board, undo, rights, state)
+    return nodes
+
+
+def divide(board, turn, rights, state, depth):
+    """Return {uci_move: nodes} for every root move."""
+    counts = {}
+    opponent = 'b' if turn == 'w' else 'w'
+    for start, end in generate_all_legal_moves(board, turn, rights, state['ep_square']):
+        for promotion in expand_promotions(board, start, end):
+            move = to_uci_move(start, end, PROMOTION_LETTERS.get(promotion))
+            if depth == 1:
+                counts[move] = 1
+                continue
+            undo = make_move(board, start, end, promotion, rights, state)
+            counts[move] = perft(board, opponent, rights, state, depth - 1)
+            unmake_move(board, undo, rights, state)
+    return counts
+
+
+def load_fen(fen):
+    """Return (board, turn, rights, state) for a FEN."""
+    board, turn, rights, ep_square, halfmove, fullmove = fen_to_board(fen)
+    return board, turn, rights, new_game_state(ep_square, halfmove, fullmove)
+
+
+def run_perft(fen, depth, show_divide=False, out=sys.stdout):
+    """Run perft on a FEN, print the result with timing and return the node count."""
+    board, turn, rights, state = load_fen(fen)
+    started = time.perf_counter()
+    if show_divide:
+        counts = divide(board, turn, rights, state, depth)
+        for move in sorted(counts):
+            print(f"{move}: {counts[move]}", file=out)
+        nodes = sum(counts.values())
+    else:
+        nodes = perft(board, turn, rights, state, depth)
+    elapsed = time.perf_counter() - started
+    nps = nodes / elapsed if elapsed > 0 else 0
+    print(f"depth {depth}  nodes {nodes}  time {elapsed:.3f}s  nps {nps:,.0f}", file=out)
+    return nodes
+
+
+def run_suite(max_depth=None, out=sys.stdout):
+    """Check every reference position; return True if all node counts match."""
+    passed = True
+    total_nodes = 0
+    started = time.perf_counter()
+    for name, ref in REFERENCE_POSITIONS.items():
+        depth = min(ref["suite_depth"], max_depth or ref["suite_depth"])
+        board, turn, rights, state = load_fen(ref["fen"])
+        for d in range(1, depth + 1):
+            t = time.perf_counter()
+            nodes = perft(board, turn, rights, state, d)
+            elapsed = time.perf_counter() - t
+            expected = ref["nodes"][d - 1]
+            ok = nodes == expected
+            passed = passed and ok
+            total_nodes += nodes
+            status = "ok" if ok else f"FAIL (expected {expected})"
+            nps = nodes / elapsed if elapsed > 0 else 0
+            print(f"{name:<11} depth {d}  nodes {nodes:>9}  nps {nps:>10,.0f}  {status}", file=out)
+    elapsed = time.perf_counter() - started
+    nps = total_nodes / elapsed if elapsed > 0 else 0
+    print(f"total nodes {total_nodes}  time {elapsed:.3f}s  nps {nps:,.0f}", file=out)
+    return passed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Perft move generator benchmark")
+    parser.add_argument("--fen", help="position to search (default: start position)")
+    parser.add_argument("--position", choices=sorted(REFERENCE_POSITIONS), help="use a reference position")
+    parser.add_argument("--depth", type=int, help="search depth; without --fen or --position runs the suite")
+    parser.add_argument("--divide", action="store_true", help="print node counts per root move")
+    parser.add_argument("--backend", choices=rules.MOVE_GENERATORS, default=rules.move_generator,
+                        help="move generator to use")
+    args = parser.parse_args(argv)
+
+    rules.set_move_generator(args.backend)
+    if args.fen or args.position:
+        fen = args.fen or REFERENCE_POSITIONS[args.position]["fen"]
+        run_perft(fen, args.depth or 1, args.divide)
+        return 0
+    return 0 if run_suite(args.depth) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,348 @@
+# PGN import and export. SAN moves are read and written against the legal
+# move list from rules.py, and PGN files are read one game at a time, so
+# memory use stays flat on databases of any size.
+# Usage:
+#   python pgn.py import games.pgn                      parse and replay every game
+#   python pgn.py import games.pgn -o games.bin         ... and store them with gamefile.py
+#   python pgn.py export games.bin -o games.pgn         games.bin or selfplay JSONL to PGN
+
+import argparse
+import json
+import re
+import sys
+import time
+from collections import namedtuple
+
+from gamefile import Game, GameReader, GameWriter, game_from_record
+from rules import (
+    PROMOTION_NAMES,
+    START_FEN,
+    fen_to_board,
+    generate_all_legal_moves,
+    is_king_in_check,
+    is_valid_move,
+    make_move,
+    new_game_state,
+    parse_uci_move,
+    undo_to_uci,
+    unmake_move,
+)
+
+# Tags every exported game carries, in the order the PGN standard gives
+SEVEN_TAG_ROSTER = ("Event", "Site", "Date", "Round", "White", "Black", "Result")
+RESULTS = ("1-0", "0-1", "1/2-1/2", "*")
+LINE_LENGTH = 79
+
+# headers is a dict of tag pairs; moves are SAN strings as written in the file
+PgnGame = namedtuple("PgnGame", ["headers", "moves", "result"])
+
+SAN_MOVE = re.compile(r"^([NBRQK])?([a-h])?([1-8])?x?([a-h][1-8])(?:=?([NBRQnbrq]))?$")
+TAG = re.compile(r'^\[(\w+)\s+"((?:[^"\\]|\\.)*)"\]')
+TOKEN = re.compile(r"\{[^}]*\}|;[^\n]*|\$\d+|\(|\)|[^\s{}();$]+")
+MOVE_NUMBER = re.compile(r"^\d+\.*$|^\d+\.+")
+SAN_PIECES = {"knight": "N", "bishop": "B", "rook": "R", "queen": "Q", "king": "K"}
+SAN_KINDS = {letter: kind for kind, letter in SAN_PIECES.items()}
+
+
+def _square(pos):
+    return f"{chr(97 + pos[1])}{8 - pos[0]}"
+
+
+def _movers(board, piece, end, rights, state, col=None, row=None):
+    """Squares holding piece that can legally move to end, optionally limited to one file or rank.
+
+    Only the candidate pieces are tried, which is far cheaper than generating
+    every legal move of the position.
+    """
+    found = []
+    color = piece[0]
+    for r in range(8) if row is None else (row,):
+        for c in range(8) if col is None else (col,):
+            if board[r][c] != piece or not is_valid_move(board, piece, (r, c), end, rights=rights,
+                                                         ep_square=state['ep_square']):
+                continue
+            undo = make_move(board, (r, c), end, None, rights, state)
+            if not is_king_in_check(board, color, state=state):
+                found.append((r, c))
+            unmake_move(board, undo, rights, state)
+    return found
+
+
+def san_move(board, turn, rights, state, move):
+    """SAN for move (start, end, promotion) in the position before it is played."""
+    start, end, promotion = move
+    piece = board[start[0]][start[1]]
+    kind = piece[2:]
+    if kind == "king" and abs(end[1] - start[1]) == 2:
+        text = "O-O" if end[1] == 6 else "O-O-O"
+    else:
+        capture = board[end[0]][end[1]] != "" or (kind == "pawn" and start[1] != end[1])
+        if kind == "pawn":
+            text = f"{_square(start)[0]}x" if capture else ""
+            text += _square(end)
+            if end[0] in (0, 7):
+                text += "=" + SAN_PIECES[PROMOTION_NAMES.get(promotion, promotion or "queen")]
+        else:
+            rivals = []
+            if kind != "king":
+                rivals = [s for s in _movers(board, piece, end, rights, state) if s != start]
+            text = SAN_PIECES[kind]
+            if rivals:
+                if all(s[1] != start[1] for s in rivals):
+                    text += _square(start)[0]
+                elif all(s[0] != start[0] for s in rivals):
+                    text += _square(start)[1]
+                else:
+                    text += _square(start)
+            text += ("x" if capture else "") + _square(end)
+    return text + _check_suffix(board, turn, rights, state, move)
+
+
+def _check_suffix(board, turn, rights, state, move):
+    """'+', '#' or '' for the position after move, which is played and taken back."""
+    opponent = 'b' if turn == 'w' else 'w'
+    undo = make_move(board, move[0], move[1], move[2], rights, state)
+    suffix = ""
+    if is_king_in_check(board, opponent, state=state):
+        suffix = "+" if generate_all_legal_moves(board, opponent, rights, state['ep_square']) else "#"
+    unmake_move(board, undo, rights, state)
+    return suffix
+
+
+def parse_san(board, turn, rights, state, text):
+    """Return (start, end, promotion) for a SAN move, raising ValueError if it is not legal."""
+    san = text.rstrip("+#!?")
+    if san in ("O-O", "0-0", "O-O-O", "0-0-0"):
+        row = 7 if turn == 'w' else 0
+        end = (row, 6 if len(san) == 3 else 2)
+        if _movers(board, turn + "_king", end, rights, state, col=4, row=row):
+            return (row, 4), end, None
+        raise ValueError(f"illegal move: {text}")
+    match = SAN_MOVE.match(san)
+    if not match:
+        raise ValueError(f"bad SAN: {text}")
+    letter, from_file, from_rank, target, promotion = match.groups()
+    piece = f"{turn}_{SAN_KINDS[letter] if letter else 'pawn'}"
+    end = (8 - int(target[1]), ord(target[0]) - 97)
+    col = ord(from_file) - 97 if from_file else None
+    row = 8 - int(from_rank) if from_rank else None
+    if not letter and col is None:
+        # A pawn move without a capture stays on its file
+        col = end[1]
+    found = _movers(board, piece, end, rights, state, col, row)
+    if len(found) != 1:
+        raise ValueError(f"{'ambiguous' if found else 'illegal'} move: {text}")
+    return found[0], end, promotion.lower() if promotion else None
+
+
+def read_games(lines):
+    """Yield a PgnGame for every game in an iterable of PGN lines, such as an open file."""
+    headers = {}
+    movetext = []
+    # A blank line after the tags; more tags after one start a game without moves
+    gap = False
+    for line in lines:
+        if line.startswith("%"):
+            continue
+        stripped = line.strip()
+        if stripped.startswith("["):
+            if movetext or (headers and gap):
+                yield _finish(headers, movetext)
+                headers, movetext = {}, []
+            gap = False
+            match = TAG.match(stripped)
+            if match:
+                headers[match.group(1)] = match.group(2).replace('\\"', '"').replace("\\\\", "\\")
+        elif stripped:
+            movetext.append(line)
+        elif headers:
+            gap = True
+    if headers or movetext:
+        yield _finish(headers, movetext)
+
+
+def _finish(headers, movetext):
+    """Tokenise the movetext of one game, dropping comments, NAGs and variations."""
+    moves = []
+    result = headers.get("Result", "*")
+    depth = 0
+    for token in TOKEN.findall("".join(movetext)):
+        if token == "(":
+            depth += 1
+        elif token == ")":
+            depth -= 1
+        elif depth or token[0] in "{;$":
+            continue
+        elif token in RESULTS:
+            result = token
+        else:
+            # "12.e4" and "12...e5" put the move number and move in one token
+            token = MOVE_NUMBER.sub("", token)
+            if token:
+                moves.append(token)
+    return PgnGame(headers, moves, result)
+
+
+def replay(game):
+    """Return (start FEN, UCI moves) for a PgnGame; raises ValueError on an illegal move."""
+    fen = game.headers.get("FEN", START_FEN)
+    board, turn, rights, ep_square, halfmove, fullmove = fen_to_board(fen)
+    state = new_game_state(ep_square, halfmove, fullmove)
+    uci = []
+    for san in game.moves:
+        start, end, promotion = parse_san(board, turn, rights, state, san)
+        undo = make_move(board, start, end, promotion, rights, state)
+        uci.append(undo_to_uci(undo))
+        turn = 'b' if turn == 'w' else 'w'
+    return fen, uci
+
+
+def san_moves(fen, moves):
+    """Convert UCI moves played from fen into SAN; ValueError on an illegal move."""
+    board, turn, rights, ep_square, halfmove, fullmove = fen_to_board(fen)
+    state = new_game_state(ep_square, halfmove, fullmove)
+    sans = []
+    for ply, move in enumerate(moves, 1):
+        start, end, promotion = parse_uci_move(move)
+        legal = generate_all_legal_moves(board, turn, rights, state['ep_square'])
+        if (start, end) not in legal or promotion not in (None, *PROMOTION_NAMES):
+            raise ValueError(f"illegal move {move} at ply {ply}")
+        sans.append(san_move(board, turn, rights, state, (start, end, promotion)))
+        make_move(board, start, end, promotion, rights, state)
+        turn = 'b' if turn == 'w' else 'w'
+    return sans
+
+
+def _tag(name, value):
+    value = str(value).replace("\\", "\\\\").replace('"', '\\"')
+    return f'[{name} "{value}"]'
+
+
+def format_game(headers, sans, result="*", fen=START_FEN):
+    """PGN text for one game, ending in a blank line."""
+    headers = dict(headers)
+    headers["Result"] = result
+    if fen != START_FEN:
+        headers.update(SetUp="1", FEN=fen)
+    lines = [_tag(tag, headers.get(tag, "?")) for tag in SEVEN_TAG_ROSTER]
+    lines += [_tag(tag, value) for tag, value in headers.items() if tag not in SEVEN_TAG_ROSTER]
+    lines.append("")
+
+    fields = fen.split()
+    number = int(fields[5]) if len(fields) > 5 else 1
+    white = fields[1] == 'w' if len(fields) > 1 else True
+    tokens = []
+    for san in sans:
+        if white:
+            tokens.append(f"{number}.")
+        elif not tokens:
+            tokens.append(f"{number}...")
+        tokens.append(san)
+        if not white:
+            number += 1
+        white = not white
+    tokens.append(result)
+
+    line = ""
+    for token in tokens:
+        if line and len(line) + 1 + len(token) > LINE_LENGTH:
+            lines.append(line)
+            line = token
+        else:
+            line = f"{line} {token}" if line else token
+    lines.append(line)
+    return "\n".join(lines) + "\n\n"
+
+
+def _read_stored(path):
+    """Yield gamefile.Game records from a binary game file or selfplay JSON lines."""
+    if path.endswith(".jsonl"):
+        with open(path) as f:
+            for line in f:
+                yield game_from_record(json.loads(line))
+    else:
+        with GameReader(path) as reader:
+            yield from reader
+
+
+def _report(action, games, moves, errors, started):
+    elapsed = time.perf_counter() - started
+    print(f"{action} {games} games  {moves} moves  {elapsed:.2f}s  "
+          f"{games / elapsed if elapsed > 0 else 0:,.0f} games/s  "
+          f"{moves / elapsed if elapsed > 0 else 0:,.0f} moves/s  errors {errors}", file=sys.stderr)
+
+
+def import_games(source, writer=None):
+    """Replay every game of a PGN file, optionally storing it; return (games, moves, errors)."""
+    games = moves = errors = 0
+    started = time.perf_counter()
+    for game in read_games(source):
+        try:
+            fen, uci = replay(game)
+        except (ValueError, IndexError, KeyError) as e:
+            errors += 1
+            print(f"game {games + errors}: {e}", file=sys.stderr)
+            continue
+        games += 1
+        moves += len(uci)
+        if writer is not None:
+            result = game.result if game.result in RESULTS[:3] else "*"
+            writer.write(Game(result, fen, game.headers.get("White", ""), game.headers.get("Black", ""), uci))
+    _report("imported", games, moves, errors, started)
+    return games, moves, errors
+
+
+def export_games(path, out):
+    """Write every stored game as PGN; return (games, moves, errors)."""
+    games = moves = 0
+    started = time.perf_counter()
+    errors = 0
+    for game in _read_stored(path):
+        try:
+            sans = san_moves(game.fen, game.moves)
+        except (ValueError, IndexError, KeyError) as e:
+            errors += 1
+            print(f"game {games + errors}: {e}", file=sys.stderr)
+            continue
+        games += 1
+        moves += len(sans)
+        headers = {"Event": "Self-play", "Round": str(games), "White": game.white, "Black": game.black}
+        out.write(format_game(headers, sans, game.result, game.fen))
+    _report("exported", games, moves, errors, started)
+    return games, moves, errors
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Read and write PGN, reporting throughput")
+    commands = parser.add_subparsers(dest="command", required=True)
+    importer = commands.add_parser("import", help="parse and replay a PGN file")
+    importer.add_argument("input", help="PGN file, or - for stdin")
+    importer.add_argument("-o", "--output", help="append the games to a gamefile.py binary file")
+    exporter = commands.add_parser("export", help="write stored games as PGN")
+    exporter.add_argument("input", help="gamefile.py binary file or selfplay.py .jsonl")
+    exporter.add_argument("-o", "--output", help="PGN file (default: stdout)")
+    args = parser.parse_args(argv)
+
+    if args.command == "import":
+        source = sys.stdin if args.input == "-" else open(args.input, encoding="utf-8", errors="replace")
+        writer = GameWriter(args.output) if args.output else None
+        try:
+            errors = import_games(source, writer)[2]
+        finally:
+            if source is not sys.stdin:
+                source.close()
+            if writer is not None:
+                writer.close()
+        return 1 if errors else 0
+
+    out = open(args.output, "w") if args.output else sys.stdout
+    try:
+        errors = export_games(args.input, out)[2]
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    return 1 if errors else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
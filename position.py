@@ -0,0 +1,153 @@
+# Compact position record for holding many positions in memory. The squares
+# are a 64-byte bytearray of small piece codes and the side to move, castle
+# rights, en passant square and clocks are packed into one int, so a copy is
+# a single bytes copy and a position costs under 200 bytes instead of the
+# 1.5 KB of a board of nested lists plus its rights and state dicts.
+# Adapters convert to and from the board/rights/state form the rest of the
+# project uses.
+
+from itertools import chain
+
+from bitboard import PIECE_KINDS
+from rules import (
+    board_to_fen,
+    fen_to_board,
+    generate_all_legal_moves,
+    initial_board,
+    make_move,
+    new_castle_rights,
+    new_game_state,
+    pack_castle_rights,
+    parse_uci_move,
+    unpack_castle_rights,
+)
+
+# Square codes: 0 empty, 1-6 White pawn..king, 7-12 Black pawn..king, in
+# bitboard.PIECE_KINDS order. Squares are row * 8 + col, so square 0 is a8.
+PIECES = [""] + [f"{color}_{kind}" for color in "wb" for kind in PIECE_KINDS]
+PIECE_CODES = {piece: code for code, piece in enumerate(PIECES)}
+
+# Packed info bits: side to move, castle rights as in rules.pack_castle_rights,
+# en passant square + 1 (0 for none), halfmove clock, then the fullmove number
+TURN_BIT = 1
+CASTLE_SHIFT, CASTLE_MASK = 1, 0xF
+EP_SHIFT, EP_MASK = 5, 0x7F
+HALFMOVE_SHIFT, HALFMOVE_MASK = 12, 0x3FF
+FULLMOVE_SHIFT = 22
+
+
+def pack_info(turn, castle_bits, ep_square, halfmove, fullmove):
+    """Pack the non-board parts of a position into one int."""
+    if not 0 <= halfmove <= HALFMOVE_MASK:
+        raise ValueError(f"halfmove clock out of range: {halfmove}")
+    ep = ep_square[0] * 8 + ep_square[1] + 1 if ep_square else 0
+    return ((turn == 'b') | castle_bits << CASTLE_SHIFT | ep << EP_SHIFT
+            | halfmove << HALFMOVE_SHIFT | fullmove << FULLMOVE_SHIFT)
+
+
+class Position:
+    """A board, side to move, castle rights, en passant square and clocks."""
+
+    __slots__ = ("squares", "info")
+
+    def __init__(self, squares, info):
+        self.squares = squares
+        self.info = info
+
+    @classmethod
+    def from_board(cls, board, turn='w', rights=None, state=None):
+        """Position for a board of piece strings; rights and state default to a fresh game."""
+        rights = new_castle_rights() if rights is None else rights
+        state = new_game_state() if state is None else state
+        squares = bytearray(map(PIECE_CODES.__getitem__, chain.from_iterable(board)))
+        return cls(squares, pack_info(turn, pack_castle_rights(rights), state['ep_square'],
+                                      state['halfmove'], state['fullmove']))
+
+    @classmethod
+    def from_fen(cls, fen):
+        board, turn, rights, ep_square, halfmove, fullmove = fen_to_board(fen)
+        return cls.from_board(board, turn, rights, new_game_state(ep_square, halfmove, fullmove))
+
+    @classmethod
+    def initial(cls):
+        return cls.from_board(initial_board)
+
+    @property
+    def turn(self):
+        return 'b' if self.info & TURN_BIT else 'w'
+
+    @property
+    def castle_bits(self):
+        return self.info >> CASTLE_SHIFT & CASTLE_MASK
+
+    @property
+    def ep_square(self):
+        ep = self.info >> EP_SHIFT & EP_MASK
+        return divmod(ep - 1, 8) if ep else None
+
+    @property
+    def halfmove(self):
+        return self.info >> HALFMOVE_SHIFT & HALFMOVE_MASK
+
+    @property
+    def fullmove(self):
+        return self.info >> FULLMOVE_SHIFT
+
+    def piece_at(self, row, col):
+        return PIECES[self.squares[row * 8 + col]]
+
+    def board(self):
+        """A new board of nested lists for the string-based rules functions."""
+        pieces = list(map(PIECES.__getitem__, self.squares))
+        return [pieces[row:row + 8] for row in range(0, 64, 8)]
+
+    def rights(self):
+        """A new castle rights dict."""
+        rights = new_castle_rights()
+        unpack_castle_rights(self.castle_bits, rights)
+        return rights
+
+    def state(self):
+        """A new game state dict with the en passant square and clocks."""
+        return new_game_state(self.ep_square, self.halfmove, self.fullmove)
+
+    def unpack(self):
+        """(board, turn, rights, state), ready for rules.make_move and friends."""
+        return self.board(), self.turn, self.rights(), self.state()
+
+    def fen(self):
+        return board_to_fen(*self.unpack())
+
+    def legal_moves(self):
+        """[(start_pos, end_pos), ...] for the side to move."""
+        return generate_all_legal_moves(self.board(), self.turn, self.rights(), self.ep_square)
+
+    def after(self, move):
+        """New Position after a UCI move, which must be legal."""
+        board, turn, rights, state = self.unpack()
+        start, end, promotion = parse_uci_move(move)
+        make_move(board, start, end, promotion, rights, state)
+        return Position.from_board(board, 'b' if turn == 'w' else 'w', rights, state)
+
+    def copy(self):
+        return Position(bytearray(self.squares), self.info)
+
+    def to_bytes(self):
+        """72 bytes: the squares, then info as a little-endian u64."""
+        return bytes(self.squares) + self.info.to_bytes(8, "little")
+
+    @classmethod
+    def from_bytes(cls, data):
+        return cls(bytearray(data[:64]), int.from_bytes(data[64:72], "little"))
+
+    def __eq__(self, other):
+        if not isinstance(other, Position):
+            return NotImplemented
+        return self.info == other.info and self.squares == other.squares
+
+    def __hash__(self):
+        # Changes if the squares are edited, so do not mutate positions used as keys
+        return hash((bytes(self.squares), self.info))
+
+    def __repr__(self):
+        return f"Position({self.fen()!r})"
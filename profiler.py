@@ -0,0 +1,173 @@
+# Low-overhead instrumentation: call counts and timings for hot functions,
+# plus frame-time percentiles from the GUI loop. Functions are wrapped only
+# while profiling is enabled and disable() puts the originals back, so a
+# switched-off profiler costs nothing.
+# Usage:
+#   CHESS_PROFILE=1 python main.py       start the GUI with profiling on (F3 toggles it)
+#   python profiler.py profile.json      print a profile dumped by the GUI
+
+import argparse
+import functools
+import json
+import math
+import os
+import sys
+import time
+from collections import deque
+
+import rules
+
+# Frame times kept for the percentiles, about ten seconds at 60 FPS
+FRAME_HISTORY = 600
+HUD_ROWS = 6
+
+
+def percentile(values, fraction):
+    """Nearest-rank percentile of a non-empty sequence."""
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(fraction * len(ordered)) - 1)]
+
+
+class Profiler:
+    """Counters and timings for registered functions and for frames."""
+
+    def __init__(self, frame_history=FRAME_HISTORY):
+        self.enabled = False
+        # (owner, attribute, label) for every function to wrap when enabled
+        self.targets = []
+        # (namespace, name, original) for every binding replaced by a wrapper
+        self.patched = []
+        # label -> [calls, total ns, max ns]
+        self.calls = {}
+        self.frames = deque(maxlen=frame_history)
+        self.started = time.perf_counter()
+
+    def add(self, owner, name, label=None):
+        """Time owner.name (a module function or a class method) while enabled."""
+        label = label or name
+        self.targets.append((owner, name, label))
+        self.calls.setdefault(label, [0, 0, 0])
+        if self.enabled:
+            self._patch(owner, name, label)
+
+    def _patch(self, owner, name, label):
+        original = getattr(owner, name)
+        wrapper = self._wrap(original, self.calls[label])
+        namespaces = [owner]
+        if not isinstance(owner, type):
+            # Modules that did "from rules import ..." hold their own reference
+            namespaces += [module for module in list(sys.modules.values()) if module is not owner]
+        for namespace in namespaces:
+            for attribute, value in list(vars(namespace).items()):
+                if value is original:
+                    setattr(namespace, attribute, wrapper)
+                    self.patched.append((namespace, attribute, original))
+
+    @staticmethod
+    def _wrap(function, stats):
+        perf = time.perf_counter_ns
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            started = perf()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                elapsed = perf() - started
+                stats[0] += 1
+                stats[1] += elapsed
+                if elapsed > stats[2]:
+                    stats[2] = elapsed
+        return wrapper
+
+    def enable(self):
+        if self.enabled:
+            return
+        self.enabled = True
+        self.reset()
+        for owner, name, label in self.targets:
+            self._patch(owner, name, label)
+
+    def disable(self):
+        if not self.enabled:
+            return
+        self.enabled = False
+        for namespace, attribute, original in reversed(self.patched):
+            setattr(namespace, attribute, original)
+        self.patched = []
+
+    def reset(self):
+        for stats in self.calls.values():
+            # Wrappers hold these lists, so clear them in place
+            stats[:] = [0, 0, 0]
+        self.frames.clear()
+        self.started = time.perf_counter()
+
+    def frame(self, seconds):
+        """Record the work time of one frame of the main loop."""
+        if self.enabled:
+            self.frames.append(seconds)
+
+    def snapshot(self):
+        """Everything collected so far as a JSON-ready dict."""
+        frames = {"count": len(self.frames)}
+        if self.frames:
+            frames.update({f"p{round(fraction * 100)}_ms": round(percentile(self.frames, fraction) * 1000, 3)
+                           for fraction in (0.5, 0.95, 0.99)})
+            frames["max_ms"] = round(max(self.frames) * 1000, 3)
+        calls = {}
+        for label, (count, total, longest) in self.calls.items():
+            calls[label] = {
+                "calls": count,
+                "total_ms": round(total / 1e6, 3),
+                "mean_us": round(total / count / 1e3, 2) if count else 0.0,
+                "max_ms": round(longest / 1e6, 3),
+            }
+        return {"elapsed": round(time.perf_counter() - self.started, 3), "frames": frames, "calls": calls}
+
+    def dump(self, path):
+        """Write snapshot() to path, replacing it atomically."""
+        temp = path + ".tmp"
+        with open(temp, "w") as f:
+            json.dump(self.snapshot(), f, indent=2)
+        os.replace(temp, path)
+
+    def summary_lines(self, rows=HUD_ROWS):
+        """Short text lines for an on-screen overlay, slowest functions first."""
+        snapshot = self.snapshot()
+        frames = snapshot["frames"]
+        lines = []
+        if frames["count"]:
+            lines.append(f"frame p50 {frames['p50_ms']:.1f}ms  p95 {frames['p95_ms']:.1f}ms  "
+                         f"p99 {frames['p99_ms']:.1f}ms  max {frames['max_ms']:.1f}ms")
+        ranked = sorted(snapshot["calls"].items(), key=lambda item: -item[1]["total_ms"])
+        for label, stats in ranked[:rows]:
+            if stats["calls"]:
+                lines.append(f"{label} {stats['calls']}x  {stats['total_ms']:.0f}ms  "
+                             f"avg {stats['mean_us']:.0f}us  max {stats['max_ms']:.1f}ms")
+        return lines
+
+
+profiler = Profiler()
+for _name in ("generate_legal_moves", "generate_all_legal_moves", "is_checkmate", "is_king_in_check"):
+    profiler.add(rules, _name)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Print a profile written by the GUI")
+    parser.add_argument("path", help="JSON file from Profiler.dump")
+    args = parser.parse_args(argv)
+
+    with open(args.path) as f:
+        snapshot = json.load(f)
+    frames = snapshot["frames"]
+    print(f"elapsed {snapshot['elapsed']:.1f}s  frames {frames['count']}"
+          + ("".join(f"  {key} {value}" for key, value in frames.items() if key != "count")))
+    print(f"{'function':<28}{'calls':>10}{'total ms':>12}{'mean us':>10}{'max ms':>10}")
+    for label, stats in sorted(snapshot["calls"].items(), key=lambda item: -item[1]["total_ms"]):
+        print(f"{label:<28}{stats['calls']:>10}{stats['total_ms']:>12.1f}{stats['mean_us']:>10.1f}{stats['max_ms']:>10.2f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
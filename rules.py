@@ -0,0 +1,612 @@
+# Chess rules: board state, move validation, checkmate and FEN.
+# This module must not import pygame so it can be used headless.
+
+from collections import OrderedDict, namedtuple
+
+import bitboard
+
+# Backends for generate_legal_moves: "bitboard" is the fast default and
+# "list" is the original square-by-square scan, kept as a reference.
+MOVE_GENERATORS = ("bitboard", "list")
+move_generator = "bitboard"
+
+# Initialize board template
+initial_board = [
+    ["b_rook", "b_knight", "b_bishop", "b_queen", "b_king", "b_bishop", "b_knight", "b_rook"],
+    ["b_pawn", "b_pawn", "b_pawn", "b_pawn", "b_pawn", "b_pawn", "b_pawn", "b_pawn"],
+    ["", "", "", "", "", "", "", ""],
+    ["", "", "", "", "", "", "", ""],
+    ["", "", "", "", "", "", "", ""],
+    ["", "", "", "", "", "", "", ""],
+    ["w_pawn", "w_pawn", "w_pawn", "w_pawn", "w_pawn", "w_pawn", "w_pawn", "w_pawn"],
+    ["w_rook", "w_knight", "w_bishop", "w_queen", "w_king", "w_bishop", "w_knight", "w_rook"]
+]
+
+# initial_board with White to move and every castle right
+START_FEN = "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1"
+
+
+def new_castle_rights():
+    """Return castle rights for a fresh game."""
+    return {
+        'w_kingside': True,
+        'w_queenside': True,
+        'b_kingside': True,
+        'b_queenside': True,
+    }
+
+
+# Castling state flags
+castle_rights = new_castle_rights()
+CASTLE_FLAGS = ('w_kingside', 'w_queenside', 'b_kingside', 'b_queenside')
+
+
+def pack_castle_rights(rights):
+    """Pack castle rights into a 4-bit int, one bit per CASTLE_FLAGS entry."""
+    bits = 0
+    for i, flag in enumerate(CASTLE_FLAGS):
+        if rights[flag]:
+            bits |= 1 << i
+    return bits
+
+
+def unpack_castle_rights(bits, rights):
+    """Write packed castle rights back into a rights dict."""
+    for i, flag in enumerate(CASTLE_FLAGS):
+        rights[flag] = bool(bits >> i & 1)
+
+
+def new_game_state(ep_square=None, halfmove=0, fullmove=1):
+    """Return the en passant square, move clocks and king squares for a position.
+
+    The king squares start unknown; find_king fills them in on first use and
+    make_move/unmake_move keep them up to date.
+    """
+    return {'ep_square': ep_square, 'halfmove': halfmove, 'fullmove': fullmove,
+            'w_king': None, 'b_king': None}
+
+
+# En passant square and move clocks, kept alongside castle_rights
+game_state = new_game_state()
+
+
+def is_path_clear(board, squares):
+    """Return True if all squares are empty."""
+    for r, c in squares:
+        if board[r][c] != "":
+            return False
+    return True
+
+
+def is_castle_path_safe(board, color, squares, king_pos):
+    """Check that the king on king_pos does not pass through check when castling."""
+    kr, kc = king_pos
+    for r, c in squares:
+        backup = board[r][c]
+        board[kr][kc] = ""
+        board[r][c] = f"{color}_king"
+        safe = not is_king_in_check(board, color, (r, c))
+        board[r][c] = backup
+        board[kr][kc] = f"{color}_king"
+        if not safe:
+            return False
+    return True
+
+
+def is_valid_move(board, piece, start_pos, end_pos, check_castle=True, rights=None, ep_square=None):
+    if rights is None:
+        rights = castle_rights
+    sr, sc = start_pos
+    er, ec = end_pos
+    dr, dc = er - sr, ec - sc
+
+    if sr == er and sc == ec:
+        return False
+
+    target = board[er][ec]
+    if target and target[0] == piece[0]:
+        return False
+
+    kind = piece[2:]
+
+    if kind == "pawn":
+        direction = -1 if piece.startswith("w") else 1
+        start_row = 6 if piece.startswith("w") else 1
+
+        if sc == ec:
+            if dr == direction and board[er][ec] == "":
+                return True
+            if sr == start_row and dr == 2 * direction and board[sr + direction][sc] == "" and board[er][ec] == "":
+                return True
+        elif abs(sc - ec) == 1 and dr == direction and (board[er][ec] != "" or end_pos == ep_square):
+            return True
+
+    elif kind == "rook":
+        if sr == er or sc == ec:
+            if sr == er:
+                step = 1 if ec > sc else -1
+                for c in range(sc + step, ec, step):
+                    if board[sr][c] != "":
+                        return False
+            else:
+                step = 1 if er > sr else -1
+                for r in range(sr + step, er, step):
+                    if board[r][sc] != "":
+                        return False
+            return True
+
+    elif kind == "knight":
+        return (abs(dr), abs(dc)) in [(2, 1), (1, 2)]
+
+    elif kind == "bishop":
+        if abs(dr) == abs(dc):
+            r_step = 1 if dr > 0 else -1
+            c_step = 1 if dc > 0 else -1
+            for i in range(1, abs(dr)):
+                if board[sr + i * r_step][sc + i * c_step] != "":
+                    return False
+            return True
+
+    elif kind == "queen":
+        return (
+            is_valid_move(board, piece[0] + "_rook", start_pos, end_pos, check_castle, rights)
+            or is_valid_move(board, piece[0] + "_bishop", start_pos, end_pos, check_castle, rights)
+        )
+
+    elif kind == "king":
+        if max(abs(dr), abs(dc)) == 1:
+            return True
+        # Castling logic
+        color = piece[0]
+        if check_castle and not is_king_in_check(board, color, start_pos):
+            if color == 'w' and sr == 7 and sc == 4 and er == 7:
+                # White castling
+                if ec == 6 and rights['w_kingside']:
+                    path = [(7,5), (7,6)]
+                    return is_path_clear(board, path) and is_castle_path_safe(board, color, path, start_pos)
+                if ec == 2 and rights['w_queenside']:
+                    path = [(7,3), (7,2)]
+                    return is_path_clear(board, [(7,1), (7,2), (7,3)]) and is_castle_path_safe(board, color, path, start_pos)
+            elif color == 'b' and sr == 0 and sc == 4 and er == 0:
+                # Black castling
+                if ec == 6 and rights['b_kingside']:
+                    path = [(0,5), (0,6)]
+                    return is_path_clear(board, path) and is_castle_path_safe(board, color, path, start_pos)
+                if ec == 2 and rights['b_queenside']:
+                    path = [(0,3), (0,2)]
+                    return is_path_clear(board, [(0,1), (0,2), (0,3)]) and is_castle_path_safe(board, color, path, start_pos)
+
+    return False
+
+# Directions checked when looking outward from a king for attackers
+ORTHOGONAL_DIRECTIONS = ((-1, 0), (1, 0), (0, -1), (0, 1))
+DIAGONAL_DIRECTIONS = ((-1, -1), (-1, 1), (1, -1), (1, 1))
+KNIGHT_OFFSETS = ((2, 1), (1, 2), (-1, 2), (-2, 1), (-2, -1), (-1, -2), (1, -2), (2, -1))
+
+def find_king(board, color, state=None):
+    """Return the square of color's king, or None if it is not on the board.
+
+    A state dict from new_game_state holds the king squares of its position:
+    the square recorded there is tried first and a scan's result is saved.
+    """
+    king = color + "_king"
+    if state is not None:
+        pos = state.get(king)
+        if pos and board[pos[0]][pos[1]] == king:
+            return pos
+    for r, row in enumerate(board):
+        if king in row:
+            pos = (r, row.index(king))
+            if state is not None:
+                state[king] = pos
+            return pos
+    return None
+
+
+def find_attackers(board, color, pos, first_only=False):
+    """Return squares of enemy pieces attacking pos, looking outward from pos."""
+    opponent = 'b' if color == 'w' else 'w'
+    kr, kc = pos
+    attackers = []
+
+    for directions, slider in ((ORTHOGONAL_DIRECTIONS, "_rook"), (DIAGONAL_DIRECTIONS, "_bishop")):
+        for dr, dc in directions:
+            r, c = kr + dr, kc + dc
+            distance = 1
+            while 0 <= r < 8 and 0 <= c < 8:
+                piece = board[r][c]
+                if piece:
+                    if piece[0] == opponent and (
+                        piece.endswith(slider) or piece.endswith("_queen")
+                        or (distance == 1 and piece.endswith("_king"))
+                    ):
+                        attackers.append((r, c))
+                        if first_only:
+                            return attackers
+                    break
+                r, c = r + dr, c + dc
+                distance += 1
+
+    knight = opponent + "_knight"
+    for dr, dc in KNIGHT_OFFSETS:
+        r, c = kr + dr, kc + dc
+        if 0 <= r < 8 and 0 <= c < 8 and board[r][c] == knight:
+            attackers.append((r, c))
+            if first_only:
+                return attackers
+
+    # Enemy pawns attack towards our side of the board
+    pawn = opponent + "_pawn"
+    r = kr - 1 if color == 'w' else kr + 1
+    if 0 <= r < 8:
+        for c in (kc - 1, kc + 1):
+            if 0 <= c < 8 and board[r][c] == pawn:
+                attackers.append((r, c))
+                if first_only:
+                    return attackers
+    return attackers
+
+
+def is_king_in_check(board, color, king_pos=None, state=None):
+    if king_pos is None:
+        king_pos = find_king(board, color, state)
+    if not king_pos:
+        return True
+    return bool(find_attackers(board, color, king_pos, first_only=True))
+
+
+def _build_attack_map(board, color, state=None):
+    king_pos = find_king(board, color, state)
+    if not king_pos:
+        return None, (), {}
+    checkers = tuple(find_attackers(board, color, king_pos))
+    kr, kc = king_pos
+    pins = {}
+    for directions, slider in ((ORTHOGONAL_DIRECTIONS, "_rook"), (DIAGONAL_DIRECTIONS, "_bishop")):
+        for dr, dc in directions:
+            r, c = kr + dr, kc + dc
+            shield = None
+            while 0 <= r < 8 and 0 <= c < 8:
+                piece = board[r][c]
+                if piece:
+                    if piece[0] == color:
+                        if shield:
+                            break
+                        shield = (r, c)
+                    else:
+                        if shield and (piece.endswith(slider) or piece.endswith("_queen")):
+                            pins[shield] = (dr, dc)
+                        break
+                r, c = r + dr, c + dc
+    return king_pos, checkers, pins
+
+
+# Attack maps of recent positions keyed by (Zobrist hash, color), least
+# recently used first
+ATTACK_MAP_CACHE_SIZE = 256
+_attack_maps = OrderedDict()
+
+
+def attack_map(board, color, key=None, state=None):
+    """Return (king_pos, checkers, pins) for color.
+
+    checkers holds the squares of enemy pieces giving check and pins maps the
+    square of each pinned piece to the (dr, dc) direction of its pin ray.
+    key is the position's Zobrist hash (see zobrist.py); with it the map is
+    cached, otherwise it is built on every call.
+    """
+    if key is None:
+        return _build_attack_map(board, color, state)
+    result = _attack_maps.get((key, color))
+    if result is None:
+        result = _build_attack_map(board, color, state)
+        _attack_maps[key, color] = result
+        if len(_attack_maps) > ATTACK_MAP_CACHE_SIZE:
+            _attack_maps.popitem(last=False)
+    else:
+        _attack_maps.move_to_end((key, color))
+    return result
+
+
+FEN_PIECES = {
+    "w_pawn": "P",
+    "w_rook": "R",
+    "w_knight": "N",
+    "w_bishop": "B",
+    "w_queen": "Q",
+    "w_king": "K",
+    "b_pawn": "p",
+    "b_rook": "r",
+    "b_knight": "n",
+    "b_bishop": "b",
+    "b_queen": "q",
+    "b_king": "k",
+}
+FEN_TO_PIECE = {letter: piece for piece, letter in FEN_PIECES.items()}
+
+
+def board_to_fen(board, turn, rights, state=None):
+    """Full FEN, including the en passant square and move clocks from state."""
+    if state is None:
+        state = game_state
+    mapping = FEN_PIECES
+    rows = []
+    for row in board:
+        empty = 0
+        fen_row = ""
+        for cell in row:
+            if cell == "":
+                empty += 1
+            else:
+                if empty:
+                    fen_row += str(empty)
+                    empty = 0
+                fen_row += mapping[cell]
+        if empty:
+            fen_row += str(empty)
+        rows.append(fen_row)
+    fen = "/".join(rows)
+    fen += f" {'w' if turn == 'w' else 'b'} "
+    castle = ""
+    if rights['w_kingside']:
+        castle += "K"
+    if rights['w_queenside']:
+        castle += "Q"
+    if rights['b_kingside']:
+        castle += "k"
+    if rights['b_queenside']:
+        castle += "q"
+    if castle == "":
+        castle = "-"
+    ep_square = state['ep_square']
+    ep = f"{chr(97 + ep_square[1])}{8 - ep_square[0]}" if ep_square else "-"
+    fen += f"{castle} {ep} {state['halfmove']} {state['fullmove']}"
+    return fen
+
+
+def fen_to_board(fen):
+    """Parse a FEN string into (board, turn, rights, ep_square, halfmove, fullmove)."""
+    fields = fen.split()
+    board = []
+    for fen_row in fields[0].split("/"):
+        row = []
+        for ch in fen_row:
+            if ch.isdigit():
+                row.extend([""] * int(ch))
+            else:
+                row.append(FEN_TO_PIECE[ch])
+        board.append(row)
+    turn = fields[1] if len(fields) > 1 else 'w'
+    castle = fields[2] if len(fields) > 2 else "-"
+    rights = {
+        'w_kingside': "K" in castle,
+        'w_queenside': "Q" in castle,
+        'b_kingside': "k" in castle,
+        'b_queenside': "q" in castle,
+    }
+    ep = fields[3] if len(fields) > 3 else "-"
+    ep_square = None if ep == "-" else (8 - int(ep[1]), ord(ep[0]) - 97)
+    halfmove = int(fields[4]) if len(fields) > 4 else 0
+    fullmove = int(fields[5]) if len(fields) > 5 else 1
+    return board, turn, rights, ep_square, halfmove, fullmove
+
+
+def parse_uci_move(move):
+    sr = 8 - int(move[1])
+    sc = ord(move[0]) - 97
+    er = 8 - int(move[3])
+    ec = ord(move[2]) - 97
+    promotion = move[4] if len(move) == 5 else None
+    return (sr, sc), (er, ec), promotion
+
+
+# UCI promotion letters and the piece names they stand for
+PROMOTION_NAMES = {'q': 'queen', 'r': 'rook', 'b': 'bishop', 'n': 'knight'}
+PROMOTION_LETTERS = {name: letter for letter, name in PROMOTION_NAMES.items()}
+
+
+def to_uci_move(start_pos, end_pos, promotion=None):
+    """Inverse of parse_uci_move."""
+    move = f"{chr(97 + start_pos[1])}{8 - start_pos[0]}{chr(97 + end_pos[1])}{8 - end_pos[0]}"
+    return move + promotion if promotion else move
+
+
+def undo_to_uci(undo):
+    """UCI text for a move played with make_move, from its Undo record."""
+    promotion = PROMOTION_LETTERS[undo.placed[2:]] if undo.placed != undo.piece else None
+    return to_uci_move(undo.start, undo.end, promotion)
+
+def set_move_generator(name):
+    """Select the backend used by generate_legal_moves."""
+    global move_generator
+    if name not in MOVE_GENERATORS:
+        raise ValueError(f"Unknown move generator: {name}")
+    move_generator = name
+
+
+def generate_legal_moves(board, piece, start_pos, rights=None, ep_square=None):
+    if rights is None:
+        rights = castle_rights
+    if move_generator == "bitboard":
+        return bitboard.generate_legal_moves(board, piece, start_pos, rights, ep_square)
+    return _list_legal_moves(board, piece, start_pos, rights, ep_square, attack_map(board, piece[0]))
+
+
+def _list_legal_moves(board, piece, start_pos, rights, ep_square, attacks):
+    """The "list" backend; attacks is attack_map() for the side to move."""
+    moves = []
+    sr, sc = start_pos
+    color = piece[0]
+    is_king = piece.endswith("king")
+    king_pos, checkers, pins = attacks
+    pin = pins.get(start_pos)
+    scratch_rights = dict(rights)
+    scratch_state = new_game_state(ep_square)
+    for r in range(8):
+        for c in range(8):
+            if is_valid_move(board, piece, start_pos, (r, c), rights=rights, ep_square=ep_square):
+                # En passant removes a pawn beside the king's rank, so always test it
+                ep_capture = piece.endswith("pawn") and (r, c) == ep_square and c != sc
+                # Out of check, only king moves and pinned pieces can expose the king
+                if not checkers and not is_king and king_pos and not ep_capture:
+                    if pin is None or (r - king_pos[0]) * pin[1] == (c - king_pos[1]) * pin[0]:
+                        moves.append((r, c))
+                    continue
+                undo = make_move(board, start_pos, (r, c), None, scratch_rights, scratch_state)
+                if not is_king_in_check(board, color, (r, c) if is_king else king_pos):
+                    moves.append((r, c))
+                unmake_move(board, undo, scratch_rights, scratch_state)
+    return moves
+
+def generate_all_legal_moves(board, color, rights=None, ep_square=None):
+    """Return [(start_pos, end_pos), ...] for every legal move of color."""
+    if rights is None:
+        rights = castle_rights
+    if move_generator == "bitboard":
+        return bitboard.generate_all_legal_moves(board, color, rights, ep_square)
+    moves = []
+    attacks = attack_map(board, color)
+    for r in range(8):
+        for c in range(8):
+            piece = board[r][c]
+            if piece and piece[0] == color:
+                for move in _list_legal_moves(board, piece, (r, c), rights, ep_square, attacks):
+                    moves.append(((r, c), move))
+    return moves
+
+def is_checkmate(board, color, rights=None, ep_square=None):
+    if not is_king_in_check(board, color):
+        return False
+    return not generate_all_legal_moves(board, color, rights, ep_square)
+
+
+def is_insufficient_material(board):
+    """Return True when neither side can mate: bare kings plus at most one minor piece."""
+    minors = 0
+    for row in board:
+        for piece in row:
+            if not piece or piece.endswith("king"):
+                continue
+            if not piece.endswith(("knight", "bishop")):
+                return False
+            minors += 1
+    return minors <= 1
+
+
+# Rook home squares and the castling right each one belongs to
+ROOK_CORNERS = {
+    (7, 0): 'w_queenside',
+    (7, 7): 'w_kingside',
+    (0, 0): 'b_queenside',
+    (0, 7): 'b_kingside',
+}
+
+
+def update_castle_rights(piece, start_pos, rights=None, end_pos=None):
+    """Update castle rights when a king or rook moves, or a rook is captured."""
+    if rights is None:
+        rights = castle_rights
+    if end_pos is not None and tuple(end_pos) in ROOK_CORNERS:
+        rights[ROOK_CORNERS[tuple(end_pos)]] = False
+    sr, sc = start_pos
+    if piece == 'w_king':
+        rights['w_kingside'] = False
+        rights['w_queenside'] = False
+    elif piece == 'b_king':
+        rights['b_kingside'] = False
+        rights['b_queenside'] = False
+    elif piece == 'w_rook':
+        if sr == 7 and sc == 0:
+            rights['w_queenside'] = False
+        elif sr == 7 and sc == 7:
+            rights['w_kingside'] = False
+    elif piece == 'b_rook':
+        if sr == 0 and sc == 0:
+            rights['b_queenside'] = False
+        elif sr == 0 and sc == 7:
+            rights['b_kingside'] = False
+
+
+# Everything unmake_move needs to restore a position. rights holds the
+# packed castle rights and the last three fields are the previous state.
+Undo = namedtuple("Undo", [
+    "start", "end", "piece", "placed", "captured", "captured_pos", "rook_move",
+    "rights", "ep_square", "halfmove", "fullmove",
+])
+
+
+def make_move(board, start_pos, end_pos, promotion=None, rights=None, state=None):
+    """Play a move in place and return an Undo record for unmake_move.
+
+    promotion may be a piece kind ("knight") or a UCI letter ("n"); pawns
+    reaching the last rank become queens when it is not given. Any other
+    promotion raises ValueError before the board is touched.
+    """
+    if rights is None:
+        rights = castle_rights
+    if state is None:
+        state = game_state
+    sr, sc = start_pos
+    er, ec = end_pos
+    piece = board[sr][sc]
+    captured = board[er][ec]
+    captured_pos = end_pos
+    ep_square = None
+    is_pawn = piece.endswith("pawn")
+    placed = piece
+    if is_pawn and er in (0, 7):
+        kind = PROMOTION_NAMES.get(promotion, promotion or 'queen')
+        if kind not in PROMOTION_LETTERS:
+            raise ValueError(f"invalid promotion: {promotion!r}")
+        placed = f"{piece[0]}_{kind}"
+    if is_pawn:
+        if sc != ec and not captured:
+            # En passant: the captured pawn is beside the start square
+            captured_pos = (sr, ec)
+            captured = board[sr][ec]
+            board[sr][ec] = ""
+        elif abs(er - sr) == 2:
+            ep_square = ((sr + er) // 2, sc)
+    board[er][ec] = placed
+    board[sr][sc] = ""
+    rook_move = None
+    if piece.endswith("king") and abs(ec - sc) == 2:
+        rook_move = ((er, 7), (er, 5)) if ec == 6 else ((er, 0), (er, 3))
+        (rsr, rsc), (rer, rec) = rook_move
+        board[rer][rec] = board[rsr][rsc]
+        board[rsr][rsc] = ""
+
+    undo = Undo(start_pos, end_pos, piece, placed, captured, captured_pos, rook_move,
+                pack_castle_rights(rights), state['ep_square'], state['halfmove'], state['fullmove'])
+    update_castle_rights(piece, start_pos, rights, end_pos)
+    if piece.endswith("king"):
+        state[piece] = end_pos
+    state['ep_square'] = ep_square
+    state['halfmove'] = 0 if captured or is_pawn else state['halfmove'] + 1
+    if piece[0] == 'b':
+        state['fullmove'] += 1
+    return undo
+
+
+def unmake_move(board, undo, rights=None, state=None):
+    """Take back a move played with make_move."""
+    if rights is None:
+        rights = castle_rights
+    if state is None:
+        state = game_state
+    sr, sc = undo.start
+    er, ec = undo.end
+    board[sr][sc] = undo.piece
+    board[er][ec] = ""
+    if undo.captured:
+        board[undo.captured_pos[0]][undo.captured_pos[1]] = undo.captured
+    if undo.rook_move:
+        (rsr, rsc), (rer, rec) = undo.rook_move
+        board[rsr][rsc] = board[rer][rec]
+        board[rer][rec] = ""
+    unpack_castle_rights(undo.rights, rights)
+    if undo.piece.endswith("king"):
+        state[undo.piece] = undo.start
+    state['ep_square'] = undo.ep_square
+    state['halfmove'] = undo.halfmove
+    state['fullmove'] = undo.fullmove
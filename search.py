@@ -0,0 +1,416 @@
+# Built-in alpha-beta search, used when Stockfish is not available.
+# Iterative deepening negamax with quiescence, MVV-LVA and killer move
+# ordering and a transposition table keyed by Zobrist hash.
+
+import argparse
+import sys
+import time
+from collections import namedtuple
+
+from rules import (
+    PROMOTION_LETTERS,
+    START_FEN,
+    castle_rights,
+    fen_to_board,
+    game_state,
+    generate_all_legal_moves,
+    is_king_in_check,
+    make_move,
+    new_game_state,
+    to_uci_move,
+    unmake_move,
+)
+from zobrist import compute_hash, hash_after_move
+
+PIECE_VALUES = {"pawn": 100, "knight": 320, "bishop": 330, "rook": 500, "queen": 900, "king": 0}
+
+# Piece-square tables from White's point of view, row 0 is the 8th rank.
+# Black uses the same tables mirrored vertically.
+PIECE_SQUARE_TABLES = {
+    "pawn": [
+        0, 0, 0, 0, 0, 0, 0, 0,
+        50, 50, 50, 50, 50, 50, 50, 50,
+        10, 10, 20, 30, 30, 20, 10, 10,
+        5, 5, 10, 25, 25, 10, 5, 5,
+        0, 0, 0, 20, 20, 0, 0, 0,
+        5, -5, -10, 0, 0, -10, -5, 5,
+        5, 10, 10, -20, -20, 10, 10, 5,
+        0, 0, 0, 0, 0, 0, 0, 0,
+    ],
+    "knight": [
+        -50, -40, -30, -30, -30, -30, -40, -50,
+        -40, -20, 0, 0, 0, 0, -20, -40,
+        -30, 0, 10, 15, 15, 10, 0, -30,
+        -30, 5, 15, 20, 20, 15, 5, -30,
+        -30, 0, 15, 20, 20, 15, 0, -30,
+        -30, 5, 10, 15, 15, 10, 5, -30,
+        -40, -20, 0, 5, 5, 0, -20, -40,
+        -50, -40, -30, -30, -30, -30, -40, -50,
+    ],
+    "bishop": [
+        -20, -10, -10, -10, -10, -10, -10, -20,
+        -10, 0, 0, 0, 0, 0, 0, -10,
+        -10, 0, 5, 10, 10, 5, 0, -10,
+        -10, 5, 5, 10, 10, 5, 5, -10,
+        -10, 0, 10, 10, 10, 10, 0, -10,
+        -10, 10, 10, 10, 10, 10, 10, -10,
+        -10, 5, 0, 0, 0, 0, 5, -10,
+        -20, -10, -10, -10, -10, -10, -10, -20,
+    ],
+    "rook": [
+        0, 0, 0, 0, 0, 0, 0, 0,
+        5, 10, 10, 10, 10, 10, 10, 5,
+        -5, 0, 0, 0, 0, 0, 0, -5,
+        -5, 0, 0, 0, 0, 0, 0, -5,
+        -5, 0, 0, 0, 0, 0, 0, -5,
+        -5, 0, 0, 0, 0, 0, 0, -5,
+        -5, 0, 0, 0, 0, 0, 0, -5,
+        0, 0, 0, 5, 5, 0, 0, 0,
+    ],
+    "queen": [
+        -20, -10, -10, -5, -5, -10, -10, -20,
+        -10, 0, 0, 0, 0, 0, 0, -10,
+        -10, 0, 5, 5, 5, 5, 0, -10,
+        -5, 0, 5, 5, 5, 5, 0, -5,
+        0, 0, 5, 5, 5, 5, 0, -5,
+        -10, 5, 5, 5, 5, 5, 0, -10,
+        -10, 0, 5, 0, 0, 0, 0, -10,
+        -20, -10, -10, -5, -5, -10, -10, -20,
+    ],
+    "king": [
+        -30, -40, -40, -50, -50, -40, -40, -30,
+        -30, -40, -40, -50, -50, -40, -40, -30,
+        -30, -40, -40, -50, -50, -40, -40, -30,
+        -30, -40, -40, -50, -50, -40, -40, -30,
+        -20, -30, -30, -40, -40, -30, -30, -20,
+        -10, -20, -20, -20, -20, -20, -20, -10,
+        20, 20, 0, 0, 0, 0, 20, 20,
+        20, 30, 10, 0, 0, 10, 30, 20,
+    ],
+}
+
+# Combined material + placement score for every piece on every square
+PIECE_SQUARE_SCORES = {}
+for _kind, _table in PIECE_SQUARE_TABLES.items():
+    PIECE_SQUARE_SCORES["w_" + _kind] = [PIECE_VALUES[_kind] + v for v in _table]
+    PIECE_SQUARE_SCORES["b_" + _kind] = [
+        -(PIECE_VALUES[_kind] + _table[(7 - sq // 8) * 8 + sq % 8]) for sq in range(64)
+    ]
+
+MATE_SCORE = 100000
+MATE_THRESHOLD = MATE_SCORE - 1000
+INFINITY = 10 ** 9
+
+# Transposition table entry flags
+EXACT, LOWER, UPPER = 0, 1, 2
+
+# Nodes between clock checks; every node generates all legal moves, so
+# this keeps the overrun to a few milliseconds
+TIME_CHECK_NODES = 32
+
+# Time budget in seconds and depth cap for each difficulty level
+LEVELS = {
+    "easy": {"time": 0.2, "depth": 2},
+    "medium": {"time": 0.5, "depth": 4},
+    "hard": {"time": 1.5, "depth": 64},
+}
+
+SearchResult = namedtuple("SearchResult", ["move", "score", "depth", "nodes", "elapsed"])
+
+
+class SearchTimeout(Exception):
+    """Raised inside the search when the time budget runs out."""
+
+
+def evaluate(board):
+    """Static evaluation in centipawns from White's point of view."""
+    score = 0
+    sq = 0
+    for row in board:
+        for piece in row:
+            if piece:
+                score += PIECE_SQUARE_SCORES[piece][sq]
+            sq += 1
+    return score
+
+
+def format_report(result):
+    """One-line summary of a SearchResult."""
+    nps = result.nodes / result.elapsed if result.elapsed > 0 else 0
+    move = to_uci_move(*result.move[:2], PROMOTION_LETTERS.get(result.move[2])) if result.move else "none"
+    return (f"search: move {move}  score {result.score}  depth {result.depth}  "
+            f"nodes {result.nodes}  time {result.elapsed:.2f}s  nps {nps:,.0f}")
+
+
+class Searcher:
+    """Alpha-beta searcher that keeps its transposition table between moves."""
+
+    def __init__(self, max_tt_entries=500000):
+        self.max_tt_entries = max_tt_entries
+        self.tt = {}
+        self.stopped = False
+
+    def stop(self):
+        """Abort a search running on another thread as soon as possible."""
+        self.stopped = True
+
+    def search(self, board, turn, rights=None, state=None, time_limit=1.0, max_depth=64):
+        """Search for the best move within time_limit seconds.
+
+        Returns a SearchResult whose move is (start, end, promotion), or None
+        when the side to move has no legal moves. depth is the last finished
+        iteration; 0 means time ran out during depth 1 and move is the best
+        one found by then.
+        """
+        if rights is None:
+            rights = castle_rights
+        if state is None:
+            state = game_state
+        # Work on copies so an aborted search cannot disturb the caller
+        self.board = [row[:] for row in board]
+        self.rights = dict(rights)
+        self.state = dict(state)
+        self.turn = turn
+        self.nodes = 0
+        self.killers = [[None, None] for _ in range(max_depth + 64)]
+        self.path = []
+        self.stopped = False
+        # (score, move) of the best root move searched so far
+        self.root_best = None
+        if len(self.tt) > self.max_tt_entries:
+            self.tt.clear()
+
+        started = time.perf_counter()
+        self.deadline = started + time_limit
+        key = compute_hash(self.board, turn, self.rights, self.state['ep_square'])
+        best = SearchResult(None, 0, 0, 0, 0.0)
+        for depth in range(1, max_depth + 1):
+            try:
+                score, move = self._root(depth, key)
+            except SearchTimeout:
+                if best.move is None and self.root_best:
+                    # Out of time inside depth 1: play its best move so far
+                    score, move = self.root_best
+                    best = SearchResult(move, score, 0, self.nodes, 0.0)
+                break
+            best = SearchResult(move, score, depth, self.nodes, time.perf_counter() - started)
+            if move is None or abs(score) >= MATE_THRESHOLD:
+                break
+            if time.perf_counter() - started > time_limit / 2:
+                break
+        return best._replace(nodes=self.nodes, elapsed=time.perf_counter() - started)
+
+    def _moves(self):
+        moves = []
+        board = self.board
+        for start, end in generate_all_legal_moves(board, self.turn, self.rights, self.state['ep_square']):
+            piece = board[start[0]][start[1]]
+            if piece.endswith("pawn") and end[0] in (0, 7):
+                for promotion in ("queen", "knight", "rook", "bishop"):
+                    moves.append((start, end, promotion))
+            else:
+                moves.append((start, end, None))
+        return moves
+
+    def _capture_score(self, move):
+        """MVV-LVA score, or -1 for quiet moves."""
+        start, end, promotion = move
+        board = self.board
+        victim = board[end[0]][end[1]]
+        attacker = board[start[0]][start[1]]
+        score = -1
+        if victim:
+            score = PIECE_VALUES[victim[2:]] * 10 - PIECE_VALUES[attacker[2:]] // 10
+        elif attacker.endswith("pawn") and start[1] != end[1]:
+            score = PIECE_VALUES["pawn"] * 10 - PIECE_VALUES["pawn"] // 10
+        if promotion:
+            score = max(score, 0) + PIECE_VALUES[promotion]
+        return score
+
+    def _order(self, moves, tt_move, ply):
+        killers = self.killers[ply]
+
+        def key(move):
+            if move == tt_move:
+                return 10 ** 7
+            capture = self._capture_score(move)
+            if capture >= 0:
+                return 10 ** 5 + capture
+            if move == killers[0]:
+                return 9000
+            if move == killers[1]:
+                return 8000
+            return 0
+
+        moves.sort(key=key, reverse=True)
+        return moves
+
+    def _play(self, move):
+        undo = make_move(self.board, move[0], move[1], move[2], self.rights, self.state)
+        self.turn = 'b' if self.turn == 'w' else 'w'
+        return undo
+
+    def _undo(self, undo):
+        unmake_move(self.board, undo, self.rights, self.state)
+        self.turn = 'b' if self.turn == 'w' else 'w'
+
+    def _evaluate(self):
+        score = evaluate(self.board)
+        return score if self.turn == 'w' else -score
+
+    def _tick(self):
+        self.nodes += 1
+        if self.nodes % TIME_CHECK_NODES == 0 and (self.stopped or time.perf_counter() > self.deadline):
+            raise SearchTimeout()
+
+    def _root(self, depth, key):
+        entry = self.tt.get(key)
+        moves = self._order(self._moves(), entry[3] if entry else None, 0)
+        if not moves:
+            return 0, None
+        self.path.append(key)
+        alpha, best_move = -INFINITY, moves[0]
+        if self.root_best is None:
+            # Ordered first: the previous best, a capture or a promotion
+            self.root_best = (0, best_move)
+        try:
+            for move in moves:
+                undo = self._play(move)
+                child = hash_after_move(key, undo, self.rights, self.state['ep_square'])
+                try:
+                    score = -self._negamax(depth - 1, -INFINITY, -alpha, 1, child)
+                finally:
+                    self._undo(undo)
+                if score > alpha:
+                    alpha, best_move = score, move
+                    if depth == 1:
+                        self.root_best = (alpha, best_move)
+        finally:
+            self.path.pop()
+        self.tt[key] = (depth, alpha, EXACT, best_move)
+        return alpha, best_move
+
+    def _negamax(self, depth, alpha, beta, ply, key):
+        self._tick()
+        if key in self.path:
+            return 0
+        if depth <= 0:
+            return self._quiesce(alpha, beta)
+
+        entry = self.tt.get(key)
+        tt_move = None
+        if entry:
+            tt_depth, tt_score, flag, tt_move = entry
+            if tt_depth >= depth:
+                tt_score = _score_from_tt(tt_score, ply)
+                if flag == EXACT:
+                    return tt_score
+                if flag == LOWER and tt_score >= beta:
+                    return tt_score
+                if flag == UPPER and tt_score <= alpha:
+                    return tt_score
+
+        moves = self._moves()
+        if not moves:
+            if is_king_in_check(self.board, self.turn, state=self.state):
+                return -MATE_SCORE + ply
+            return 0
+
+        original_alpha = alpha
+        best_score, best_move = -INFINITY, None
+        self.path.append(key)
+        try:
+            for move in self._order(moves, tt_move, ply):
+                undo = self._play(move)
+                child = hash_after_move(key, undo, self.rights, self.state['ep_square'])
+                try:
+                    score = -self._negamax(depth - 1, -beta, -alpha, ply + 1, child)
+                finally:
+                    self._undo(undo)
+                if score > best_score:
+                    best_score, best_move = score, move
+                if score > alpha:
+                    alpha = score
+                if alpha >= beta:
+                    if self._capture_score(move) < 0:
+                        killers = self.killers[ply]
+                        if killers[0] != move:
+                            killers[1] = killers[0]
+                            killers[0] = move
+                    break
+        finally:
+            self.path.pop()
+
+        if best_score <= original_alpha:
+            flag = UPPER
+        elif best_score >= beta:
+            flag = LOWER
+        else:
+            flag = EXACT
+        self.tt[key] = (depth, _score_to_tt(best_score, ply), flag, best_move)
+        return best_score
+
+    def _quiesce(self, alpha, beta):
+        self._tick()
+        stand_pat = self._evaluate()
+        if stand_pat >= beta:
+            return stand_pat
+        if stand_pat > alpha:
+            alpha = stand_pat
+        captures = [(self._capture_score(m), m) for m in self._moves()]
+        captures = [item for item in captures if item[0] >= 0]
+        captures.sort(key=lambda item: item[0], reverse=True)
+        for _, move in captures:
+            undo = self._play(move)
+            try:
+                score = -self._quiesce(-beta, -alpha)
+            finally:
+                self._undo(undo)
+            if score >= beta:
+                return score
+            if score > alpha:
+                alpha = score
+        return alpha
+
+
+def _score_to_tt(score, ply):
+    """Store mate scores relative to the node rather than the root."""
+    if score >= MATE_THRESHOLD:
+        return score + ply
+    if score <= -MATE_THRESHOLD:
+        return score - ply
+    return score
+
+
+def _score_from_tt(score, ply):
+    if score >= MATE_THRESHOLD:
+        return score - ply
+    if score <= -MATE_THRESHOLD:
+        return score + ply
+    return score
+
+
+# Shared searcher so the transposition table carries over between moves
+default_searcher = Searcher()
+
+
+def search(board, turn, rights=None, state=None, time_limit=1.0, max_depth=64):
+    """Search with the shared Searcher; see Searcher.search."""
+    return default_searcher.search(board, turn, rights, state, time_limit, max_depth)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Search a position with the built-in engine")
+    parser.add_argument("--fen", default=START_FEN)
+    parser.add_argument("--time", type=float, default=1.0, help="time budget in seconds")
+    parser.add_argument("--depth", type=int, default=64, help="maximum depth")
+    args = parser.parse_args(argv)
+
+    board, turn, rights, ep_square, halfmove, fullmove = fen_to_board(args.fen)
+    state = new_game_state(ep_square, halfmove, fullmove)
+    print(format_report(search(board, turn, rights, state, args.time, args.depth)))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,335 @@
+# Self-play: run many games between two players without the GUI, spread over
+# a pool of worker processes, and write one JSON line per finished game.
+# Players are given as specs:
+#   stockfish:<level>   Stockfish at one of StockfishAI.LEVELS
+#   search:<level>      the built-in search at one of search.LEVELS
+#   random              uniformly random legal moves
+#   module:function     any callable f(board, turn, rights, state) returning
+#                       (start, end, promotion), a UCI string or None
+# Player objects have new_game(seed, fen) and move(board, turn, rights, state,
+# moves), where moves is the game so far in UCI form.
+# Colours alternate, so player A has White in even-numbered games.
+# Usage:
+#   python selfplay.py stockfish:hard stockfish:medium --games 200 -o games.jsonl
+#   python selfplay.py search:easy random --games 50 --workers 4
+#   python selfplay.py stockfish:easy random --games 100000 --format binary -o games.bin
+
+import argparse
+import importlib
+import json
+import os
+import random
+import shutil
+import sys
+import time
+from collections import Counter, namedtuple
+
+import search
+from engine import DEFAULT_PATH, StockfishAI
+from gamefile import Game, GameWriter
+from rules import (
+    PROMOTION_LETTERS,
+    PROMOTION_NAMES,
+    START_FEN,
+    board_to_fen,
+    fen_to_board,
+    generate_all_legal_moves,
+    is_insufficient_material,
+    is_king_in_check,
+    make_move,
+    new_game_state,
+    parse_uci_move,
+    to_uci_move,
+    undo_to_uci,
+)
+from workers import Reporter, run_pool
+from zobrist import compute_hash, hash_after_move
+
+# Games are adjudicated as draws after this many plies
+MAX_PLIES = 400
+
+# result is "1-0", "0-1" or "1/2-1/2"; moves are UCI strings
+GameResult = namedtuple("GameResult", ["result", "termination", "moves"])
+
+
+class RandomPlayer:
+    """Plays a uniformly random legal move, promoting to a random piece."""
+
+    def __init__(self, seed=None):
+        self.rng = random.Random(seed)
+
+    def new_game(self, seed, fen):
+        self.rng.seed(seed)
+
+    def move(self, board, turn, rights, state, moves):
+        moves = generate_all_legal_moves(board, turn, rights, state['ep_square'])
+        if not moves:
+            return None
+        start, end = self.rng.choice(moves)
+        promotion = None
+        if board[start[0]][start[1]].endswith("pawn") and end[0] in (0, 7):
+            promotion = self.rng.choice(sorted(PROMOTION_NAMES))
+        return start, end, promotion
+
+
+class SearchPlayer:
+    """The built-in alpha-beta search at one of search.LEVELS."""
+
+    def __init__(self, level):
+        if level not in search.LEVELS:
+            raise ValueError(f"unknown search level: {level}")
+        self.level = level
+        # Own transposition table, so two search players do not share one
+        self.searcher = search.Searcher()
+
+    def new_game(self, seed, fen):
+        self.searcher.tt.clear()
+
+    def move(self, board, turn, rights, state, moves):
+        params = search.LEVELS[self.level]
+        result = self.searcher.search(board, turn, rights, state, params["time"], params["depth"])
+        return result.move
+
+
+class StockfishPlayer:
+    """A Stockfish process at one of StockfishAI.LEVELS."""
+
+    def __init__(self, level, path=DEFAULT_PATH):
+        if level not in StockfishAI.LEVELS:
+            raise ValueError(f"unknown Stockfish level: {level}")
+        self.level = level
+        self.engine = StockfishAI(path, level)
+        self.start_fen = START_FEN
+
+    def new_game(self, seed, fen):
+        self.engine.new_game(self.level)
+        self.start_fen = fen
+
+    def move(self, board, turn, rights, state, moves):
+        # The whole game, so Stockfish sees repetitions and keeps its hash table
+        return self.engine.best_move(board_to_fen(board, turn, rights, state), moves, self.start_fen)
+
+
+class CallablePlayer:
+    """Wraps a plain function f(board, turn, rights, state)."""
+
+    def __init__(self, function):
+        self.function = function
+
+    def new_game(self, seed, fen):
+        pass
+
+    def move(self, board, turn, rights, state, moves):
+        return self.function(board, turn, rights, state)
+
+
+def make_player(spec, path=DEFAULT_PATH):
+    """Build a player from a spec such as 'stockfish:hard', 'random' or 'mymodule:policy'."""
+    kind, _, arg = spec.partition(":")
+    if kind == "random":
+        return RandomPlayer()
+    if kind == "search":
+        return SearchPlayer(arg or "easy")
+    if kind == "stockfish":
+        return StockfishPlayer(arg or "easy", path)
+    if not arg:
+        raise ValueError(f"unknown player: {spec}")
+    return CallablePlayer(getattr(importlib.import_module(kind), arg))
+
+
+def adjudicate(board, turn, state, legal, repetitions):
+    """(result, termination) if the game is over with turn to move, else None.
+
+    legal is the side to move's legal moves and repetitions how many times
+    the current position has occurred.
+    """
+    if not legal:
+        if is_king_in_check(board, turn, state=state):
+            return ("1-0" if turn == 'b' else "0-1"), "checkmate"
+        return "1/2-1/2", "stalemate"
+    if state['halfmove'] >= 100:
+        return "1/2-1/2", "fifty-move rule"
+    if repetitions >= 3:
+        return "1/2-1/2", "threefold repetition"
+    if is_insufficient_material(board):
+        return "1/2-1/2", "insufficient material"
+    return None
+
+
+def play_game(white, black, fen=START_FEN, max_plies=MAX_PLIES):
+    """Play one game between two players and return a GameResult."""
+    board, turn, rights, ep_square, halfmove, fullmove = fen_to_board(fen)
+    state = new_game_state(ep_square, halfmove, fullmove)
+    players = {'w': white, 'b': black}
+    moves = []
+    key = compute_hash(board, turn, rights, ep_square)
+    seen = Counter([key])
+    while True:
+        legal = generate_all_legal_moves(board, turn, rights, state['ep_square'])
+        opponent = 'b' if turn == 'w' else 'w'
+        winner = "1-0" if opponent == 'w' else "0-1"
+        over = adjudicate(board, turn, state, legal, seen[key])
+        if over:
+            return GameResult(*over, moves)
+        if len(moves) >= max_plies:
+            return GameResult("1/2-1/2", "max plies", moves)
+
+        move = players[turn].move(board, turn, rights, state, moves)
+        if isinstance(move, str):
+            move = parse_uci_move(move)
+        if move is None:
+            return GameResult(winner, "no move", moves)
+        start, end, promotion = move
+        # promotion may be a UCI letter or a piece kind, as make_move takes
+        if (start, end) not in legal or promotion not in (None, *PROMOTION_NAMES, *PROMOTION_LETTERS):
+            moves.append(to_uci_move(start, end, PROMOTION_LETTERS.get(promotion, promotion)))
+            return GameResult(winner, "illegal move", moves)
+        undo = make_move(board, start, end, promotion, rights, state)
+        moves.append(undo_to_uci(undo))
+        key = hash_after_move(key, undo, rights, state['ep_square'])
+        if state['halfmove'] == 0:
+            # Nothing before a capture or pawn move can repeat
+            seen.clear()
+        seen[key] += 1
+        turn = opponent
+
+
+_specs = None
+_players = None
+
+
+def _init_worker(specs, path):
+    global _specs, _players
+    _specs = specs
+    _players = [make_player(spec, path) for spec in specs]
+
+
+def _play(index, seed, fen, max_plies):
+    """Run in a worker process: play game index and return its JSON record."""
+    first, second = _players
+    white, black = (first, second) if index % 2 == 0 else (second, first)
+    for n, player in enumerate(_players):
+        player.new_game(f"{seed}-{index}-{n}", fen)
+    started = time.perf_counter()
+    game = play_game(white, black, fen, max_plies)
+    white_spec, black_spec = _specs if index % 2 == 0 else _specs[::-1]
+    return {"game": index, "fen": fen, "white": white_spec, "black": black_spec, "result": game.result,
+            "termination": game.termination, "plies": len(game.moves), "moves": game.moves,
+            "time": round(time.perf_counter() - started, 3)}
+
+
+class Summary(Reporter):
+    """Running results from player A's point of view."""
+
+    def __init__(self, specs, out=sys.stderr):
+        super().__init__(out)
+        self.specs = specs
+        self.games = 0
+        self.plies = 0
+        self.scores = Counter()
+        self.terminations = Counter()
+
+    def update(self, record):
+        self.games += 1
+        self.plies += record["plies"]
+        self.terminations[record["termination"]] += 1
+        if record["result"] == "1/2-1/2":
+            self.scores["draw"] += 1
+        elif (record["result"] == "1-0") == (record["game"] % 2 == 0):
+            self.scores["win"] += 1
+        else:
+            self.scores["loss"] += 1
+
+    def stats(self):
+        elapsed = self.elapsed()
+        points = self.scores["win"] + self.scores["draw"] / 2
+        return {
+            "games": self.games,
+            "elapsed": elapsed,
+            "games_per_sec": self.games / elapsed if elapsed > 0 else 0.0,
+            "win": self.scores["win"],
+            "draw": self.scores["draw"],
+            "loss": self.scores["loss"],
+            "score": points / self.games if self.games else 0.0,
+            "average_plies": self.plies / self.games if self.games else 0.0,
+            "terminations": dict(self.terminations),
+        }
+
+    def describe(self):
+        stats = self.stats()
+        a, b = self.specs
+        return (f"{a} vs {b}: {stats['games']} games in {stats['elapsed']:.1f}s  "
+                f"{stats['games_per_sec']:.2f} games/s  +{stats['win']} ={stats['draw']} -{stats['loss']}  "
+                f"score {stats['score']:.1%}  avg {stats['average_plies']:.0f} plies")
+
+
+def run(specs, games, out, workers, path=DEFAULT_PATH, seed=0, fen=START_FEN, max_plies=MAX_PLIES,
+        summary=None):
+    """Play games between two player specs on a process pool.
+
+    Finished games go to out as JSON lines, or as binary records when out is a
+    gamefile.GameWriter.
+    """
+    summary = summary or Summary(specs)
+
+    def write(record):
+        if isinstance(out, GameWriter):
+            out.write(Game(record["result"], fen, record["white"], record["black"], record["moves"]))
+        else:
+            out.write(json.dumps(record) + "\n")
+        out.flush()
+
+    tasks = ((index, seed, fen, max_plies) for index in range(games))
+    return run_pool(_play, tasks, workers, write, summary, _init_worker, (specs, path))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Play games between two players without the GUI")
+    parser.add_argument("a", help="player A: stockfish:<level>, search:<level>, random or module:function")
+    parser.add_argument("b", help="player B, in the same form")
+    parser.add_argument("--games", type=int, default=100, help="number of games (default: 100)")
+    parser.add_argument("-o", "--output", help="game file (default: stdout)")
+    parser.add_argument("--format", choices=("jsonl", "binary"), default="jsonl",
+                        help="JSON lines, or compact gamefile.py records (needs --output)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="worker processes (default: cores)")
+    parser.add_argument("--fen", default=START_FEN, help="starting position")
+    parser.add_argument("--max-plies", type=int, default=MAX_PLIES, help="adjudicate a draw after this many plies")
+    parser.add_argument("--seed", type=int, default=0, help="seed for random players")
+    parser.add_argument("--engine", default=DEFAULT_PATH, help="path to the Stockfish binary")
+    args = parser.parse_args(argv)
+
+    specs = (args.a, args.b)
+    for spec in specs:
+        kind, _, level = spec.partition(":")
+        if kind != "stockfish":
+            # Cheap to build, so catch typos before starting the pool
+            try:
+                make_player(spec)
+            except (ValueError, ImportError, AttributeError) as e:
+                parser.error(f"bad player {spec!r}: {e}")
+        elif (level or "easy") not in StockfishAI.LEVELS:
+            parser.error(f"unknown Stockfish level: {level}")
+        elif not (os.path.exists(args.engine) or shutil.which(args.engine)):
+            parser.error(f"Stockfish binary not found: {args.engine}")
+
+    if args.format == "binary":
+        if not args.output:
+            parser.error("--format binary needs --output")
+        out = GameWriter(args.output)
+    else:
+        out = open(args.output, "w") if args.output else sys.stdout
+    try:
+        summary = run(specs, args.games, out, args.workers, args.engine, args.seed, args.fen, args.max_plies)
+    except KeyboardInterrupt:
+        return 130
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    stats = summary.stats()
+    print("terminations: " + "  ".join(f"{name} {count}" for name, count in sorted(stats["terminations"].items())),
+          file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
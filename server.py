@@ -0,0 +1,491 @@
+# Multi-game server: hosts many independent headless games over local TCP.
+# Clients send one JSON object per line and get one JSON line back for each
+# request, echoing any "id" it carried. Every game has its own board, rights,
+# clocks and history, and the computer's moves come from a fixed pool of
+# players (normally Stockfish processes) shared by all games. Each game has
+# at most one search queued, searches are served first come first served,
+# and a full queue is reported back as "busy" instead of growing.
+# Usage:
+#   python server.py --engines 4                     Stockfish medium on port 8765
+#   python server.py --ai random --port 9000
+#   printf '{"op": "new"}\n{"op": "move", "game": 1, "move": "e2e4"}\n' | nc localhost 8765
+#
+# Requests ("game" is the id returned by "new"):
+#   {"op": "new", "ai": "b", "fen": "..."}   ai is "w", "b", "both" or "none"
+#   {"op": "move", "game": 1, "move": "e2e4"} the computer replies if it is its turn
+#   {"op": "go", "game": 1}                   ask the computer to move again after "busy"
+#   {"op": "state", "game": 1}
+#   {"op": "close", "game": 1}
+#   {"op": "metrics"}
+
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import shutil
+import signal
+import sys
+import time
+from collections import Counter, deque
+from concurrent.futures import ThreadPoolExecutor
+
+from engine import DEFAULT_PATH, StockfishAI
+from profiler import percentile
+from rules import (
+    PROMOTION_LETTERS,
+    PROMOTION_NAMES,
+    START_FEN,
+    board_to_fen,
+    fen_to_board,
+    generate_all_legal_moves,
+    make_move,
+    new_game_state,
+    parse_uci_move,
+    to_uci_move,
+    undo_to_uci,
+)
+from selfplay import StockfishPlayer, adjudicate, make_player
+from zobrist import compute_hash, hash_after_move
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+DEFAULT_AI = "stockfish:medium"
+ENGINES = 2
+# Searches allowed to wait for a free engine before requests are turned away
+MAX_QUEUE = 256
+MAX_GAMES = 1000
+# Requests from one connection handled at once; past this the server stops
+# reading from it, which pushes back on the client through TCP
+REQUESTS_PER_CLIENT = 64
+MAX_LINE = 64 * 1024
+LATENCY_HISTORY = 1000
+REPORT_INTERVAL = 10.0
+
+AI_SIDES = {"w": "w", "b": "b", "both": "wb", "none": ""}
+
+
+def _field(request, name, kind, default=None):
+    """request[name], or default if it is missing; ValueError if it has the wrong type."""
+    value = request.get(name, default)
+    # bool is a subclass of int, but true is never a game id
+    if not isinstance(value, kind) or (kind is int and isinstance(value, bool)):
+        raise ValueError(f"{name} must be {'an integer' if kind is int else 'a string'}")
+    return value
+
+
+class PoolBusy(Exception):
+    """Raised when MAX_QUEUE searches are already waiting for an engine."""
+
+
+class ServerGame:
+    """One hosted game with its own board, rights, clocks and history."""
+
+    def __init__(self, game_id, ai="b", fen=START_FEN):
+        if ai not in AI_SIDES:
+            raise ValueError(f"ai must be one of {', '.join(AI_SIDES)}")
+        self.id = game_id
+        self.ai = AI_SIDES[ai]
+        self.start_fen = fen
+        try:
+            self.board, self.turn, self.rights, ep_square, halfmove, fullmove = fen_to_board(fen)
+        except (KeyError, ValueError, IndexError):
+            raise ValueError(f"bad FEN: {fen}") from None
+        if len(self.board) != 8 or any(len(row) != 8 for row in self.board) or self.turn not in ('w', 'b'):
+            raise ValueError(f"bad FEN: {fen}")
+        if sum(row.count("w_king") for row in self.board) != 1 or sum(row.count("b_king") for row in self.board) != 1:
+            # Stockfish crashes on positions without exactly one king per side
+            raise ValueError(f"bad FEN: {fen}")
+        self.state = new_game_state(ep_square, halfmove, fullmove)
+        self.moves = []
+        self.key = compute_hash(self.board, self.turn, self.rights, ep_square)
+        self.seen = Counter([self.key])
+        self.result = "*"
+        self.termination = None
+        # True while a search for this game is queued or running
+        self.thinking = False
+        self._update()
+
+    def _update(self):
+        self.legal = generate_all_legal_moves(self.board, self.turn, self.rights, self.state['ep_square'])
+        over = adjudicate(self.board, self.turn, self.state, self.legal, self.seen[self.key])
+        if over:
+            self.result, self.termination = over
+
+    @property
+    def over(self):
+        return self.result != "*"
+
+    @property
+    def ai_to_move(self):
+        return not self.over and self.turn in self.ai
+
+    def play(self, move):
+        """Play a UCI move and return it as recorded; ValueError if it is not legal."""
+        if self.over:
+            raise ValueError("game is over")
+        try:
+            start, end, promotion = parse_uci_move(move)
+        except (ValueError, IndexError, TypeError):
+            raise ValueError(f"bad move: {move}") from None
+        if (start, end) not in self.legal or promotion not in (None, *PROMOTION_NAMES):
+            raise ValueError(f"illegal move: {move}")
+        undo = make_move(self.board, start, end, promotion, self.rights, self.state)
+        uci = undo_to_uci(undo)
+        self.moves.append(uci)
+        self.key = hash_after_move(self.key, undo, self.rights, self.state['ep_square'])
+        if self.state['halfmove'] == 0:
+            self.seen.clear()
+        self.seen[self.key] += 1
+        self.turn = 'b' if self.turn == 'w' else 'w'
+        self._update()
+        return uci
+
+    def forfeit(self, termination):
+        """End the game as a loss for the side to move."""
+        self.result = "1-0" if self.turn == 'b' else "0-1"
+        self.termination = termination
+
+    def info(self):
+        return {
+            "game": self.id,
+            "fen": board_to_fen(self.board, self.turn, self.rights, self.state),
+            "turn": self.turn,
+            "plies": len(self.moves),
+            "result": self.result,
+            "termination": self.termination,
+        }
+
+
+class EnginePool:
+    """A fixed set of players shared by every game, served first come first served."""
+
+    def __init__(self, spec, size=ENGINES, path=DEFAULT_PATH, max_queue=MAX_QUEUE):
+        self.players = [make_player(spec, path) for _ in range(size)]
+        # Game each player last searched, so new_game is only sent on a switch
+        self.served = [None] * size
+        self.idle = deque(range(size))
+        # Futures of searches waiting for a player, oldest first
+        self.waiting = deque()
+        self.max_queue = max_queue
+        self.executor = ThreadPoolExecutor(size, thread_name_prefix="engine")
+        self.searches = 0
+        self.rejected = 0
+        self.max_depth = 0
+
+    @property
+    def depth(self):
+        return len(self.waiting)
+
+    @property
+    def busy(self):
+        return len(self.players) - len(self.idle)
+
+    async def move(self, game):
+        """Best move in UCI form for game, or None if the player has none."""
+        loop = asyncio.get_running_loop()
+        if self.idle and not self.waiting:
+            index = self.idle.popleft()
+        else:
+            if len(self.waiting) >= self.max_queue:
+                self.rejected += 1
+                raise PoolBusy()
+            waiter = loop.create_future()
+            self.waiting.append(waiter)
+            self.max_depth = max(self.max_depth, len(self.waiting))
+            try:
+                index = await waiter
+            except asyncio.CancelledError:
+                if waiter.done() and not waiter.cancelled():
+                    # Handed a player just as the request was cancelled
+                    self._release(waiter.result())
+                else:
+                    self.waiting.remove(waiter)
+                raise
+        self.searches += 1
+        args = (index, game.id, game.start_fen, [row[:] for row in game.board], game.turn,
+                dict(game.rights), dict(game.state), list(game.moves))
+        future = self.executor.submit(self._search, *args)
+        # The player goes back only when its thread is done, even if the
+        # request is cancelled first
+        future.add_done_callback(lambda _: loop.call_soon_threadsafe(self._release, index))
+        return await asyncio.wrap_future(future)
+
+    def _release(self, index):
+        while self.waiting:
+            waiter = self.waiting.popleft()
+            if not waiter.done():
+                waiter.set_result(index)
+                return
+        self.idle.append(index)
+
+    def _search(self, index, game_id, start_fen, board, turn, rights, state, moves):
+        """Run in an executor thread: ask player index for a move."""
+        player = self.players[index]
+        if self.served[index] != game_id:
+            player.new_game(game_id, start_fen)
+            self.served[index] = game_id
+        move = player.move(board, turn, rights, state, moves)
+        if move is None or isinstance(move, str):
+            return move
+        start, end, promotion = move
+        return to_uci_move(start, end, PROMOTION_LETTERS.get(promotion, promotion))
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+        for player in self.players:
+            if isinstance(player, StockfishPlayer):
+                player.engine.close()
+
+
+class GameServer:
+    """Routes client requests to games and the engine pool, and keeps metrics."""
+
+    def __init__(self, pool, max_games=MAX_GAMES, out=sys.stderr):
+        self.pool = pool
+        self.max_games = max_games
+        self.out = out
+        self.games = {}
+        self.ids = itertools.count(1)
+        self.started = time.perf_counter()
+        self.connections = 0
+        self.counts = Counter()
+        # Seconds from asking for a computer move to having it, queueing included
+        self.latencies = deque(maxlen=LATENCY_HISTORY)
+        self.handlers = {
+            "new": self.op_new,
+            "move": self.op_move,
+            "go": self.op_go,
+            "state": self.op_state,
+            "close": self.op_close,
+            "metrics": self.op_metrics,
+        }
+
+    async def handle_client(self, reader, writer):
+        self.connections += 1
+        # Games created on this connection, closed when it goes away
+        owned = set()
+        slots = asyncio.Semaphore(REQUESTS_PER_CLIENT)
+        write_lock = asyncio.Lock()
+        tasks = set()
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                await slots.acquire()
+                task = asyncio.create_task(self._serve(line, owned, writer, write_lock, slots))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+        except (ConnectionError, ValueError):
+            # ValueError is a line longer than MAX_LINE
+            pass
+        finally:
+            for task in tasks:
+                task.cancel()
+            for game_id in owned:
+                self.games.pop(game_id, None)
+            self.connections -= 1
+            writer.close()
+
+    async def _serve(self, line, owned, writer, write_lock, slots):
+        request_id = None
+        try:
+            request = json.loads(line)
+            if not isinstance(request, dict):
+                raise ValueError("request must be a JSON object")
+            request_id = request.get("id")
+            op = _field(request, "op", str, "")
+            handler = self.handlers.get(op)
+            if handler is None:
+                raise ValueError(f"unknown op: {op}")
+            response = await handler(request, owned)
+        except ValueError as e:
+            self.counts["errors"] += 1
+            response = {"error": str(e)}
+        except Exception as e:
+            # Always answer, or the client would wait forever
+            self.counts["errors"] += 1
+            print(f"request {line[:200]!r} failed: {e!r}", file=self.out)
+            response = {"error": "internal error"}
+        finally:
+            slots.release()
+        if request_id is not None:
+            response["id"] = request_id
+        async with write_lock:
+            try:
+                writer.write(json.dumps(response).encode() + b"\n")
+                await writer.drain()
+            except ConnectionError:
+                pass
+
+    def _game(self, request):
+        game_id = _field(request, "game", int)
+        game = self.games.get(game_id)
+        if game is None:
+            raise ValueError(f"no such game: {game_id}")
+        return game
+
+    async def _reply(self, game, response):
+        """Let the computer move if it is its turn, and finish the response."""
+        if game.ai_to_move and not game.thinking:
+            game.thinking = True
+            started = time.perf_counter()
+            try:
+                move = await self.pool.move(game)
+            except PoolBusy:
+                # The game stays on the computer's turn until the client sends go
+                response["busy"] = True
+                move = False
+            finally:
+                game.thinking = False
+            if move is not False and game.id in self.games:
+                self.latencies.append(time.perf_counter() - started)
+                self.counts["ai_moves"] += 1
+                if move is None:
+                    game.forfeit("no move")
+                else:
+                    try:
+                        # The move as recorded, in plain UCI
+                        response["reply"] = game.play(move)
+                    except ValueError:
+                        game.forfeit("illegal move")
+        response.update(game.info())
+        return response
+
+    async def op_new(self, request, owned):
+        if len(self.games) >= self.max_games:
+            raise ValueError("too many games")
+        ai = _field(request, "ai", str, "b")
+        fen = _field(request, "fen", str, START_FEN) or START_FEN
+        game = ServerGame(next(self.ids), ai, fen)
+        self.games[game.id] = game
+        owned.add(game.id)
+        self.counts["games"] += 1
+        return await self._reply(game, {})
+
+    async def op_move(self, request, owned):
+        game = self._game(request)
+        if game.over:
+            raise ValueError("game is over")
+        if game.thinking or game.turn in game.ai:
+            raise ValueError("not your turn")
+        game.play(_field(request, "move", str))
+        self.counts["moves"] += 1
+        return await self._reply(game, {"move": game.moves[-1]})
+
+    async def op_go(self, request, owned):
+        game = self._game(request)
+        if game.thinking:
+            raise ValueError("already thinking")
+        if not game.ai_to_move:
+            raise ValueError("not the computer's turn")
+        return await self._reply(game, {})
+
+    async def op_state(self, request, owned):
+        game = self._game(request)
+        return {**game.info(), "moves": game.moves}
+
+    async def op_close(self, request, owned):
+        game = self._game(request)
+        del self.games[game.id]
+        owned.discard(game.id)
+        return {"game": game.id, "closed": True}
+
+    async def op_metrics(self, request, owned):
+        return self.stats()
+
+    def stats(self):
+        elapsed = time.perf_counter() - self.started
+        moves = self.counts["moves"] + self.counts["ai_moves"]
+        stats = {
+            "elapsed": round(elapsed, 3),
+            "connections": self.connections,
+            "games": len(self.games),
+            "games_started": self.counts["games"],
+            "thinking": sum(game.thinking for game in self.games.values()),
+            "moves": moves,
+            "moves_per_sec": round(moves / elapsed, 2) if elapsed > 0 else 0.0,
+            "engines": len(self.pool.players),
+            "engines_busy": self.pool.busy,
+            "queue_depth": self.pool.depth,
+            "max_queue_depth": self.pool.max_depth,
+            "searches": self.pool.searches,
+            "rejected": self.pool.rejected,
+            "errors": self.counts["errors"],
+        }
+        if self.latencies:
+            stats.update({f"ai_p{round(fraction * 100)}_ms": round(percentile(self.latencies, fraction) * 1000, 1)
+                          for fraction in (0.5, 0.95, 0.99)})
+        return stats
+
+    def report(self):
+        stats = self.stats()
+        line = (f"{stats['games']} games  {stats['connections']} clients  {stats['moves_per_sec']:.1f} moves/s  "
+                f"engines {stats['engines_busy']}/{stats['engines']}  queue {stats['queue_depth']} "
+                f"(max {stats['max_queue_depth']})  rejected {stats['rejected']}")
+        if self.latencies:
+            line += f"  ai p50 {stats['ai_p50_ms']:.0f}ms p95 {stats['ai_p95_ms']:.0f}ms p99 {stats['ai_p99_ms']:.0f}ms"
+        print(line, file=self.out)
+
+    async def report_every(self, seconds=REPORT_INTERVAL):
+        while True:
+            await asyncio.sleep(seconds)
+            self.report()
+
+
+async def serve(server, host=DEFAULT_HOST, port=DEFAULT_PORT):
+    """Accept clients until cancelled or sent SIGTERM."""
+    listener = await asyncio.start_server(server.handle_client, host, port, limit=MAX_LINE)
+    reporter = asyncio.create_task(server.report_every())
+    try:
+        asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, listener.close)
+    except (NotImplementedError, AttributeError):
+        # No signal handlers on Windows event loops
+        pass
+    print(f"listening on {host}:{port}", file=server.out)
+    try:
+        async with listener:
+            await listener.serve_forever()
+    except asyncio.CancelledError:
+        pass
+    finally:
+        reporter.cancel()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Host many headless games over local TCP")
+    parser.add_argument("--host", default=DEFAULT_HOST, help=f"address to listen on (default: {DEFAULT_HOST})")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT, help=f"port (default: {DEFAULT_PORT})")
+    parser.add_argument("--ai", default=DEFAULT_AI,
+                        help=f"computer player: stockfish:<level>, search:<level> or random (default: {DEFAULT_AI})")
+    parser.add_argument("--engines", type=int, default=ENGINES, help=f"players in the pool (default: {ENGINES})")
+    parser.add_argument("--max-queue", type=int, default=MAX_QUEUE,
+                        help=f"searches that may wait for an engine (default: {MAX_QUEUE})")
+    parser.add_argument("--max-games", type=int, default=MAX_GAMES, help=f"games hosted at once (default: {MAX_GAMES})")
+    parser.add_argument("--engine", default=DEFAULT_PATH, help="path to the Stockfish binary")
+    args = parser.parse_args(argv)
+
+    kind, _, level = args.ai.partition(":")
+    if kind == "stockfish":
+        if (level or "easy") not in StockfishAI.LEVELS:
+            parser.error(f"unknown Stockfish level: {level}")
+        if not (os.path.exists(args.engine) or shutil.which(args.engine)):
+            parser.error(f"Stockfish binary not found: {args.engine}")
+    try:
+        pool = EnginePool(args.ai, args.engines, args.engine, args.max_queue)
+    except (ValueError, ImportError, AttributeError) as e:
+        parser.error(f"bad player {args.ai!r}: {e}")
+    server = GameServer(pool, args.max_games)
+    try:
+        asyncio.run(serve(server, args.host, args.port))
+    except KeyboardInterrupt:
+        return 130
+    finally:
+        server.report()
+        pool.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
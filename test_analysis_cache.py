@@ -0,0 +1,80 @@
+# Tests for the SQLite analysis cache: keys, persistence, byte accounting
+# and least-recently-used eviction.
+# Usage:
+#   python -m pytest test_analysis_cache.py
+#   python -m unittest test_analysis_cache
+
+import os
+import tempfile
+import unittest
+
+from analysis_cache import AnalysisCache, params_key, position_key
+from rules import START_FEN
+
+PARAMS = {"movetime": 100, "depth": 4}
+AFTER_KNIGHTS = "rnbqkb1r/pppppppp/5n2/8/8/5N2/PPPPPPPP/RNBQKB1R w KQkq - 2 2"
+
+
+class KeyTest(unittest.TestCase):
+
+    def test_position_key(self):
+        # The fullmove number never matters, the halfmove clock does
+        self.assertEqual(position_key(AFTER_KNIGHTS), position_key(AFTER_KNIGHTS.replace(" 2 2", " 2 9")))
+        self.assertNotEqual(position_key(AFTER_KNIGHTS), position_key(AFTER_KNIGHTS.replace(" 2 2", " 0 2")))
+        # Only moves since the last capture or pawn move are kept
+        self.assertEqual(position_key(AFTER_KNIGHTS, ["e2e4", "g1f3", "g8f6"]),
+                         position_key(AFTER_KNIGHTS, ["d2d4", "g1f3", "g8f6"]))
+        self.assertNotEqual(position_key(AFTER_KNIGHTS, ["g1f3", "g8f6"]), position_key(AFTER_KNIGHTS))
+        self.assertEqual(position_key(START_FEN, ["e2e4"]), position_key(START_FEN))
+
+    def test_params_key(self):
+        self.assertEqual(params_key({"depth": 4, "movetime": 100}), params_key(PARAMS))
+
+
+class AnalysisCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.dir.name, "cache.sqlite3")
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def test_put_get(self):
+        with AnalysisCache(self.path) as cache:
+            self.assertIsNone(cache.get(START_FEN, PARAMS))
+            cache.put(START_FEN, PARAMS, "e2e4", "cp 31")
+            self.assertEqual(cache.get(START_FEN, PARAMS), ("e2e4", "cp 31"))
+            self.assertIsNone(cache.get(START_FEN, {"depth": 5}))
+            cache.put(AFTER_KNIGHTS, PARAMS, "f3g1", history=["g1f3", "g8f6"])
+            self.assertIsNone(cache.get(AFTER_KNIGHTS, PARAMS))
+            self.assertEqual(cache.get(AFTER_KNIGHTS, PARAMS, ["g1f3", "g8f6"]), ("f3g1", None))
+            stats = cache.stats()
+            self.assertEqual((stats["entries"], stats["hits"], stats["misses"]), (2, 2, 3))
+        # Entries outlive the connection
+        with AnalysisCache(self.path) as cache:
+            self.assertEqual(cache.get(START_FEN, PARAMS), ("e2e4", "cp 31"))
+            cache.clear()
+            self.assertEqual(cache.stats()["bytes"], 0)
+            self.assertIsNone(cache.get(START_FEN, PARAMS))
+
+    def test_eviction(self):
+        with AnalysisCache(self.path, max_bytes=1000) as cache:
+            fens = [START_FEN.replace("w KQkq - 0 1", f"w KQkq - {n} 1") for n in range(20)]
+            for fen in fens:
+                cache.put(fen, PARAMS, "e2e4")
+                cache.get(fens[0], PARAMS)
+            stats = cache.stats()
+            self.assertLessEqual(stats["bytes"], 1000)
+            self.assertGreater(stats["evictions"], 0)
+            self.assertIsNotNone(cache.get(fens[0], PARAMS))
+            self.assertIsNotNone(cache.get(fens[-1], PARAMS))
+            self.assertIsNone(cache.get(fens[1], PARAMS))
+            # Replacing an entry does not count its bytes twice
+            before = cache.stats()["bytes"]
+            cache.put(fens[-1], PARAMS, "e2e4")
+            self.assertEqual(cache.stats()["bytes"], before)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,75 @@
+# The bitboard move generator must agree with the list generator, the
+# original square-by-square scan, on every position.
+# Usage:
+#   python -m pytest test_bitboard.py
+#   python -m unittest test_bitboard
+
+import random
+import unittest
+
+import rules
+from rules import fen_to_board, generate_all_legal_moves, generate_legal_moves, make_move
+
+FENS = [
+    rules.START_FEN,
+    "r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1",
+    "8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1",
+    "r3k2r/Pppp1ppp/1b3nbN/nP6/BBP1P3/q4N2/Pp1P2PP/R2Q1RK1 w kq - 0 1",
+    "rnbq1k1r/pp1Pbppp/2p5/8/2B5/8/PPP1NnPP/RNBQK2R w KQ - 1 8",
+    # En passant that would expose the king along the rank
+    "8/8/8/KPp4r/8/8/8/6k1 w - c6 0 1",
+    # Castling through an attacked square
+    "r3k2r/8/8/8/8/8/5q2/R3K2R w KQkq - 0 1",
+]
+
+
+def both_backends(function, *args):
+    """(bitboard result, list result) of a move generator call."""
+    try:
+        rules.set_move_generator("bitboard")
+        fast = sorted(function(*args))
+        rules.set_move_generator("list")
+        slow = sorted(function(*args))
+    finally:
+        rules.set_move_generator("bitboard")
+    return fast, slow
+
+
+class BitboardTest(unittest.TestCase):
+
+    def assert_same_moves(self, board, turn, rights, ep_square):
+        fast, slow = both_backends(generate_all_legal_moves, board, turn, rights, ep_square)
+        self.assertEqual(fast, slow, rules.board_to_fen(board, turn, rights, rules.new_game_state(ep_square)))
+        return fast
+
+    def test_reference_positions(self):
+        for fen in FENS:
+            board, turn, rights, ep_square, _, _ = fen_to_board(fen)
+            self.assert_same_moves(board, turn, rights, ep_square)
+            for r in range(8):
+                for c in range(8):
+                    piece = board[r][c]
+                    if piece and piece[0] == turn:
+                        fast, slow = both_backends(generate_legal_moves, board, piece, (r, c), rights, ep_square)
+                        self.assertEqual(fast, slow, (fen, piece, (r, c)))
+
+    def test_random_games(self):
+        rng = random.Random(5)
+        for _ in range(20):
+            board, turn, rights, ep_square, _, _ = fen_to_board(rules.START_FEN)
+            state = rules.new_game_state()
+            for _ in range(80):
+                moves = self.assert_same_moves(board, turn, rights, state['ep_square'])
+                if not moves:
+                    break
+                start, end = rng.choice(moves)
+                make_move(board, start, end, rng.choice(["queen", "knight"]), rights, state)
+                turn = 'b' if turn == 'w' else 'w'
+
+    def test_unknown_generator(self):
+        with self.assertRaises(ValueError):
+            rules.set_move_generator("magic")
+
+
+if __name__ == "__main__":
+    unittest.main()
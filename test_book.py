@@ -0,0 +1,89 @@
+# Tests for the Polyglot book reader: position keys against the reference
+# values from the Polyglot specification, and probing a small book.
+# Usage:
+#   python -m pytest test_book.py
+#   python -m unittest test_book
+
+import os
+import random
+import tempfile
+import unittest
+
+import rules
+from book import ENTRY, OpeningBook, decode_move, polyglot_key
+from rules import fen_to_board
+
+# (FEN, key) pairs published with the Polyglot book format
+REFERENCE_KEYS = [
+    ("rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1", 0x463B96181691FC9C),
+    ("rnbqkbnr/pppppppp/8/8/4P3/8/PPPP1PPP/RNBQKBNR b KQkq e3 0 1", 0x823C9B50FD114196),
+    ("rnbqkbnr/ppp1pppp/8/3p4/4P3/8/PPPP1PPP/RNBQKBNR w KQkq d6 0 2", 0x0756B94461C50FB0),
+    ("rnbqkbnr/ppp1pppp/8/3pP3/8/8/PPPP1PPP/RNBQKBNR b KQkq - 0 2", 0x662FAFB965DB29D4),
+    ("rnbqkbnr/ppp1p1pp/8/3pPp2/8/8/PPPP1PPP/RNBQKBNR w KQkq f6 0 3", 0x22A48B5A8E47FF78),
+    ("rnbqkbnr/ppp1p1pp/8/3pPp2/8/8/PPPPKPPP/RNBQ1BNR b kq - 0 3", 0x652A607CA3F242C1),
+    ("rnbq1bnr/ppp1pkpp/8/3pPp2/8/8/PPPPKPPP/RNBQ1BNR w - - 0 4", 0x00FDD303C946BDD9),
+    ("rnbqkbnr/p1pppppp/8/8/PpP4P/8/1P1PPPP1/RNBQKBNR b KQkq c3 0 3", 0x3C8123EA7B067637),
+    ("rnbqkbnr/p1pppppp/8/8/P6P/R1p5/1P1PPPP1/1NBQKBNR b Kkq - 0 4", 0x5C3F9B829B279560),
+]
+
+
+def polyglot_move(start, end):
+    """Polyglot move field for two squares given as (row, col) with row 0 rank 8."""
+    return end[1] | (7 - end[0]) << 3 | start[1] << 6 | (7 - start[0]) << 9
+
+
+class PolyglotKeyTest(unittest.TestCase):
+
+    def test_reference_keys(self):
+        for fen, key in REFERENCE_KEYS:
+            board, turn, rights, ep_square, _, _ = fen_to_board(fen)
+            self.assertEqual(polyglot_key(board, turn, rights, ep_square), key, fen)
+
+    def test_decode_castling(self):
+        board, _, _, _, _, _ = fen_to_board("r3k2r/8/8/8/8/8/8/R3K2R w KQkq - 0 1")
+        self.assertEqual(decode_move(board, polyglot_move((7, 4), (7, 7))), ((7, 4), (7, 6), None))
+        self.assertEqual(decode_move(board, polyglot_move((0, 4), (0, 0))), ((0, 4), (0, 2), None))
+        self.assertEqual(decode_move(board, polyglot_move((7, 0), (6, 0))), ((7, 0), (6, 0), None))
+
+
+class OpeningBookTest(unittest.TestCase):
+
+    def setUp(self):
+        board, turn, rights, _, _, _ = fen_to_board(rules.START_FEN)
+        key = polyglot_key(board, turn, rights)
+        entries = [
+            (key, polyglot_move((6, 4), (4, 4)), 3, 0),
+            (key, polyglot_move((6, 3), (4, 3)), 1, 0),
+            # Not legal in the start position, so never offered
+            (key, polyglot_move((6, 4), (3, 4)), 5, 0),
+            (key + 1, polyglot_move((6, 0), (5, 0)), 1, 0),
+        ]
+        entries.sort()
+        self.dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.dir.name, "book.bin")
+        with open(self.path, "wb") as f:
+            for entry in entries:
+                f.write(ENTRY.pack(*entry))
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def test_moves(self):
+        board, turn, rights, _, _, _ = fen_to_board(rules.START_FEN)
+        with OpeningBook(self.path) as book:
+            self.assertEqual(len(book), 4)
+            self.assertEqual(sorted(book.moves(board, turn, rights)),
+                             [(((6, 3), (4, 3), None), 1), (((6, 4), (4, 4), None), 3)])
+
+    def test_choose(self):
+        board, turn, rights, _, _, _ = fen_to_board(rules.START_FEN)
+        with OpeningBook(self.path, max_ply=4, rng=random.Random(1)) as book:
+            self.assertIn(book.choose(board, turn, rights, rules.new_game_state()),
+                          [((6, 3), (4, 3), None), ((6, 4), (4, 4), None)])
+            self.assertIsNone(book.choose(board, turn, rights, rules.new_game_state(fullmove=3)))
+            board[6][4] = ""
+            self.assertIsNone(book.choose(board, turn, rights, rules.new_game_state()))
+
+
+if __name__ == "__main__":
+    unittest.main()
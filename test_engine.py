@@ -0,0 +1,125 @@
+# Tests for the Stockfish wrapper: UCI command building, and StockfishAI
+# driving a scripted stand-in engine, so no Stockfish binary is needed.
+# Usage:
+#   python -m pytest test_engine.py
+#   python -m unittest test_engine
+
+import os
+import stat
+import sys
+import tempfile
+import unittest
+
+from analysis_cache import AnalysisCache
+from engine import StockfishAI, go_command, parse_score, position_command
+from rules import START_FEN
+
+# Speaks just enough UCI for python-stockfish and StockfishAI. Every command
+# is logged next to the script; a file named "crash" there makes the next go
+# kill the process instead of answering.
+FAKE_ENGINE = """\
+import os
+import sys
+
+START_FEN = "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1"
+here = os.path.dirname(os.path.abspath(__file__))
+print("Stockfish 16 by the Stockfish developers (see AUTHORS file)", flush=True)
+for line in sys.stdin:
+    line = line.strip()
+    with open(os.path.join(here, "log"), "a") as log:
+        log.write(line + "\\n")
+    if line == "uci":
+        print("id name Stockfish 16\\nuciok", flush=True)
+    elif line == "isready":
+        print("readyok", flush=True)
+    elif line == "d":
+        print("Fen: " + START_FEN + "\\nCheckers: ", flush=True)
+    elif line.startswith("go"):
+        if os.path.exists(os.path.join(here, "crash")):
+            os.remove(os.path.join(here, "crash"))
+            sys.exit(1)
+        print("info depth 7 score cp 31 nodes 1234 pv e2e4", flush=True)
+        print("bestmove e2e4 ponder e7e5", flush=True)
+    elif line == "quit":
+        break
+"""
+
+
+class CommandTest(unittest.TestCase):
+
+    def test_go_command(self):
+        self.assertEqual(go_command({"movetime": 100, "depth": 4, "skill": 5}), "go depth 4 movetime 100")
+        self.assertEqual(go_command({"nodes": 500}, ponder=True), "go ponder nodes 500")
+
+    def test_position_command(self):
+        fen = "4k3/8/8/8/8/8/8/4K3 w - - 0 1"
+        self.assertEqual(position_command(fen), f"position fen {fen}")
+        self.assertEqual(position_command(fen, ["e2e4", "e7e5"]), "position startpos moves e2e4 e7e5")
+        self.assertEqual(position_command(fen, [], START_FEN), "position startpos")
+        self.assertEqual(position_command(None, ["e1d1"], fen), f"position fen {fen} moves e1d1")
+
+    def test_parse_score(self):
+        self.assertEqual(parse_score("cp -31"), {"cp": -31})
+        self.assertEqual(parse_score("mate 2"), {"mate": 2})
+        self.assertIsNone(parse_score(None))
+
+
+class StockfishAITest(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.dir.name, "stockfish")
+        with open(self.path, "w") as f:
+            f.write(f"#!{sys.executable}\n{FAKE_ENGINE}")
+        os.chmod(self.path, os.stat(self.path).st_mode | stat.S_IXUSR)
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def commands(self, prefix):
+        """Logged commands starting with prefix, including python-stockfish's own."""
+        with open(os.path.join(self.dir.name, "log")) as f:
+            return [line.strip() for line in f if line.startswith(prefix)]
+
+    def test_missing_binary(self):
+        ai = StockfishAI(os.path.join(self.dir.name, "missing"))
+        self.assertFalse(ai.available)
+        self.assertIsNone(ai.best_move(START_FEN))
+        self.assertIsNone(ai.analyse(START_FEN))
+
+    def test_analyse(self):
+        ai = StockfishAI(self.path, level="easy")
+        try:
+            result = ai.analyse(START_FEN)
+        finally:
+            ai.close()
+        self.assertEqual((result.move, result.score, result.depth, result.nodes, result.ponder),
+                         ("e2e4", "cp 31", 7, 1234, "e7e5"))
+        self.assertEqual(self.commands("go"), ["go depth 4 movetime 100"])
+
+    def test_best_move_sends_game_and_uses_cache(self):
+        fen = "rnbqkbnr/pppp1ppp/8/4p3/4P3/8/PPPP1PPP/RNBQKBNR w KQkq - 0 2"
+        with AnalysisCache(os.path.join(self.dir.name, "cache.sqlite3")) as cache:
+            ai = StockfishAI(self.path, cache=cache)
+            try:
+                self.assertEqual(ai.best_move(fen, ["e2e4", "e7e5"]), "e2e4")
+                self.assertEqual(ai.best_move(fen, ["e2e4", "e7e5"]), "e2e4")
+            finally:
+                ai.close()
+            self.assertEqual(cache.stats()["hits"], 1)
+        # python-stockfish sets up its own start position first
+        self.assertEqual(self.commands("position")[-1], "position startpos moves e2e4 e7e5")
+        self.assertEqual(len(self.commands("go")), 1)
+
+    def test_restart_after_crash(self):
+        ai = StockfishAI(self.path)
+        try:
+            open(os.path.join(self.dir.name, "crash"), "w").close()
+            self.assertEqual(ai.best_move(START_FEN), "e2e4")
+        finally:
+            ai.close()
+        self.assertEqual(len(self.commands("go")), 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
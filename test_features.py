@@ -0,0 +1,80 @@
+# Tests for the NumPy batch features: encoding matches the rules.py board,
+# material plus placement matches search.evaluate and attacked squares match
+# rules.find_attackers. Skipped when NumPy is not installed.
+# Usage:
+#   python -m pytest test_features.py
+#   python -m unittest test_features
+
+import unittest
+
+import rules
+from perft import REFERENCE_POSITIONS
+from position import PIECE_CODES, Position
+from search import evaluate
+
+try:
+    import numpy as np
+    import features
+except ImportError:
+    np = None
+
+FENS = [entry["fen"] for entry in REFERENCE_POSITIONS.values()] + [
+    "4k3/8/8/8/8/8/8/4K2R w K - 0 1",
+    "8/8/8/8/8/8/8/8 w - - 0 1",
+]
+
+
+@unittest.skipIf(np is None, "needs NumPy")
+class FeaturesTest(unittest.TestCase):
+
+    def setUp(self):
+        self.boards = [rules.fen_to_board(fen)[0] for fen in FENS]
+
+    def test_encode(self):
+        expected = np.array([[PIECE_CODES[piece] for row in board for piece in row] for board in self.boards],
+                            dtype=np.int8)
+        np.testing.assert_array_equal(features.encode(FENS), expected)
+        np.testing.assert_array_equal(features.encode(self.boards), expected)
+        np.testing.assert_array_equal(features.encode([Position.from_fen(fen) for fen in FENS]), expected)
+        self.assertEqual(features.encode([]).shape, (0, 64))
+
+    def test_encode_errors(self):
+        for bad in ("8/8/8/8/8/8/8 w - - 0 1", "9/8/8/8/8/8/8/8 w", "7/9/8/8/8/8/8/8 w",
+                    "8/8/8/8/8/8/8/7x w", ""):
+            with self.assertRaises(ValueError, msg=bad):
+                features.encode([rules.START_FEN, bad])
+
+    def test_planes(self):
+        squares = features.encode([rules.START_FEN])
+        planes = features.planes(squares)
+        self.assertEqual(planes.shape, (1, 12, 8, 8))
+        self.assertEqual(planes[0, PIECE_CODES["w_pawn"] - 1, 6].tolist(), [1] * 8)
+        self.assertEqual(int(planes.sum()), 32)
+
+    def test_evaluation_matches_search(self):
+        squares = features.encode(FENS)
+        totals = features.material(squares) + features.placement(squares)
+        self.assertEqual(totals.tolist(), [evaluate(board) for board in self.boards])
+
+    def test_attacks_match_rules(self):
+        attacks, mobility = features.attacks_and_mobility(features.encode(self.boards))
+        maps = features.unpack(attacks)
+        for board, board_maps in zip(self.boards, maps):
+            for color, attacked in zip("wb", board_maps):
+                # find_attackers looks for the pieces of color's opponent
+                defender = 'b' if color == 'w' else 'w'
+                expected = [bool(rules.find_attackers(board, defender, divmod(sq, 8), first_only=True))
+                            for sq in range(64)]
+                self.assertEqual(attacked.tolist(), expected)
+        self.assertEqual(mobility[0].tolist(), [20, 20])
+
+    def test_featurize_chunks(self):
+        whole = features.featurize(FENS)
+        chunked = features.featurize(FENS, chunk_size=3)
+        for name, column in whole._asdict().items():
+            np.testing.assert_array_equal(column, getattr(chunked, name), err_msg=name)
+        self.assertEqual(len(features.featurize([]).squares), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,98 @@
+# Tests for the binary game file: records round-trip, the .idx sidecar is
+# reused and extended, and stale indexes and torn records are recovered.
+# Usage:
+#   python -m pytest test_gamefile.py
+#   python -m unittest test_gamefile
+
+import os
+import tempfile
+import unittest
+from array import array
+
+import gamefile
+from gamefile import INDEX_SUFFIX, MAGIC, Game, GameReader, GameWriter, decode_game, encode_game
+
+GAMES = [
+    Game("1-0", gamefile.START_FEN, "white", "black", ["e2e4", "e7e5", "d1h5", "b8c6", "f1c4", "g8f6", "h5f7"]),
+    Game("*", "4k3/P7/8/8/8/8/8/4K3 w - - 0 1", "", "", ["a7a8n"]),
+    Game("1/2-1/2", gamefile.START_FEN, "somebody", "", []),
+]
+
+
+class GameFileTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.dir.name, "games.bin")
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def write(self, games):
+        with GameWriter(self.path) as writer:
+            for game in games:
+                writer.write(game)
+
+    def read(self, use_index=True):
+        with GameReader(self.path, use_index) as reader:
+            return list(reader), [reader[i] for i in range(len(reader))]
+
+    def test_encode_decode(self):
+        for game in GAMES:
+            self.assertEqual(decode_game(encode_game(game)), game)
+        for move in ("e2e4", "a7a8q", "h2h1n", "e1g1"):
+            self.assertEqual(gamefile.decode_move(gamefile.encode_move(move)), move)
+
+    def test_round_trip(self):
+        self.write(GAMES)
+        streamed, indexed = self.read()
+        self.assertEqual(streamed, GAMES)
+        self.assertEqual(indexed, GAMES)
+        self.assertTrue(os.path.exists(self.path + INDEX_SUFFIX))
+
+    def test_index_extended_after_append(self):
+        self.write(GAMES[:2])
+        self.read()
+        self.write(GAMES[2:])
+        self.assertEqual(self.read()[1], GAMES)
+        with open(self.path + INDEX_SUFFIX, "rb") as f:
+            stored = array("Q", f.read())
+        self.assertEqual(stored[0], os.path.getsize(self.path))
+        self.assertEqual(len(stored), 2 + len(GAMES))
+
+    def test_stale_index_rebuilt(self):
+        self.write(GAMES)
+        self.read()
+        # Replace the file with a different one of the same size: offsets
+        # from the old index would point into the middle of records
+        size = os.path.getsize(self.path)
+        os.remove(self.path)
+        self.write([GAMES[0]._replace(white="w" * 14, black=""), GAMES[1], GAMES[2]._replace(white="some")])
+        self.assertEqual(os.path.getsize(self.path), size)
+        streamed, indexed = self.read()
+        self.assertEqual(indexed, streamed)
+        self.assertEqual(indexed[0].white, "w" * 14)
+
+    def test_torn_record(self):
+        self.write(GAMES[:2])
+        with open(self.path, "ab") as f:
+            f.write(encode_game(GAMES[2])[:-3])
+        self.assertEqual(self.read()[0], GAMES[:2])
+        # The writer cuts the torn record off before appending
+        self.write(GAMES[2:])
+        self.assertEqual(self.read(use_index=False)[0], GAMES)
+
+    def test_not_a_game_file(self):
+        with open(self.path, "wb") as f:
+            f.write(b"not games")
+        with self.assertRaises(ValueError):
+            GameReader(self.path)
+        with self.assertRaises(ValueError):
+            GameWriter(self.path)
+        with open(self.path, "wb") as f:
+            f.write(MAGIC)
+        self.assertEqual(self.read()[0], [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,93 @@
+# Headless tests for the game loop in main.py: scripted input is fed to the
+# real loop on SDL's dummy video driver, and the AI uses the built-in search.
+# Usage:
+#   python -m pytest test_main.py
+#   python -m unittest test_main
+
+import os
+import time
+import unittest
+from unittest import mock
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+
+import pygame
+
+import main
+
+TIMEOUT = 10.0
+
+
+def square_center(row, col):
+    size = main.width // 8
+    return col * size + size // 2, row * size + size // 2
+
+
+class ScriptedInput:
+    """Stands in for pygame's event queue and mouse.
+
+    Each step is (mouse position, events), handed out one per frame together
+    with anything real (AI moves) in the queue, or a number of seconds of
+    empty frames. Once the script is done the loop runs until until() is
+    true or TIMEOUT passes, then quits.
+    """
+
+    def __init__(self, steps, until):
+        self.steps = list(steps)
+        self.until = until
+        self.position = (0, 0)
+        self.deadline = None
+        self.resume = 0
+        self.get = pygame.event.get
+
+    def events(self, *args, **kwargs):
+        events = self.get()
+        if self.steps and isinstance(self.steps[0], float):
+            self.resume = time.monotonic() + self.steps.pop(0)
+        if time.monotonic() < self.resume:
+            time.sleep(0.01)
+            return events
+        if self.steps:
+            self.position, scripted = self.steps.pop(0)
+            return scripted + events
+        if self.deadline is None:
+            self.deadline = time.monotonic() + TIMEOUT
+        if self.until() or time.monotonic() > self.deadline:
+            return events + [pygame.event.Event(pygame.QUIT)]
+        time.sleep(0.01)
+        return events
+
+    def run(self, **kwargs):
+        with mock.patch.object(pygame.event, "get", self.events), \
+                mock.patch.object(pygame.mouse, "get_pos", lambda: self.position):
+            main.game_loop(**kwargs)
+
+
+def click(row, col):
+    return square_center(row, col), [pygame.event.Event(pygame.MOUSEBUTTONDOWN, pos=square_center(row, col),
+                                                        button=1)]
+
+
+def key(name):
+    return (0, 0), [pygame.event.Event(pygame.KEYDOWN, key=name, mod=0, unicode="")]
+
+
+class GameLoopTest(unittest.TestCase):
+
+    def test_ai_answers(self):
+        ScriptedInput([click(6, 4), click(4, 4)], lambda: main.turn == 'w').run(vs_ai=True)
+        self.assertEqual(main.turn, 'w')
+        self.assertEqual(len(main.move_stack), 2)
+
+    def test_ai_answers_after_exit_is_declined(self):
+        # Pressing E while the AI thinks cancels it; once the cancelled search
+        # has finished and N closes the popup, the AI must be asked again
+        steps = [click(6, 4), click(4, 4), key(pygame.K_e), 1.0, key(pygame.K_n)]
+        ScriptedInput(steps, lambda: main.turn == 'w').run(vs_ai=True)
+        self.assertEqual(main.turn, 'w')
+        self.assertEqual(len(main.move_stack), 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
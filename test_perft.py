@@ -0,0 +1,46 @@
+# Perft regression tests: node counts for the reference positions on both
+# move generator backends, which also exercises make_move/unmake_move.
+# Usage:
+#   python -m pytest test_perft.py
+#   python -m unittest test_perft
+
+import unittest
+
+import rules
+from perft import REFERENCE_POSITIONS, divide, load_fen, perft
+
+DEPTH = 3
+
+
+class PerftTest(unittest.TestCase):
+
+    def tearDown(self):
+        rules.set_move_generator("bitboard")
+
+    def check_backend(self, name):
+        rules.set_move_generator(name)
+        for position, entry in REFERENCE_POSITIONS.items():
+            with self.subTest(backend=name, position=position):
+                board, turn, rights, state = load_fen(entry["fen"])
+                fen = rules.board_to_fen(board, turn, rights, state)
+                self.assertEqual(perft(board, turn, rights, state, DEPTH), entry["nodes"][DEPTH - 1])
+                # Every move was taken back
+                self.assertEqual(rules.board_to_fen(board, turn, rights, state), fen)
+
+    def test_bitboard(self):
+        self.check_backend("bitboard")
+
+    def test_list(self):
+        self.check_backend("list")
+
+    def test_divide(self):
+        entry = REFERENCE_POSITIONS["promotions"]
+        board, turn, rights, state = load_fen(entry["fen"])
+        counts = divide(board, turn, rights, state, 2)
+        self.assertEqual(len(counts), entry["nodes"][0])
+        self.assertEqual(sum(counts.values()), entry["nodes"][1])
+        self.assertIn("f1f2", counts)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,95 @@
+# Tests for pgn.py: SAN in both directions, tokenising real-world movetext,
+# and a round trip from a binary game file through PGN and back.
+# Usage:
+#   python -m pytest test_pgn.py
+#   python -m unittest test_pgn
+
+import io
+import os
+import tempfile
+import unittest
+
+from gamefile import Game, GameReader, GameWriter
+from pgn import export_games, format_game, import_games, read_games, replay, san_moves
+from rules import START_FEN
+
+GAMES = [
+    Game("1-0", START_FEN, "white", "black", ["e2e4", "e7e5", "d1h5", "b8c6", "f1c4", "g8f6", "h5f7"]),
+    # Castling both ways, en passant and an underpromotion
+    Game("*", "r3k2r/6P1/8/8/5p2/8/4P3/R3K2R w KQkq - 0 1", "", "",
+         ["e1g1", "e8c8", "e2e4", "f4e3", "g7g8n"]),
+    # Black moves first, late in a game
+    Game("0-1", "4k3/8/8/8/8/8/8/N3K1N1 b - - 0 40", "", "", ["e8e7", "a1c2", "e7e6", "g1e2"]),
+]
+
+
+class SanTest(unittest.TestCase):
+
+    def test_san_moves(self):
+        self.assertEqual(san_moves(GAMES[0].fen, GAMES[0].moves), ["e4", "e5", "Qh5", "Nc6", "Bc4", "Nf6", "Qxf7#"])
+        self.assertEqual(san_moves(GAMES[1].fen, GAMES[1].moves), ["O-O", "O-O-O", "e4", "fxe3", "g8=N"])
+        # Two knights on the a-file reach c2, and the c3 and g1 knights reach e2
+        fen = "4k3/8/8/8/8/N1N5/8/N3K1N1 w - - 0 1"
+        self.assertEqual(san_moves(fen, ["a1c2", "e8d7", "g1e2"]), ["N1c2", "Kd7", "Nge2"])
+        with self.assertRaises(ValueError):
+            san_moves(START_FEN, ["e2e5"])
+
+    def test_illegal_san(self):
+        for moves in (["e5"], ["Nc3", "Nc3"], ["O-O"]):
+            game = next(read_games(io.StringIO(" ".join(moves) + " *\n")))
+            with self.assertRaises(ValueError):
+                replay(game)
+
+
+class ReadGamesTest(unittest.TestCase):
+
+    def test_movetext(self):
+        text = ('[Event "test"]\n[White "a \\"quoted\\" name"]\n\n'
+                "1. e4 {best by test} e5 (1... c5 2. Nf3) 2.Nf3 $1 Nc6;comment\n"
+                "3. Bb5 a6 1/2-1/2\n")
+        game, = read_games(io.StringIO(text))
+        self.assertEqual(game.headers["White"], 'a "quoted" name')
+        self.assertEqual(game.moves, ["e4", "e5", "Nf3", "Nc6", "Bb5", "a6"])
+        self.assertEqual(game.result, "1/2-1/2")
+
+    def test_games_without_moves(self):
+        text = ('[Event "one"]\n[Result "*"]\n\n'
+                '[Event "two"]\n[Result "1-0"]\n\n1. e4 1-0\n\n'
+                '[Event "three"]\n\n*\n')
+        games = list(read_games(io.StringIO(text)))
+        self.assertEqual([game.headers["Event"] for game in games], ["one", "two", "three"])
+        self.assertEqual([game.moves for game in games], [[], ["e4"], []])
+
+
+class RoundTripTest(unittest.TestCase):
+
+    def test_gamefile_to_pgn_and_back(self):
+        with tempfile.TemporaryDirectory() as directory:
+            source = os.path.join(directory, "games.bin")
+            copy = os.path.join(directory, "copy.bin")
+            with GameWriter(source) as writer:
+                for game in GAMES:
+                    writer.write(game)
+            out = io.StringIO()
+            self.assertEqual(export_games(source, out)[::2], (len(GAMES), 0))
+            text = out.getvalue()
+            with GameWriter(copy) as writer:
+                self.assertEqual(import_games(io.StringIO(text), writer)[::2], (len(GAMES), 0))
+            with GameReader(copy) as reader:
+                games = list(reader)
+        self.assertEqual([game.moves for game in games], [game.moves for game in GAMES])
+        self.assertEqual([game.fen for game in games], [game.fen for game in GAMES])
+        self.assertEqual([game.result for game in games], [game.result for game in GAMES])
+        self.assertEqual(games[0].white, "white")
+
+    def test_format_game(self):
+        text = format_game({"Event": "x"}, ["Kd7"], "*", "4k3/8/8/8/8/8/8/4K3 b - - 0 7")
+        self.assertIn('[SetUp "1"]', text)
+        self.assertIn("7... Kd7 *", text)
+        self.assertTrue(text.endswith("\n\n"))
+        long_game = format_game({}, ["Nf3", "Nf6", "Ng1", "Ng8"] * 20)
+        self.assertTrue(all(len(line) <= 79 for line in long_game.splitlines()))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,64 @@
+# Tests for the packed Position record: it converts to and from FENs, boards
+# and bytes without losing anything, and after() agrees with make_move.
+# Usage:
+#   python -m pytest test_position.py
+#   python -m unittest test_position
+
+import unittest
+
+import rules
+from perft import REFERENCE_POSITIONS
+from position import Position, pack_info
+
+FENS = [entry["fen"] for entry in REFERENCE_POSITIONS.values()] + [
+    "rnbqkbnr/ppp1pppp/8/3pP3/8/8/PPPP1PPP/RNBQKBNR b Kq d6 0 2",
+    "8/8/8/8/8/8/8/k1K5 b - - 1023 900",
+]
+
+
+class PositionTest(unittest.TestCase):
+
+    def test_fen_round_trip(self):
+        for fen in FENS:
+            position = Position.from_fen(fen)
+            self.assertEqual(position.fen(), fen)
+            self.assertEqual(Position.from_bytes(position.to_bytes()), position)
+            self.assertEqual(len(position.to_bytes()), 72)
+
+    def test_board_round_trip(self):
+        for fen in FENS:
+            board, turn, rights, ep_square, halfmove, fullmove = rules.fen_to_board(fen)
+            state = rules.new_game_state(ep_square, halfmove, fullmove)
+            position = Position.from_board(board, turn, rights, state)
+            self.assertEqual(position.unpack(), (board, turn, rights, state))
+            self.assertEqual(position.legal_moves(), rules.generate_all_legal_moves(board, turn, rights, ep_square))
+
+    def test_initial(self):
+        self.assertEqual(Position.initial(), Position.from_fen(rules.START_FEN))
+        self.assertEqual(Position.initial().piece_at(7, 4), "w_king")
+
+    def test_after(self):
+        position = Position.from_fen(REFERENCE_POSITIONS["kiwipete"]["fen"])
+        board, turn, rights, state = position.unpack()
+        for move in ("e1g1", "d5e6", "e2a6", "a2a4"):
+            start, end, promotion = rules.parse_uci_move(move)
+            after = position.after(move)
+            played, played_rights, played_state = [row[:] for row in board], dict(rights), dict(state)
+            rules.make_move(played, start, end, promotion, played_rights, played_state)
+            self.assertEqual(after, Position.from_board(played, 'b', played_rights, played_state))
+        # The original is left alone
+        self.assertEqual(position.fen(), REFERENCE_POSITIONS["kiwipete"]["fen"])
+
+    def test_hashable(self):
+        first = Position.from_fen(rules.START_FEN).after("g1f3").after("g8f6").after("f3g1").after("f6g8")
+        self.assertEqual(first.squares, Position.initial().squares)
+        self.assertNotEqual(first, Position.initial())
+        self.assertEqual(len({Position.initial(), Position.initial().copy()}), 1)
+
+    def test_halfmove_range(self):
+        with self.assertRaises(ValueError):
+            pack_info('w', 0, None, 1024, 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
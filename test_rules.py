@@ -0,0 +1,146 @@
+# Tests for rules.py: check detection, king tracking, castle rights and
+# make_move/unmake_move restoring every part of a position.
+# Usage:
+#   python -m pytest test_rules.py
+#   python -m unittest test_rules
+
+import copy
+import unittest
+
+import rules
+from perft import REFERENCE_POSITIONS, expand_promotions, load_fen
+from rules import fen_to_board, generate_all_legal_moves, make_move, unmake_move
+from zobrist import compute_hash, hash_after_move
+
+
+def snapshot(board, rights, state):
+    return copy.deepcopy(board), dict(rights), dict(state)
+
+
+class CheckTest(unittest.TestCase):
+
+    def test_check_and_mate(self):
+        board, turn, rights, ep_square, _, _ = fen_to_board(
+            "rnb1kbnr/pppp1ppp/8/4p3/6Pq/5P2/PPPPP2P/RNBQKBNR w KQkq - 1 3")
+        self.assertTrue(rules.is_king_in_check(board, 'w'))
+        self.assertFalse(rules.is_king_in_check(board, 'b'))
+        self.assertTrue(rules.is_checkmate(board, 'w', rights, ep_square))
+
+    def test_castling_through_check(self):
+        board, _, rights, _, _, _ = fen_to_board("r3k2r/8/8/8/8/8/5q2/R3K2R w KQkq - 0 1")
+        moves = generate_all_legal_moves(board, 'w', rights)
+        # f2 covers e1 itself, so the king may not castle either way
+        self.assertNotIn(((7, 4), (7, 6)), moves)
+        self.assertNotIn(((7, 4), (7, 2)), moves)
+
+    def test_find_king_uses_state(self):
+        board, _, _, _, _, _ = fen_to_board(rules.START_FEN)
+        state = rules.new_game_state()
+        self.assertEqual(rules.find_king(board, 'b', state), (0, 4))
+        self.assertEqual(state['b_king'], (0, 4))
+        # A stale square is noticed and rescanned
+        board[0][4], board[0][3] = "", "b_king"
+        self.assertEqual(rules.find_king(board, 'b', state), (0, 3))
+        self.assertEqual(state['b_king'], (0, 3))
+
+    def test_attack_map_cache(self):
+        board, _, _, _, _, _ = fen_to_board("4k3/8/8/8/1b6/8/3P4/4K2r w - - 0 1")
+        king_pos, checkers, pins = rules.attack_map(board, 'w')
+        self.assertEqual((king_pos, checkers, pins), ((7, 4), ((7, 7),), {(6, 3): (-1, -1)}))
+        cached = rules.attack_map(board, 'w', key=12345)
+        self.assertIs(rules.attack_map(board, 'w', key=12345), cached)
+        for key in range(rules.ATTACK_MAP_CACHE_SIZE):
+            rules.attack_map(board, 'w', key=key)
+        self.assertNotIn((12345, 'w'), rules._attack_maps)
+        self.assertLessEqual(len(rules._attack_maps), rules.ATTACK_MAP_CACHE_SIZE)
+
+    def test_insufficient_material(self):
+        board, _, _, _, _, _ = fen_to_board("8/8/4k3/8/8/3NK3/8/8 w - - 0 1")
+        self.assertTrue(rules.is_insufficient_material(board))
+        board[5][3] = "w_rook"
+        self.assertFalse(rules.is_insufficient_material(board))
+
+
+class MakeMoveTest(unittest.TestCase):
+
+    def test_unmake_restores_position_and_hash(self):
+        for name, entry in REFERENCE_POSITIONS.items():
+            board, turn, rights, state = load_fen(entry["fen"])
+            h = compute_hash(board, turn, rights, state['ep_square'])
+            # Record both king squares so the snapshot compares them too
+            rules.find_king(board, 'w', state)
+            rules.find_king(board, 'b', state)
+            before = snapshot(board, rights, state)
+            opponent = 'b' if turn == 'w' else 'w'
+            for start, end in generate_all_legal_moves(board, turn, rights, state['ep_square']):
+                for promotion in expand_promotions(board, start, end):
+                    with self.subTest(position=name, move=rules.to_uci_move(start, end)):
+                        undo = make_move(board, start, end, promotion, rights, state)
+                        after = hash_after_move(h, undo, rights, state['ep_square'])
+                        self.assertEqual(after, compute_hash(board, opponent, rights, state['ep_square']))
+                        self.assertFalse(rules.is_king_in_check(board, turn, state=state))
+                        unmake_move(board, undo, rights, state)
+                        self.assertEqual(snapshot(board, rights, state), before)
+                        self.assertEqual(compute_hash(board, turn, rights, state['ep_square']), h)
+
+    def test_castle_rights(self):
+        board, _, rights, _, _, _ = fen_to_board("r3k2r/8/8/8/8/8/8/R3K2R w KQkq - 0 1")
+        state = rules.new_game_state()
+        undo = make_move(board, (7, 7), (0, 7), None, rights, state)
+        # Rook takes rook: White loses the kingside, Black too
+        self.assertEqual(rights, {'w_kingside': False, 'w_queenside': True,
+                                  'b_kingside': False, 'b_queenside': True})
+        unmake_move(board, undo, rights, state)
+        self.assertTrue(all(rights.values()))
+        undo = make_move(board, (7, 4), (7, 2), None, rights, state)
+        self.assertEqual(board[7][3], "w_rook")
+        self.assertEqual(state['w_king'], (7, 2))
+        unmake_move(board, undo, rights, state)
+        self.assertEqual(board[7][0], "w_rook")
+        self.assertEqual(state['w_king'], (7, 4))
+
+    def test_en_passant_and_clocks(self):
+        board, _, rights, ep_square, halfmove, fullmove = fen_to_board(
+            "4k3/8/8/3pP3/8/8/8/4K3 w - d6 7 30")
+        state = rules.new_game_state(ep_square, halfmove, fullmove)
+        undo = make_move(board, (3, 4), (2, 3), None, rights, state)
+        self.assertEqual(board[3][3], "")
+        self.assertEqual(state['halfmove'], 0)
+        self.assertIsNone(state['ep_square'])
+        unmake_move(board, undo, rights, state)
+        self.assertEqual(board[3][3], "b_pawn")
+        self.assertEqual((state['ep_square'], state['halfmove'], state['fullmove']), ((2, 3), 7, 30))
+
+    def test_promotion(self):
+        board, _, rights, _, _, _ = fen_to_board("4k3/P7/8/8/8/8/8/4K3 w - - 0 1")
+        state = rules.new_game_state()
+        undo = make_move(board, (1, 0), (0, 0), "n", rights, state)
+        self.assertEqual(board[0][0], "w_knight")
+        unmake_move(board, undo, rights, state)
+        make_move(board, (1, 0), (0, 0), None, rights, state)
+        self.assertEqual(board[0][0], "w_queen")
+
+    def test_invalid_promotion(self):
+        board, _, rights, _, _, _ = fen_to_board("4k3/P7/8/8/8/8/8/4K3 w - - 0 1")
+        state = rules.new_game_state()
+        before = snapshot(board, rights, state)
+        for promotion in ("king", "pawn", "x"):
+            with self.assertRaises(ValueError):
+                make_move(board, (1, 0), (0, 0), promotion, rights, state)
+            self.assertEqual(snapshot(board, rights, state), before)
+
+
+class FenTest(unittest.TestCase):
+
+    def test_round_trip(self):
+        for entry in REFERENCE_POSITIONS.values():
+            board, turn, rights, state = load_fen(entry["fen"])
+            self.assertEqual(rules.board_to_fen(board, turn, rights, state), entry["fen"])
+
+    def test_uci(self):
+        self.assertEqual(rules.parse_uci_move("e7e8q"), ((1, 4), (0, 4), "q"))
+        self.assertEqual(rules.to_uci_move((6, 4), (4, 4)), "e2e4")
+
+
+if __name__ == "__main__":
+    unittest.main()
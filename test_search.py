@@ -0,0 +1,59 @@
+# Tests for the built-in alpha-beta search: it finds mates and material,
+# stays inside its time budget and leaves the caller's position alone.
+# Usage:
+#   python -m pytest test_search.py
+#   python -m unittest test_search
+
+import copy
+import time
+import unittest
+
+import rules
+from rules import fen_to_board, generate_all_legal_moves
+from search import MATE_THRESHOLD, Searcher, evaluate
+
+
+def load(fen):
+    board, turn, rights, ep_square, halfmove, fullmove = fen_to_board(fen)
+    return board, turn, rights, rules.new_game_state(ep_square, halfmove, fullmove)
+
+
+class SearchTest(unittest.TestCase):
+
+    def test_mate_in_one(self):
+        board, turn, rights, state = load("6k1/5ppp/8/8/8/8/8/R5K1 w - - 0 1")
+        result = Searcher().search(board, turn, rights, state, time_limit=5.0, max_depth=3)
+        self.assertEqual(result.move[:2], ((7, 0), (0, 0)))
+        self.assertGreaterEqual(result.score, MATE_THRESHOLD)
+
+    def test_wins_hanging_queen(self):
+        board, turn, rights, state = load("4k3/8/8/3q4/8/8/3R4/4K3 w - - 0 1")
+        result = Searcher().search(board, turn, rights, state, time_limit=5.0, max_depth=2)
+        self.assertEqual(result.move[:2], ((6, 3), (3, 3)))
+
+    def test_no_moves(self):
+        board, turn, rights, state = load("7k/5Q2/6K1/8/8/8/8/8 b - - 0 1")
+        self.assertIsNone(Searcher().search(board, turn, rights, state, time_limit=1.0).move)
+
+    def test_time_budget(self):
+        board, turn, rights, state = load(
+            "r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1")
+        before = (copy.deepcopy(board), dict(rights), dict(state))
+        for budget in (0.001, 0.2):
+            started = time.perf_counter()
+            result = Searcher().search(board, turn, rights, state, time_limit=budget)
+            elapsed = time.perf_counter() - started
+            self.assertLess(elapsed, budget + 0.1)
+            # Even a budget too short for depth 1 gives a legal move
+            self.assertIn(result.move[:2], generate_all_legal_moves(board, turn, rights, state['ep_square']))
+        self.assertEqual((board, rights, state), before)
+
+    def test_evaluate_is_symmetric(self):
+        board, _, _, _ = load(rules.START_FEN)
+        self.assertEqual(evaluate(board), 0)
+        board, _, _, _ = load("4k3/8/8/8/8/8/8/3QK3 w - - 0 1")
+        self.assertGreater(evaluate(board), 800)
+
+
+if __name__ == "__main__":
+    unittest.main()
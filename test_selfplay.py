@@ -0,0 +1,64 @@
+# Tests for self-play: games end for the right reason, illegal player
+# output loses the game, and the process pool writes one record per game.
+# Usage:
+#   python -m pytest test_selfplay.py
+#   python -m unittest test_selfplay
+
+import io
+import json
+import unittest
+
+from selfplay import CallablePlayer, RandomPlayer, Summary, play_game, run
+
+
+def scripted(*moves):
+    """A player that plays the given moves in order."""
+    moves = list(moves)
+    return CallablePlayer(lambda board, turn, rights, state: moves.pop(0))
+
+
+class PlayGameTest(unittest.TestCase):
+
+    def test_checkmate(self):
+        game = play_game(scripted("f2f3", "g2g4"), scripted("e7e5", "d8h4"))
+        self.assertEqual((game.result, game.termination), ("0-1", "checkmate"))
+        self.assertEqual(game.moves, ["f2f3", "e7e5", "g2g4", "d8h4"])
+
+    def test_repetition_and_insufficient_material(self):
+        game = play_game(scripted("g1f3", "f3g1", "g1f3", "f3g1"), scripted("g8f6", "f6g8", "g8f6", "f6g8"))
+        self.assertEqual(game.termination, "threefold repetition")
+        game = play_game(scripted("e1d2"), RandomPlayer(1), fen="4k3/8/8/8/8/8/3r4/4K3 w - - 0 1")
+        self.assertEqual((game.result, game.termination), ("1/2-1/2", "insufficient material"))
+        game = play_game(RandomPlayer(1), RandomPlayer(2), max_plies=6)
+        self.assertEqual((game.result, game.termination, len(game.moves)), ("1/2-1/2", "max plies", 6))
+
+    def test_illegal_moves_lose(self):
+        game = play_game(scripted("e2e5"), RandomPlayer(1))
+        self.assertEqual((game.result, game.termination, game.moves), ("0-1", "illegal move", ["e2e5"]))
+        # Promoting to a king is not a legal move either
+        game = play_game(RandomPlayer(1), scripted(((6, 1), (7, 1), "king")), fen="4k3/8/8/8/8/8/1p6/4K3 b - - 0 1")
+        self.assertEqual((game.result, game.termination, game.moves), ("1-0", "illegal move", ["b2b1king"]))
+        game = play_game(scripted(None), RandomPlayer(1))
+        self.assertEqual((game.result, game.termination), ("0-1", "no move"))
+
+    def test_random_games_finish(self):
+        for seed in range(3):
+            game = play_game(RandomPlayer(seed), RandomPlayer(seed + 10), max_plies=200)
+            self.assertLessEqual(len(game.moves), 200)
+            self.assertIn(game.result, ("1-0", "0-1", "1/2-1/2"))
+
+
+class RunTest(unittest.TestCase):
+
+    def test_run(self):
+        out = io.StringIO()
+        specs = ["random", "random"]
+        summary = run(specs, 4, out, workers=1, max_plies=20, summary=Summary(specs, out=io.StringIO()))
+        records = [json.loads(line) for line in out.getvalue().splitlines()]
+        self.assertEqual(sorted(record["game"] for record in records), [0, 1, 2, 3])
+        self.assertTrue(all(record["plies"] == len(record["moves"]) for record in records))
+        self.assertEqual(summary.stats()["games"], 4)
+
+
+if __name__ == "__main__":
+    unittest.main()
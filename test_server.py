@@ -0,0 +1,100 @@
+# Protocol tests for server.py against a real listener on localhost, with
+# random players in the engine pool so no Stockfish binary is needed.
+# Usage:
+#   python -m pytest test_server.py
+#   python -m unittest test_server
+
+import asyncio
+import json
+import unittest
+
+from server import EnginePool, GameServer
+
+TIMEOUT = 10.0
+
+
+class ServerProtocolTest(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.pool = EnginePool("random", size=2)
+        self.server = GameServer(self.pool, max_games=10)
+        self.listener = await asyncio.start_server(self.server.handle_client, "127.0.0.1", 0)
+        port = self.listener.sockets[0].getsockname()[1]
+        self.reader, self.writer = await asyncio.open_connection("127.0.0.1", port)
+
+    async def asyncTearDown(self):
+        self.writer.close()
+        await self.writer.wait_closed()
+        # Let the handler see the end of the stream and finish
+        while self.server.connections:
+            await asyncio.sleep(0.01)
+        self.listener.close()
+        await self.listener.wait_closed()
+        self.pool.close()
+
+    async def send(self, request):
+        line = request if isinstance(request, str) else json.dumps(request)
+        self.writer.write(line.encode() + b"\n")
+        await self.writer.drain()
+        return json.loads(await asyncio.wait_for(self.reader.readline(), TIMEOUT))
+
+    async def test_game_with_computer_replies(self):
+        game = await self.send({"op": "new", "ai": "b", "id": 7})
+        self.assertEqual(game["id"], 7)
+        self.assertEqual(game["turn"], "w")
+        answer = await self.send({"op": "move", "game": game["game"], "move": "e2e4"})
+        self.assertEqual(answer["move"], "e2e4")
+        self.assertEqual(answer["turn"], "w")
+        self.assertEqual(answer["plies"], 2)
+        state = await self.send({"op": "state", "game": game["game"]})
+        self.assertEqual(state["moves"], ["e2e4", answer["reply"]])
+
+    async def test_replies_are_recorded_moves(self):
+        # White's only legal moves are promotions, so the reply must name a piece
+        game = await self.send({"op": "new", "ai": "w", "fen": "4k3/P7/8/8/8/6pp/4n3/7K w - - 0 1"})
+        self.assertIn(game["reply"], ["a7a8q", "a7a8r", "a7a8b", "a7a8n"])
+        game = await self.send({"op": "new", "ai": "both"})
+        replies = [game["reply"]]
+        while game["result"] == "*" and len(replies) < 40:
+            game = await self.send({"op": "go", "game": game["game"]})
+            replies.append(game["reply"])
+        state = await self.send({"op": "state", "game": game["game"]})
+        self.assertEqual(state["moves"], replies)
+
+    async def test_errors(self):
+        game = await self.send({"op": "new", "ai": "none"})
+        for request, message in [
+            ({"op": "nope"}, "unknown op"),
+            ({"op": ["new"]}, "op must be a string"),
+            ({"op": "new", "fen": 5}, "fen must be a string"),
+            ({"op": "new", "ai": []}, "ai must be a string"),
+            ({"op": "new", "ai": "x"}, "ai must be one of"),
+            ({"op": "new", "fen": "8/8/8/8/8/8/8/8 w - - 0 1"}, "bad FEN"),
+            ({"op": "state", "game": [1]}, "game must be an integer"),
+            ({"op": "state", "game": True}, "game must be an integer"),
+            ({"op": "state", "game": 999}, "no such game"),
+            ({"op": "move", "game": game["game"], "move": 5}, "move must be a string"),
+            ({"op": "move", "game": game["game"], "move": "e2e5"}, "illegal move"),
+            ({"op": "go", "game": game["game"]}, "not the computer's turn"),
+            ("[1]", "request must be a JSON object"),
+            ("{bad", ""),
+        ]:
+            answer = await self.send(request)
+            self.assertIn(message, answer.get("error", ""), request)
+        # The connection still works after every error
+        answer = await self.send({"op": "move", "game": game["game"], "move": "e2e4"})
+        self.assertEqual(answer["plies"], 1)
+
+    async def test_close_and_metrics(self):
+        game = await self.send({"op": "new"})
+        closed = await self.send({"op": "close", "game": game["game"]})
+        self.assertTrue(closed["closed"])
+        metrics = await self.send({"op": "metrics"})
+        self.assertEqual(metrics["games"], 0)
+        self.assertEqual(metrics["games_started"], 1)
+        self.assertEqual(metrics["engines_busy"], 0)
+        self.assertEqual(metrics["queue_depth"], 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
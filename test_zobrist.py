@@ -0,0 +1,78 @@
+# Tests for zobrist.py: hashes of transposed positions and the bounded
+# position cache.
+# Usage:
+#   python -m pytest test_zobrist.py
+#   python -m unittest test_zobrist
+
+import unittest
+
+import rules
+from rules import fen_to_board, make_move
+from zobrist import PositionCache, compute_hash, hash_after_move, lookup_position
+
+
+def play(moves):
+    """Hash, kept up to date move by move, after playing UCI moves from the start."""
+    board, turn, rights, ep_square, _, _ = fen_to_board(rules.START_FEN)
+    state = rules.new_game_state()
+    h = compute_hash(board, turn, rights)
+    for move in moves:
+        start, end, promotion = rules.parse_uci_move(move)
+        undo = make_move(board, start, end, promotion, rights, state)
+        h = hash_after_move(h, undo, rights, state['ep_square'])
+        turn = 'b' if turn == 'w' else 'w'
+    return h, compute_hash(board, turn, rights, state['ep_square'])
+
+
+class HashTest(unittest.TestCase):
+
+    def test_transposition(self):
+        first, _ = play(["g1f3", "g8f6", "b1c3", "b8c6"])
+        second, _ = play(["b1c3", "b8c6", "g1f3", "g8f6"])
+        self.assertEqual(first, second)
+
+    def test_en_passant_and_rights_differ(self):
+        board, turn, rights, ep_square, _, _ = fen_to_board(
+            "rnbqkbnr/pppppppp/8/8/4P3/8/PPPP1PPP/RNBQKBNR b KQkq e3 0 1")
+        self.assertNotEqual(compute_hash(board, turn, rights, ep_square), compute_hash(board, turn, rights))
+        # Kings that walked out and back have lost their castle rights
+        moved, _ = play(["e2e4", "e7e5", "e1e2", "e8e7", "e2e1", "e7e8"])
+        still, _ = play(["e2e4", "e7e5", "g1f3", "g8f6", "f3g1", "f6g8"])
+        self.assertNotEqual(moved, still)
+
+    def test_incremental_matches_full(self):
+        incremental, full = play(["e2e4", "d7d5", "e4d5", "c7c5", "d5c6", "d8d2", "e1d2", "g8f6",
+                                  "c6b7", "e8d7", "b7a8n"])
+        self.assertEqual(incremental, full)
+
+
+class PositionCacheTest(unittest.TestCase):
+
+    def test_lru_eviction(self):
+        cache = PositionCache(max_bytes=2000)
+        for key in range(20):
+            cache.put(key, ([((6, 4), (4, 4))], None))
+            cache.get(0)
+        stats = cache.stats()
+        self.assertLessEqual(stats["bytes"], 2000)
+        self.assertGreater(stats["evictions"], 0)
+        # 0 was used after every put, so it survived while older keys went
+        self.assertIsNotNone(cache.get(0))
+        self.assertIsNone(cache.get(1))
+
+    def test_lookup_position(self):
+        cache = PositionCache()
+        board, turn, rights, ep_square, _, _ = fen_to_board(
+            "rnb1kbnr/pppp1ppp/8/4p3/6Pq/5P2/PPPPP2P/RNBQKBNR w KQkq - 1 3")
+        self.assertEqual(lookup_position(board, turn, rights, cache=cache), ([], 'checkmate'))
+        board, turn, rights, ep_square, _, _ = fen_to_board("7k/5Q2/6K1/8/8/8/8/8 b - - 0 1")
+        self.assertEqual(lookup_position(board, turn, rights, cache=cache), ([], 'stalemate'))
+        board, turn, rights, ep_square, _, _ = fen_to_board(rules.START_FEN)
+        moves, status = lookup_position(board, turn, rights, cache=cache)
+        self.assertEqual((len(moves), status), (20, None))
+        self.assertIs(lookup_position(board, turn, rights, cache=cache)[0], moves)
+        self.assertEqual(cache.stats()["hits"], 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
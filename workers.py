@@ -0,0 +1,87 @@
+# Process pool plumbing shared by the batch tools (analyze.py, selfplay.py):
+# a submit/drain loop that keeps only a few tasks per worker in flight, so
+# memory stays flat however many tasks there are, Ctrl-C handled by the
+# parent alone, and a progress reporter that prints every few seconds.
+
+import signal
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+# Tasks queued per worker; enough to keep every worker busy
+TASKS_PER_WORKER = 4
+REPORT_INTERVAL = 10.0
+
+
+class Reporter:
+    """Running counters, printed every REPORT_INTERVAL seconds and at the end.
+
+    Subclasses count a result in update() and format the report line in
+    describe().
+    """
+
+    def __init__(self, out=sys.stderr):
+        self.out = out
+        self.started = time.perf_counter()
+        self.last_report = self.started
+
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+    def add(self, record):
+        self.update(record)
+        if time.perf_counter() - self.last_report >= REPORT_INTERVAL:
+            self.report()
+
+    def update(self, record):
+        """Count one finished task's result; the base reporter counts nothing."""
+
+    def describe(self):
+        """One line for report(); the base reporter only gives the time so far."""
+        return f"{self.elapsed():.1f}s"
+
+    def report(self):
+        self.last_report = time.perf_counter()
+        print(self.describe(), file=self.out)
+
+
+def _init_worker(initializer, initargs):
+    # Ctrl-C is handled by the parent, which stops handing out tasks
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    if initializer is not None:
+        initializer(*initargs)
+
+
+def run_pool(function, tasks, workers, write, reporter, initializer=None, initargs=()):
+    """Call function(*task) on a process pool for every task in an iterable.
+
+    Results are passed to write() and then reporter.add() in the parent as
+    they finish, in completion order. On KeyboardInterrupt the queued tasks
+    are cancelled, the reporter prints what was done and the interrupt is
+    re-raised.
+    """
+    pending = set()
+
+    def drain(futures):
+        for future in futures:
+            record = future.result()
+            write(record)
+            reporter.add(record)
+
+    with ProcessPoolExecutor(workers, initializer=_init_worker, initargs=(initializer, initargs)) as pool:
+        try:
+            for task in tasks:
+                if len(pending) >= workers * TASKS_PER_WORKER:
+                    finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    drain(finished)
+                pending.add(pool.submit(function, *task))
+            while pending:
+                finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+                drain(finished)
+        except KeyboardInterrupt:
+            for future in pending:
+                future.cancel()
+            reporter.report()
+            raise
+    reporter.report()
+    return reporter
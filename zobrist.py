@@ -0,0 +1,170 @@
+# Zobrist position hashing and a bounded cache of per-position results.
+
+import random
+import sys
+from collections import OrderedDict
+
+from rules import CASTLE_FLAGS, castle_rights, generate_all_legal_moves, is_king_in_check, pack_castle_rights
+
+PIECE_NAMES = [
+    f"{color}_{kind}"
+    for color in ('w', 'b')
+    for kind in ("pawn", "knight", "bishop", "rook", "queen", "king")
+]
+
+# Fixed seed so hashes are stable across runs and processes
+_rng = random.Random(20250613)
+PIECE_KEYS = {name: [_rng.getrandbits(64) for _ in range(64)] for name in PIECE_NAMES}
+SIDE_KEY = _rng.getrandbits(64)
+CASTLE_KEYS = {flag: _rng.getrandbits(64) for flag in CASTLE_FLAGS}
+EP_KEYS = [_rng.getrandbits(64) for _ in range(8)]
+# Combined castle key for every packed rights value
+CASTLE_KEYS_BY_BITS = [0] * 16
+for _bits in range(16):
+    for _i, _flag in enumerate(CASTLE_FLAGS):
+        if _bits >> _i & 1:
+            CASTLE_KEYS_BY_BITS[_bits] ^= CASTLE_KEYS[_flag]
+
+
+def piece_key(piece, pos):
+    return PIECE_KEYS[piece][pos[0] * 8 + pos[1]]
+
+
+def castle_key(rights):
+    """Key for a rights dict or a value from rules.pack_castle_rights."""
+    if not isinstance(rights, int):
+        rights = pack_castle_rights(rights)
+    return CASTLE_KEYS_BY_BITS[rights]
+
+
+def ep_key(ep_square):
+    return EP_KEYS[ep_square[1]] if ep_square else 0
+
+
+def compute_hash(board, turn, rights, ep_square=None):
+    """Hash a position from scratch."""
+    h = 0
+    for r in range(8):
+        for c in range(8):
+            piece = board[r][c]
+            if piece:
+                h ^= PIECE_KEYS[piece][r * 8 + c]
+    if turn == 'b':
+        h ^= SIDE_KEY
+    return h ^ castle_key(rights) ^ ep_key(ep_square)
+
+
+def update_hash(h, piece, start_pos, end_pos, captured, placed, old_rights, new_rights,
+                old_ep=None, new_ep=None, captured_pos=None):
+    """Return h updated for a move that has just been played.
+
+    placed is the piece left on end_pos, which differs from piece after a
+    promotion. captured_pos defaults to end_pos and only differs for en passant.
+    """
+    h ^= piece_key(piece, start_pos) ^ piece_key(placed, end_pos)
+    if captured:
+        h ^= piece_key(captured, captured_pos or end_pos)
+    if piece.endswith("king") and abs(end_pos[1] - start_pos[1]) == 2:
+        row = end_pos[0]
+        rook = piece[0] + "_rook"
+        if end_pos[1] == 6:
+            h ^= piece_key(rook, (row, 7)) ^ piece_key(rook, (row, 5))
+        elif end_pos[1] == 2:
+            h ^= piece_key(rook, (row, 0)) ^ piece_key(rook, (row, 3))
+    h ^= castle_key(old_rights) ^ castle_key(new_rights)
+    h ^= ep_key(old_ep) ^ ep_key(new_ep)
+    return h ^ SIDE_KEY
+
+
+def hash_after_move(h, undo, rights, ep_square):
+    """Return h updated for a move played with rules.make_move."""
+    return update_hash(h, undo.piece, undo.start, undo.end, undo.captured, undo.placed,
+                       undo.rights, rights, undo.ep_square, ep_square, undo.captured_pos)
+
+
+class PositionCache:
+    """LRU cache keyed by Zobrist hash with a rough memory cap in bytes."""
+
+    def __init__(self, max_bytes=16 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.sizes = {}
+        self.bytes_used = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        value = self.entries.get(key)
+        if value is None:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def put(self, key, value):
+        if key in self.entries:
+            self.bytes_used -= self.sizes[key]
+        size = _estimate_size(value)
+        self.entries[key] = value
+        self.entries.move_to_end(key)
+        self.sizes[key] = size
+        self.bytes_used += size
+        while self.bytes_used > self.max_bytes and len(self.entries) > 1:
+            old_key, _ = self.entries.popitem(last=False)
+            self.bytes_used -= self.sizes.pop(old_key)
+            self.evictions += 1
+
+    def clear(self):
+        self.entries.clear()
+        self.sizes.clear()
+        self.bytes_used = 0
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self.entries),
+            "bytes": self.bytes_used,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+
+def _estimate_size(value):
+    """Approximate memory held by a cached (moves, status) entry."""
+    moves, status = value
+    # Key, OrderedDict slot and the entry tuple itself
+    size = 200 + sys.getsizeof(value) + sys.getsizeof(moves)
+    for move in moves:
+        size += sys.getsizeof(move) + sys.getsizeof(move[0]) + sys.getsizeof(move[1])
+    return size
+
+
+position_cache = PositionCache()
+
+
+def lookup_position(board, turn, rights=None, key=None, cache=None, ep_square=None):
+    """Return (legal moves, status) for the side to move, using the cache.
+
+    moves is the list from rules.generate_all_legal_moves and must not be
+    modified. status is 'checkmate', 'stalemate' or None.
+    """
+    if rights is None:
+        rights = castle_rights
+    if cache is None:
+        cache = position_cache
+    if key is None:
+        key = compute_hash(board, turn, rights, ep_square)
+    entry = cache.get(key)
+    if entry is None:
+        moves = generate_all_legal_moves(board, turn, rights, ep_square)
+        status = None
+        if not moves:
+            status = 'checkmate' if is_king_in_check(board, turn) else 'stalemate'
+        entry = (moves, status)
+        cache.put(key, entry)
+    return entry